@@ -1,3 +1,4 @@
+import os
 import uuid
 from os import getenv
 
@@ -7,28 +8,127 @@ from os import getenv
 # client: a@b.c / 1234
 
 from dotenv import load_dotenv
-from flask import Flask, session
-from pyodbc import connect
+from flask import Flask, session, flash, redirect, request
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # fiindcă aplicația este compusă din ~2000 de linii de cod, am împărțit-o în mai multe module
 from routes import auth, customer, employee, products, orders, deliveries
+from utils import db
+from utils.analytics_engine import AnalyticsEngine
+from utils.approximate_analytics import ApproximateAnalytics
+from utils.blob_cache import BlobCache
+from utils.catalog_store import CatalogStore
+from utils.images import ImageVariantWorker
+from utils.loyalty import LoyaltyDirectory
+from utils.order_intake import OrderIntake
+from utils.page_cache import PageCache
+from utils.query_runner import QueryRunner
+from utils.report_jobs import ReportJobs
+from utils.rollups import rebuild_rollups
+from utils.sales import SalesRanking
+from utils.schema import ensure_schema
 
 
 # în aplicația principală doar realizez conexiunea la baza de date și înregistrez modulele de rute
 def create_app():
     load_dotenv()
 
-    # conectare la baza de date
-    conn = connect(getenv("SQL_CONNECTION_STRING"))
-    print("Connected!")
-
     app = Flask(__name__)
     # inițializez cheia secretă pentru a permite trimiterea de mesaje flash
     app.config['SECRET_KEY'] = getenv("SESSION_KEY")
     # generez un ID unic pentru instanța curentă a serverului
     app.config['SERVER_INSTANCE_ID'] = uuid.uuid4().hex
-    app.config['DB_CONN'] = conn
     app.config['MAX_IMAGE_BYTES'] = 5 * 1024 * 1024
+    # cererile mai mari decât o imagine maximă plus restul formularului sunt respinse înainte de a fi citite
+    app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_IMAGE_BYTES'] + 1024 * 1024
+    # cât timp (în secunde) poate browserul refolosi o imagine de produs fără a o revalida
+    app.config['IMAGE_CACHE_MAX_AGE'] = int(getenv("IMAGE_CACHE_MAX_AGE", "300"))
+
+    # conectare la baza de date printr-un pool de conexiuni
+    # app.config['DB_CONN'] devine un proxy către conexiunea cererii curente
+    app.config['SQL_CONNECTION_STRING'] = getenv("SQL_CONNECTION_STRING")
+    app.config['DB_POOL_MIN_SIZE'] = int(getenv("DB_POOL_MIN_SIZE", "1"))
+    app.config['DB_POOL_MAX_SIZE'] = int(getenv("DB_POOL_MAX_SIZE", "10"))
+    app.config['DB_POOL_TIMEOUT'] = float(getenv("DB_POOL_TIMEOUT", "30"))
+    app.config['DB_POOL_HEALTH_CHECK_INTERVAL'] = float(getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))
+    pool = db.init_app(app)
+    print("Connected!")
+    ensure_schema(pool)
+
+    # variantele redimensionate ale imaginilor sunt generate în fundal
+    app.config['IMAGE_VARIANT_WORKER'] = ImageVariantWorker(pool)
+    # imaginile citite din baza de date sunt păstrate într-un cache pe disc, limitat ca dimensiune
+    app.config['IMAGE_BLOB_CACHE'] = BlobCache(
+        getenv("IMAGE_CACHE_DIR") or os.path.join(app.instance_path, 'image-cache'),
+        int(getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    )
+    # catalogul (produse, categorii, subcategorii) este păstrat în memorie pentru paginile magazinului
+    # și reîncărcat periodic din baza de date (intervalul în secunde; 0 dezactivează reîncărcarea)
+    catalog_refresh_interval = float(getenv("CATALOG_REFRESH_INTERVAL", "300"))
+    app.config['CATALOG'] = CatalogStore(
+        pool,
+        refresh_interval=catalog_refresh_interval,
+        stock_reconcile_interval=float(getenv("STOCK_RECONCILE_INTERVAL", "30"))
+    )
+    # contoarele de vânzări pentru produsele cele mai vândute, reîncărcate la același interval
+    app.config['SALES_RANKING'] = SalesRanking(pool, app.config['CATALOG'], refresh_interval=catalog_refresh_interval)
+    # analizele sunt calculate în memorie, din totalurile zilnice încărcate în coloane NumPy (dacă NumPy este instalat)
+    app.config['ANALYTICS_ENGINE'] = AnalyticsEngine(
+        pool,
+        app.config['CATALOG'],
+        refresh_interval=float(getenv("ANALYTICS_REFRESH_INTERVAL", "300")),
+        enabled=getenv("ANALYTICS_ENGINE_ENABLED", "1") == "1"
+    )
+    # modul aproximativ al analizelor (dezactivat implicit): structuri de dimensiune fixă, actualizate la fiecare scriere
+    app.config['APPROXIMATE_ANALYTICS'] = ApproximateAnalytics(
+        pool,
+        app.config['CATALOG'],
+        enabled=getenv("ANALYTICS_APPROXIMATE", "0") == "1",
+        width=int(getenv("ANALYTICS_SKETCH_WIDTH", "512")),
+        capacity=int(getenv("ANALYTICS_SKETCH_CAPACITY", "128"))
+    )
+    # rapoartele lungi (analize, venituri și cheltuieli) rulează în fundal, pe cel mult REPORT_WORKERS fire;
+    # rezultatele sunt refolosite până la următoarea scriere sau cel mult REPORT_RESULT_TTL secunde
+    app.config['REPORT_JOBS'] = ReportJobs(
+        max_workers=int(getenv("REPORT_WORKERS", "2")),
+        result_ttl=float(getenv("REPORT_RESULT_TTL", "600"))
+    )
+    # cât așteaptă pagina de analize raportul înainte de a afișa progresul (secunde)
+    app.config['ANALYTICS_INLINE_WAIT'] = float(getenv("ANALYTICS_INLINE_WAIT", "2"))
+    # preluarea grupată a comenzilor din coș (dezactivată implicit): comenzile sunt scrise în loturi,
+    # câte o tranzacție la cel mult ORDER_INTAKE_MAX_BATCH comenzi sau ORDER_INTAKE_MAX_WAIT_MS milisecunde;
+    # o cerere așteaptă rezultatul cel mult cât așteptarea unei conexiuni din pool plus așteptarea lotului
+    intake_max_wait = float(getenv("ORDER_INTAKE_MAX_WAIT_MS", "20")) / 1000
+    app.config['ORDER_INTAKE'] = OrderIntake(
+        pool,
+        app.config['CATALOG'],
+        app.config['SALES_RANKING'],
+        app.config['ANALYTICS_ENGINE'],
+        app.config['APPROXIMATE_ANALYTICS'],
+        app.config['REPORT_JOBS'],
+        enabled=getenv("ORDER_INTAKE_ENABLED", "0") == "1",
+        max_batch=int(getenv("ORDER_INTAKE_MAX_BATCH", "100")),
+        max_wait=intake_max_wait,
+        timeout=app.config['DB_POOL_TIMEOUT'] + intake_max_wait
+    )
+    # interogările independente ale rapoartelor rulează în paralel, pe cel mult ANALYTICS_MAX_WORKERS conexiuni din pool
+    app.config['QUERY_RUNNER'] = QueryRunner(
+        pool,
+        max_workers=max(1, min(int(getenv("ANALYTICS_MAX_WORKERS", "6")), app.config['DB_POOL_MAX_SIZE']))
+    )
+    # datele cardurilor de fidelitate și adresele de email ale clienților, pentru calculul reducerii de loialitate
+    app.config['LOYALTY'] = LoyaltyDirectory(
+        pool,
+        refresh_interval=float(getenv("LOYALTY_REFRESH_INTERVAL", "300")),
+        miss_ttl=float(getenv("LOYALTY_MISS_TTL", "30"))
+    )
+    # paginile magazinului afișate vizitatorilor neautentificați sunt păstrate în memorie, cu o limită de dimensiune
+    app.config['PAGE_CACHE'] = PageCache(
+        app.config['CATALOG'],
+        max_bytes=int(getenv("PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+        ttl=float(getenv("PAGE_CACHE_TTL", "60")),
+        stock_ttl=float(getenv("PAGE_CACHE_STOCK_TTL", "5"))
+    )
 
     # înainte de a procesa orice cerere, verific dacă sesiunea aparține instanței curente a serverului
     # dacă nu, șterg sesiunea asociată utilizatorului
@@ -42,6 +142,42 @@ def create_app():
             elif not session_server:
                 session['server_instance'] = server_id
 
+    @app.errorhandler(RequestEntityTooLarge)
+    def request_too_large(e):
+        flash("Image file is too large. Max size is 5 MB.")
+        return redirect(request.url)
+
+    # comandă pentru generarea variantelor imaginilor pentru produsele existente
+    # python -m flask --app main.py generate-image-variants
+    @app.cli.command('generate-image-variants')
+    def generate_image_variants():
+        worker = app.config['IMAGE_VARIANT_WORKER']
+        if not worker.enabled:
+            print("Pillow is not installed; image variants cannot be generated.")
+            return
+        with pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT p.ProdusId
+                FROM dbo.Produs p
+                WHERE p.Imagine IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM dbo.ProdusImagineVarianta v WHERE v.ProdusId = p.ProdusId)
+                """
+            )
+            product_ids = [row.ProdusId for row in cursor.fetchall()]
+        for product_id in product_ids:
+            worker.generate(product_id)
+        print(f"Generated image variants for {len(product_ids)} products.")
+
+    # comandă pentru recalcularea totalurilor zilnice din istoricul comenzilor și livrărilor
+    # python -m flask --app main.py rebuild-rollups
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        with pool.transaction() as conn:
+            rebuild_rollups(conn.cursor())
+        print("Daily rollups rebuilt.")
+
     auth.register(app)
     customer.register(app)
     employee.register(app)
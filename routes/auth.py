@@ -8,6 +8,7 @@ from flask import render_template, request, redirect, url_for, session, flash
 
 def register(app):
     conn = app.config['DB_CONN']
+    loyalty = app.config['LOYALTY']
 
     @app.route('/login', methods=['GET', 'POST'])
     def login():
@@ -108,26 +109,32 @@ def register(app):
                 """, (user_id, nume, prenume, telefon, strada, numar, oras, judet))
                 client_id = cursor.fetchone()[0]
 
+                card_start = None
                 if request.form.get('CardFidelitate'):
-                    now = datetime.now()
+                    card_start = datetime.now()
                     cursor.execute("""
                         INSERT INTO dbo.CardFidelitate (ClientId, DataInregistrarii)
                         VALUES (?, ?)
-                    """, (client_id, now))
+                    """, (client_id, card_start))
 
                 conn.commit()
-                session['loggedin'] = True
-                session['id'] = user_id
-                session['username'] = email.strip()
-                session['role'] = 'customer'
-                session['server_instance'] = app.config.get('SERVER_INSTANCE_ID')
-                flash("Registration successful! You're now logged in.")
-                return redirect(url_for('customer_dashboard'))
             except Exception as e:
                 conn.rollback()
                 flash(f"An error occurred: {str(e)}")
                 return redirect(request.url)
 
+            try:
+                loyalty.add_client(client_id, email, card_start)
+            except Exception:
+                app.logger.exception("Could not add customer %s to the loyalty directory", client_id)
+            session['loggedin'] = True
+            session['id'] = user_id
+            session['username'] = email.strip()
+            session['role'] = 'customer'
+            session['server_instance'] = app.config.get('SERVER_INSTANCE_ID')
+            flash("Registration successful! You're now logged in.")
+            return redirect(url_for('customer_dashboard'))
+
         return render_template('register.html')
 
     # la ruta de logout, șterg toate informațiile din sesiune
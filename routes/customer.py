@@ -1,16 +1,66 @@
-import base64
 import hashlib
+import json
 from datetime import datetime
 
-from flask import render_template, request, redirect, url_for, session, flash
+from flask import render_template, request, redirect, url_for, session, flash, jsonify
+from markupsafe import Markup
 
 from utils.auth import allow_customer_or_guest
-from utils.catalog import fetch_categories, fetch_product_names, build_products
+from utils.bulk import insert_order_lines, lines_total
+from utils.catalog import products_from_records
+from utils.images import product_image_url
+from utils.order_intake import OrderTimeout
+from utils.rollups import record_orders
+from utils.sales import record_sales
+from utils.stock import InsufficientStock, reserve_stock, shortage_message
 
 # în acest modul definesc rutele pentru funcționalitățile disponibile clienților și vizitatorilor
 
+# numărul de produse afișate pe o pagină de rezultate ale căutării
+SEARCH_PAGE_SIZE = 24
+# numărul maxim de sugestii întoarse pentru câmpul de căutare
+SUGGESTION_LIMIT = 10
+# numărul de produse afișate în secțiunea cu cele mai vândute produse
+BESTSELLER_COUNT = 12
+
+# cererile făcute din pagină (fetch) cer un răspuns JSON în locul unei redirecționări
+def wants_json():
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+
 def register(app):
     conn = app.config['DB_CONN']
+    catalog = app.config['CATALOG']
+    sales_ranking = app.config['SALES_RANKING']
+    page_cache = app.config['PAGE_CACHE']
+    order_intake = app.config['ORDER_INTAKE']
+    loyalty = app.config['LOYALTY']
+    analytics_engine = app.config['ANALYTICS_ENGINE']
+    approximate_analytics = app.config['APPROXIMATE_ANALYTICS']
+    report_jobs = app.config['REPORT_JOBS']
+
+    # meniul de categorii din antetul paginilor clienților este randat o singură dată pentru fiecare versiune
+    # a arborelui de categorii (catalog.taxonomy_version), împreună cu arborele serializat ca JSON
+    # intrarea din cache este un tuplu (versiune, HTML, JSON, ETag), înlocuit în întregime la o versiune nouă
+    category_nav_cache = {}
+
+    def category_nav_entry():
+        version = catalog.taxonomy_version
+        entry = category_nav_cache.get('nav')
+        if entry is None or entry[0] != version:
+            tree = catalog.category_tree()
+            tree_json = json.dumps(tree, ensure_ascii=False)
+            entry = (
+                version,
+                Markup(render_template('_category_nav.html', categories=tree)),
+                tree_json,
+                hashlib.sha256(tree_json.encode('utf-8')).hexdigest()[:16]
+            )
+            category_nav_cache['nav'] = entry
+        return entry
+
+    def render_category_nav():
+        return category_nav_entry()[1]
 
     # ruta principală redirecționează către magazin
     @app.route("/")
@@ -24,17 +74,18 @@ def register(app):
             flash("Unauthorized: This action requires customer privileges.")
             return redirect(url_for('login'))
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
-        cursor = conn.cursor()
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
 
         return render_template(
             'customer_dashboard.html',
             cart_count=cart_count,
-            categories=categories,
+            category_nav=category_nav,
             is_guest=False
         )
 
+    # paginile de mai jos (magazinul, categoriile, subcategoriile și produsele) sunt servite vizitatorilor din cache
     @app.route('/shop')
+    @page_cache.cached
     def customer_shop():
         # verific dacă utilizatorul are drepturi de client sau vizitator
         if not allow_customer_or_guest():
@@ -44,111 +95,33 @@ def register(app):
         if 'cart' not in session:
             session['cart'] = {}
 
-        # realizez aici o subcerere pentru a obține produsele cele mai bine vândute
-        # subcerere necorelată, deoarece nu am nevoie de alte informații din cererea principală
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT TOP 12
-                p.ProdusId,
-                p.Imagine,
-                p.Stoc,
-                p.Pret,
-                p.Descriere,
-                sales.TotalSold
-            FROM dbo.Produs p
-            JOIN (
-                SELECT
-                    pc.ProdusId,
-                    SUM(pc.ProdusComandaCantitate) AS TotalSold
-                FROM dbo.ProdusComanda pc
-                GROUP BY pc.ProdusId
-            ) sales ON sales.ProdusId = p.ProdusId
-            ORDER BY sales.TotalSold DESC, p.Descriere
-            """
-        )
-        bestsellers = build_products(cursor.fetchall())
+        # produsele cele mai bine vândute vin din contoarele de vânzări (utils.sales), fără a agrega toate comenzile
+        bestsellers = products_from_records(sales_ranking.top(BESTSELLER_COUNT))
 
-        # selectez o categorie aleatorie și preiau până la 12 produse din acea categorie
-        # order by NEWID() este o metodă specifică SQL Server pentru a obține rezultate în ordine aleatorie
-        cursor.execute(
-            """
-            SELECT TOP 1
-                c.CategorieId,
-                c.CategorieNume
-            FROM dbo.Categorie c
-            JOIN dbo.Subcategorie s ON s.CategorieId = c.CategorieId
-            JOIN dbo.Produs p ON p.SubcategorieId = s.SubcategorieId
-            GROUP BY c.CategorieId, c.CategorieNume
-            ORDER BY NEWID()
-            """
-        )
-        category_row = cursor.fetchone()
+        # aleg o categorie și o subcategorie cu produse, aleatoriu, împreună cu primele 12 produse ale fiecăreia
+        # mulțimile de categorii și subcategorii cu produse sunt păstrate de catalogul din memorie
         random_category = None
         category_products = []
-        if category_row:
+        category, featured = catalog.random_category()
+        if category is not None:
             random_category = {
-                "id": category_row.CategorieId,
-                "name": category_row.CategorieNume
+                "id": category.id,
+                "name": category.name
             }
-            cursor.execute(
-                """
-                SELECT TOP 12
-                    p.ProdusId,
-                    p.Imagine,
-                    p.Stoc,
-                    p.Pret,
-                    p.Descriere
-                FROM dbo.Produs p
-                JOIN dbo.Subcategorie s ON s.SubcategorieId = p.SubcategorieId
-                WHERE s.CategorieId = ?
-                ORDER BY p.Descriere
-                """,
-                (category_row.CategorieId,)
-            )
-            category_products = build_products(cursor.fetchall())
+            category_products = products_from_records(featured)
 
-        # analog pentru subcategorie
-        cursor.execute(
-            """
-            SELECT TOP 1
-                s.SubcategorieId,
-                s.SubcategorieNume,
-                c.CategorieNume
-            FROM dbo.Subcategorie s
-            JOIN dbo.Categorie c ON c.CategorieId = s.CategorieId
-            JOIN dbo.Produs p ON p.SubcategorieId = s.SubcategorieId
-            GROUP BY s.SubcategorieId, s.SubcategorieNume, c.CategorieNume
-            ORDER BY NEWID()
-            """
-        )
-        subcategory_row = cursor.fetchone()
         random_subcategory = None
         subcategory_products = []
-        if subcategory_row:
+        subcategory, featured = catalog.random_subcategory()
+        if subcategory is not None:
             random_subcategory = {
-                "id": subcategory_row.SubcategorieId,
-                "name": subcategory_row.SubcategorieNume,
-                "category_name": subcategory_row.CategorieNume
+                "id": subcategory.id,
+                "name": subcategory.name,
+                "category_name": catalog.category(subcategory.category_id).name
             }
-            cursor.execute(
-                """
-            SELECT TOP 12
-                p.ProdusId,
-                p.Imagine,
-                p.Stoc,
-                p.Pret,
-                p.Descriere
-                FROM dbo.Produs p
-                WHERE p.SubcategorieId = ?
-                ORDER BY p.Descriere
-                """,
-                (subcategory_row.SubcategorieId,)
-            )
-            subcategory_products = build_products(cursor.fetchall())
+            subcategory_products = products_from_records(featured)
 
-        product_names = fetch_product_names(cursor)
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
         is_guest = not session.get('loggedin')
 
@@ -160,12 +133,34 @@ def register(app):
             random_subcategory=random_subcategory,
             subcategory_products=subcategory_products,
             cart_count=cart_count,
-            product_names=product_names,
-            categories=categories,
+            category_nav=category_nav,
             is_guest=is_guest
         )
 
-    # aici implementez un search simplu pentru magazin, folosind LIKE în SQL
+    # arborele de categorii ca JSON, pentru cererile făcute din pagină
+    @app.route('/shop/categories')
+    def customer_shop_categories():
+        if not allow_customer_or_guest():
+            return jsonify({"categories": []}), 403
+
+        _, _, tree_json, etag = category_nav_entry()
+        response = app.response_class(tree_json, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    # sugestii pentru câmpul de căutare, cerute de pagină pe măsură ce utilizatorul scrie
+    @app.route('/shop/suggest')
+    def customer_shop_suggest():
+        if not allow_customer_or_guest():
+            return jsonify({"suggestions": []}), 403
+
+        text = request.args.get('q', '').strip()
+        limit = min(request.args.get('limit', SUGGESTION_LIMIT, type=int), SUGGESTION_LIMIT)
+        return jsonify({"suggestions": catalog.suggest(text, limit) if text else []})
+
+    # căutarea din magazin folosește indexul de căutare al catalogului din memorie (utils.search),
+    # cu rezultatele ordonate după relevanță și împărțite pe pagini
     @app.route('/shop/search')
     def customer_shop_search():
         if not allow_customer_or_guest():
@@ -176,38 +171,14 @@ def register(app):
         if not query:
             return redirect(url_for('customer_shop'))
 
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT
-                p.ProdusId,
-                p.Imagine,
-                p.Stoc,
-                p.Pret,
-                p.Descriere
-            FROM dbo.Produs p
-            WHERE p.Descriere LIKE ?
-            ORDER BY p.Descriere
-            """,
-            (f"%{query}%",)
-        )
-        rows = cursor.fetchall()
-
-        products = []
-        for row in rows:
-            image_base64 = None
-            if row.Imagine:
-                image_base64 = base64.b64encode(row.Imagine).decode('utf-8')
-            products.append({
-                "id": row.ProdusId,
-                "image": image_base64,
-                "stoc": int(row.Stoc) if row.Stoc is not None else 0,
-                "pret": float(row.Pret) if row.Pret is not None else 0.0,
-                "descriere": row.Descriere
-            })
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            page = 1
+        records, total = catalog.search(query, offset=(page - 1) * SEARCH_PAGE_SIZE, limit=SEARCH_PAGE_SIZE)
+        products = products_from_records(records)
+        page_count = max(1, -(-total // SEARCH_PAGE_SIZE))
 
-        product_names = fetch_product_names(cursor)
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
 
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
         is_guest = not session.get('loggedin')
@@ -216,63 +187,32 @@ def register(app):
             'customer_search.html',
             products=products,
             cart_count=cart_count,
-            product_names=product_names,
-            categories=categories,
+            category_nav=category_nav,
             query=query,
+            total=total,
+            page=page,
+            page_count=page_count,
             is_guest=is_guest
         )
 
     # rută pentru vizualizarea produselor dintr-o anumită categorie
     # preiau din id categoria, apoi numele categoriei și produsele aferente
     @app.route('/shop/category/<int:category_id>')
+    @page_cache.cached
     def customer_category_view(category_id):
         if not allow_customer_or_guest():
             flash("Unauthorized: This action requires customer privileges.")
             return redirect(url_for('login'))
 
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT CategorieNume FROM dbo.Categorie WHERE CategorieId = ?",
-            (category_id,)
-        )
-        category_row = cursor.fetchone()
-        if not category_row:
+        # categoria și produsele ei sunt preluate din catalogul din memorie
+        category = catalog.category(category_id)
+        if not category:
             flash("Category not found.")
             return redirect(url_for('customer_shop'))
 
-        cursor.execute(
-            """
-            SELECT
-                p.ProdusId,
-                p.Imagine,
-                p.Stoc,
-                p.Pret,
-                p.Descriere
-            FROM dbo.Produs p
-            JOIN dbo.Subcategorie s ON s.SubcategorieId = p.SubcategorieId
-            WHERE s.CategorieId = ?
-            ORDER BY p.Descriere
-            """,
-            (category_id,)
-        )
-        rows = cursor.fetchall()
-
-        products = []
-        for row in rows:
-            image_base64 = None
-            if row.Imagine:
-                image_base64 = base64.b64encode(row.Imagine).decode('utf-8')
-            products.append({
-                "id": row.ProdusId,
-                "image": image_base64,
-                "stoc": int(row.Stoc) if row.Stoc is not None else 0,
-                "pret": float(row.Pret) if row.Pret is not None else 0.0,
-                "descriere": row.Descriere
-            })
+        products = products_from_records(catalog.products_in_category(category_id))
 
-        # 
-        product_names = fetch_product_names(cursor)
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
         is_guest = not session.get('loggedin')
 
@@ -280,65 +220,28 @@ def register(app):
             'customer_category.html',
             products=products,
             cart_count=cart_count,
-            product_names=product_names,
-            categories=categories,
-            heading=category_row.CategorieNume,
+            category_nav=category_nav,
+            heading=category.name,
             is_guest=is_guest
         )
 
     # analog pentru subcategorie
     @app.route('/shop/subcategory/<int:subcategory_id>')
+    @page_cache.cached
     def customer_subcategory_view(subcategory_id):
         if not allow_customer_or_guest():
             flash("Unauthorized: This action requires customer privileges.")
             return redirect(url_for('login'))
 
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT s.SubcategorieNume, s.SubcategorieDescriere, c.CategorieNume
-            FROM dbo.Subcategorie s
-            JOIN dbo.Categorie c ON c.CategorieId = s.CategorieId
-            WHERE s.SubcategorieId = ?
-            """,
-            (subcategory_id,)
-        )
-        sub_row = cursor.fetchone()
-        if not sub_row:
+        subcategory = catalog.subcategory(subcategory_id)
+        category = catalog.category(subcategory.category_id) if subcategory else None
+        if not category:
             flash("Subcategory not found.")
             return redirect(url_for('customer_shop'))
 
-        cursor.execute(
-            """
-            SELECT
-                p.ProdusId,
-                p.Imagine,
-                p.Stoc,
-                p.Pret,
-                p.Descriere
-            FROM dbo.Produs p
-            WHERE p.SubcategorieId = ?
-            ORDER BY p.Descriere
-            """,
-            (subcategory_id,)
-        )
-        rows = cursor.fetchall()
+        products = products_from_records(catalog.products_in_subcategory(subcategory_id))
 
-        products = []
-        for row in rows:
-            image_base64 = None
-            if row.Imagine:
-                image_base64 = base64.b64encode(row.Imagine).decode('utf-8')
-            products.append({
-                "id": row.ProdusId,
-                "image": image_base64,
-                "stoc": int(row.Stoc) if row.Stoc is not None else 0,
-                "pret": float(row.Pret) if row.Pret is not None else 0.0,
-                "descriere": row.Descriere
-            })
-
-        product_names = fetch_product_names(cursor)
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
         is_guest = not session.get('loggedin')
 
@@ -346,48 +249,29 @@ def register(app):
             'customer_category.html',
             products=products,
             cart_count=cart_count,
-            product_names=product_names,
-            categories=categories,
-            heading=f"{sub_row.CategorieNume}/{sub_row.SubcategorieNume}",
-            subcategory_description=sub_row.SubcategorieDescriere.strip() if sub_row.SubcategorieDescriere else None,
+            category_nav=category_nav,
+            heading=f"{category.name}/{subcategory.name}",
+            subcategory_description=subcategory.description,
             is_guest=is_guest
         )
 
     # rută pentru vizualizarea detaliilor pentru un produs
     @app.route('/product/<int:product_id>')
+    @page_cache.cached
     def customer_product_details(product_id):
         if not allow_customer_or_guest():
             flash("Unauthorized: This action requires customer privileges.")
             return redirect(url_for('login'))
         
-        # aici am nevoie doar de un select simplu pentru a prelua datele produsului
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT ProdusId, Imagine, Stoc, Pret, Descriere
-            FROM dbo.Produs
-            WHERE ProdusId = ?
-            """,
-            (product_id,)
-        )
-        row = cursor.fetchone()
-        if not row:
+        # datele produsului sunt preluate din catalogul din memorie
+        record = catalog.product(product_id)
+        if not record:
             flash("Product not found.")
             return redirect(url_for('customer_shop'))
 
-        image_base64 = None
-        if row.Imagine:
-            image_base64 = base64.b64encode(row.Imagine).decode('utf-8')
-
-        product = {
-            "id": row.ProdusId,
-            "image": image_base64,
-            "stoc": int(row.Stoc) if row.Stoc is not None else 0,
-            "pret": float(row.Pret) if row.Pret is not None else 0.0,
-            "descriere": row.Descriere
-        }
+        product = products_from_records([record], image_size='medium')[0]
 
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
         is_guest = not session.get('loggedin')
 
@@ -395,7 +279,7 @@ def register(app):
             'customer_product.html',
             product=product,
             cart_count=cart_count,
-            categories=categories,
+            category_nav=category_nav,
             is_guest=is_guest
         )
     
@@ -412,143 +296,141 @@ def register(app):
         items = []
         total = 0.0
 
-        # id-urile sunt preluate din coș, apoi realizez un select pentru a obține detaliile produselor
-        if cart_ids:
-            placeholders = ",".join("?" for _ in cart_ids)
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
-                SELECT ProdusId, Descriere, Pret, Imagine
-                FROM dbo.Produs
-                WHERE ProdusId IN ({placeholders})
-                """,
-                tuple(cart_ids)
-            )
-            rows = cursor.fetchall()
-            for row in rows:
-                qty = int(cart.get(str(row.ProdusId), 0))
-                if qty <= 0:
-                    continue
-                price = float(row.Pret) if row.Pret is not None else 0.0
-                image_base64 = None
-                if row.Imagine:
-                    image_base64 = base64.b64encode(row.Imagine).decode('utf-8')
-                line_total = price * qty
-                total += line_total
-                items.append({
-                    "id": row.ProdusId,
-                    "descriere": row.Descriere,
-                    "price": price,
-                    "qty": qty,
-                    "line_total": line_total,
-                    "image": image_base64
-                })
+        # id-urile sunt preluate din coș, iar detaliile produselor (inclusiv stocul disponibil) din catalogul din memorie
+        for record in catalog.products(cart_ids):
+            qty = int(cart.get(str(record.id), 0))
+            if qty <= 0:
+                continue
+            line_total = record.pret * qty
+            total += line_total
+            items.append({
+                "id": record.id,
+                "descriere": record.descriere,
+                "price": record.pret,
+                "qty": qty,
+                "line_total": line_total,
+                "available": record.stoc,
+                "image": product_image_url(record.id, record.image_hash, 'thumb')
+            })
 
         cart_count = sum(int(qty) for qty in cart.values())
         is_guest = not session.get('loggedin')
 
         return render_template('customer_cart.html', items=items, total=total, cart_count=cart_count, is_guest=is_guest)
 
+    # rezumatul coșului întors de variantele JSON ale rutelor coșului: numărul de produse, totalul
+    # și linia produsului modificat (prețurile vin din catalogul din memorie, fără interogări)
+    def cart_summary(cart, product_id=None):
+        total = 0.0
+        line = None
+        for record in catalog.products(int(pid) for pid in cart.keys()):
+            qty = int(cart.get(str(record.id), 0))
+            total += record.pret * qty
+            if record.id == product_id:
+                line = {"id": record.id, "qty": qty, "line_total": record.pret * qty, "available": record.stoc}
+        if line is None and product_id is not None:
+            line = {"id": product_id, "qty": 0, "line_total": 0.0, "available": catalog.stock(product_id) or 0}
+        return {
+            "cart_count": sum(int(qty) for qty in cart.values()),
+            "total": total,
+            "item": line
+        }
+
+    # răspunsul rutelor coșului: JSON pentru cererile făcute din pagină (fetch), altfel mesaj flash și redirecționare
+    def cart_response(message, target, status=200, product_id=None):
+        if wants_json():
+            payload = cart_summary(session.get('cart', {}), product_id)
+            payload["ok"] = status == 200
+            payload["message"] = message
+            return jsonify(payload), status
+        if message:
+            flash(message)
+        return redirect(target)
+
     @app.route('/cart/add', methods=['POST'])
     def customer_cart_add():
         if not allow_customer_or_guest():
-            flash("Unauthorized: This action requires customer privileges.")
-            return redirect(url_for('login'))
+            return cart_response("Unauthorized: This action requires customer privileges.", url_for('login'), 403)
 
+        back = request.referrer or url_for('customer_shop')
         product_id_raw = request.form.get('product_id', '').strip()
         if not product_id_raw.isdigit():
-            flash("Invalid product selection.")
-            return redirect(request.referrer or url_for('customer_shop'))
+            return cart_response("Invalid product selection.", back, 400)
 
         quantity_raw = request.form.get('quantity', '1').strip()
         if not quantity_raw.isdigit():
-            flash("Invalid quantity.")
-            return redirect(request.referrer or url_for('customer_shop'))
+            return cart_response("Invalid quantity.", back, 400)
 
         quantity = int(quantity_raw)
         if quantity <= 0:
-            flash("Quantity must be at least 1.")
-            return redirect(request.referrer or url_for('customer_shop'))
+            return cart_response("Quantity must be at least 1.", back, 400)
 
         product_id = int(product_id_raw)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT ProdusId, Stoc, Descriere FROM dbo.Produs WHERE ProdusId = ?",
-            (product_id,)
-        )
 
-        # verific dacă produsul există și dacă are stoc suficient
-        row = cursor.fetchone()
-        if not row:
-            flash("Product not found.")
-            return redirect(request.referrer or url_for('customer_shop'))
+        # verific dacă produsul există și dacă are stoc suficient, în catalogul din memorie
+        # (verificarea definitivă a stocului se face la plasarea comenzii)
+        product = catalog.product(product_id)
+        if product is None:
+            return cart_response("Product not found.", back, 404)
 
-        available_stock = int(row.Stoc) if row.Stoc is not None else 0
+        available_stock = product.stoc
         if available_stock <= 0:
-            flash("This product is currently out of stock.")
-            return redirect(request.referrer or url_for('customer_shop'))
+            return cart_response("This product is currently out of stock.", back, 409, product_id)
 
         # dacă produsul există, adaug cantitatea în coș
         cart = session.get('cart', {})
         current_qty = int(cart.get(str(product_id), 0))
         if current_qty + quantity > available_stock:
-            flash("Not enough stock available for that quantity.")
-            return redirect(request.referrer or url_for('customer_shop'))
+            return cart_response("Not enough stock available for that quantity.", back, 409, product_id)
 
         cart[str(product_id)] = current_qty + quantity
         session['cart'] = cart
         session.modified = True
 
-        flash(f"Added '{row.Descriere}' to your cart.")
-        return redirect(request.referrer or url_for('customer_shop'))
+        return cart_response(f"Added '{product.descriere}' to your cart.", back, product_id=product_id)
 
     # rută pentru golirea coșului de cumpărături
     @app.route('/cart/clear', methods=['POST'])
     def customer_cart_clear():
         if not allow_customer_or_guest():
-            flash("Unauthorized: This action requires customer privileges.")
-            return redirect(url_for('login'))
+            return cart_response("Unauthorized: This action requires customer privileges.", url_for('login'), 403)
 
         session['cart'] = {}
         session.modified = True
-        flash("Cart cleared.")
-        return redirect(url_for('customer_cart'))
+        return cart_response("Cart cleared.", url_for('customer_cart'))
 
     # rută pentru eliminarea unui produs din coșul de cumpărături
     # id-ul produsului este trimis prin formular
     @app.route('/cart/remove', methods=['POST'])
     def customer_cart_remove():
         if not allow_customer_or_guest():
-            flash("Unauthorized: This action requires customer privileges.")
-            return redirect(url_for('login'))
+            return cart_response("Unauthorized: This action requires customer privileges.", url_for('login'), 403)
 
         product_id_raw = request.form.get('product_id', '').strip()
         if not product_id_raw.isdigit():
-            flash("Invalid product selection.")
-            return redirect(url_for('customer_cart'))
+            return cart_response("Invalid product selection.", url_for('customer_cart'), 400)
 
         product_id = int(product_id_raw)
         cart = session.get('cart', {})
+        message = None
         if str(product_id) in cart:
             del cart[str(product_id)]
             session['cart'] = cart
             session.modified = True
-            flash("Item removed from your cart.")
+            message = "Item removed from your cart."
 
-        return redirect(url_for('customer_cart'))
+        return cart_response(message, url_for('customer_cart'), product_id=product_id)
 
     # rută pentru incrementarea sau decrementarea cantității unui produs din coș
     @app.route('/cart/update', methods=['POST'])
     def customer_cart_update():
         if not allow_customer_or_guest():
-            flash("Unauthorized: This action requires customer privileges.")
-            return redirect(url_for('login'))
+            return cart_response("Unauthorized: This action requires customer privileges.", url_for('login'), 403)
 
         product_id_raw = request.form.get('product_id', '').strip()
         action = request.form.get('action', '').strip().lower()
         if not product_id_raw.isdigit() or action not in {'inc', 'dec'}:
-            flash("Invalid cart update request.")
-            return redirect(url_for('customer_cart'))
+            return cart_response("Invalid cart update request.", url_for('customer_cart'), 400)
 
         product_id = int(product_id_raw)
         cart = session.get('cart', {})
@@ -556,7 +438,7 @@ def register(app):
 
         if action == 'dec':
             if current_qty <= 0:
-                return redirect(url_for('customer_cart'))
+                return cart_response(None, url_for('customer_cart'), product_id=product_id)
             new_qty = current_qty - 1
             if new_qty == 0:
                 cart.pop(str(product_id), None)
@@ -564,27 +446,22 @@ def register(app):
                 cart[str(product_id)] = new_qty
             session['cart'] = cart
             session.modified = True
-            return redirect(url_for('customer_cart'))
+            return cart_response(None, url_for('customer_cart'), product_id=product_id)
         
         # pentru incrementare, verific mai întâi stocul disponibil
-        cursor = conn.cursor()
-        cursor.execute("SELECT Stoc FROM dbo.Produs WHERE ProdusId = ?", (product_id,))
-        row = cursor.fetchone()
-        if not row:
-            flash("Product not found.")
-            return redirect(url_for('customer_cart'))
+        available_stock = catalog.stock(product_id)
+        if available_stock is None:
+            return cart_response("Product not found.", url_for('customer_cart'), 404)
 
         # dacă nu există suficient stoc, nu permit incrementarea
-        available_stock = int(row.Stoc) if row.Stoc is not None else 0
         if current_qty + 1 > available_stock:
-            flash("Not enough stock available for that quantity.")
-            return redirect(url_for('customer_cart'))
+            return cart_response("Not enough stock available for that quantity.", url_for('customer_cart'), 409, product_id)
 
         cart[str(product_id)] = current_qty + 1
         session['cart'] = cart
         session.modified = True
 
-        return redirect(url_for('customer_cart'))
+        return cart_response(None, url_for('customer_cart'), product_id=product_id)
 
     # rută pentru confirmarea comenzii din coșul de cumpărături
     @app.route('/cart/confirm', methods=['POST'])
@@ -627,91 +504,76 @@ def register(app):
             return redirect(url_for('customer_cart'))
         client_id = client_row[0]
 
-        # verific disponibilitatea stocului pentru toate produsele din coș
-        placeholders = ",".join("?" for _ in requested)
-        cursor.execute(
-            f"""
-            SELECT ProdusId, Stoc
-            FROM dbo.Produs
-            WHERE ProdusId IN ({placeholders})
-            """,
-            tuple(requested.keys())
-        )
-        product_rows = cursor.fetchall()
-        products_by_id = {row.ProdusId: int(row.Stoc) if row.Stoc is not None else 0 for row in product_rows}
-
-        missing = [pid for pid in requested.keys() if pid not in products_by_id]
-        if missing:
-            flash("Some products no longer exist. Please reselect the items.")
-            return redirect(url_for('customer_cart'))
-
-        for pid, qty in requested.items():
-            stock = products_by_id[pid]
-            if qty > stock:
-                flash("Insufficient stock for one or more items.")
-                return redirect(url_for('customer_cart'))
-
+        facts = None
         try:
-            # verific dacă clientul are card de fidelitate; dacă da, verific dacă clientul este suficient de vechi încât să primească discount
+            # verific dacă clientul are card de fidelitate suficient de vechi încât să primească discount (utils.loyalty)
             # dacă da, este păstrat într-un câmp separat în tabela Comanda, ReducereLoialitate
-            cursor.execute(
-                """
-                SELECT DataInregistrarii
-                FROM dbo.CardFidelitate
-                WHERE ClientId = ?
-                """,
-                (client_id,)
-            )
-            card_row = cursor.fetchone()
-
             now = datetime.now()
-            discount_pct = None
-            if card_row and card_row[0]:
-                years_active = (now - card_row[0]).days / 365.25
-                if years_active > 5:
-                    discount_pct = 7
-                elif years_active > 2:
-                    discount_pct = 3
-
-            # inserez comanda în tabela Comanda
-            cursor.execute(
-                """
-                INSERT INTO dbo.Comanda (ComandaData, ClientId, AngajatId, ReducereLoialitate)
-                OUTPUT INSERTED.ComandaId
-                VALUES (?, ?, ?, ?)
-                """,
-                (now, client_id, None, discount_pct)
-            )
-            comanda_id = cursor.fetchone()[0]
+            discount_pct = loyalty.discount_pct(client_id, now) or None
+
+            if order_intake.enabled:
+                # comanda este scrisă de firul care grupează comenzile în loturi (utils.order_intake),
+                # împreună cu celelalte comenzi sosite în același timp
+                order_intake.place(client_id, requested, now, discount_pct)
+            else:
+                # rezerv stocul tuturor produselor din coș: fiecare stoc este scăzut doar dacă este suficient,
+                # în aceeași instrucțiune, așa că două comenzi simultane nu pot vinde același stoc de două ori
+                prices = reserve_stock(cursor, requested)
 
-            # inserez fiecare produs din comanda în tabela ProdusComanda și actualizez stocul în tabela Produs
-            for pid, qty in requested.items():
+                # inserez comanda în tabela Comanda, împreună cu totalul ei calculat din prețurile de acum
                 cursor.execute(
                     """
-                    INSERT INTO dbo.ProdusComanda (ProdusId, ComandaId, ProdusComandaCantitate)
-                    VALUES (?, ?, ?)
+                    INSERT INTO dbo.Comanda (ComandaData, ClientId, AngajatId, ReducereLoialitate, ComandaTotal)
+                    OUTPUT INSERTED.ComandaId
+                    VALUES (?, ?, ?, ?, ?)
                     """,
-                    (pid, comanda_id, qty)
+                    (now, client_id, None, discount_pct, lines_total(requested, prices))
                 )
-                cursor.execute(
-                    "UPDATE dbo.Produs SET Stoc = ? WHERE ProdusId = ?",
-                    (products_by_id[pid] - qty, pid)
-                )
-            # confirm tranzacția
-            conn.commit()
-
-            # elimin coșul din sesiune
-            session['cart'] = {}
-            session.modified = True
-            if discount_pct:
-                flash(f"Loyalty discount applied: {discount_pct}%")
-            flash("Order placed successfully!")
-            return redirect(url_for('customer_orders'))
+                comanda_id = cursor.fetchone()[0]
+
+                # inserez toate produsele comenzii în tabela ProdusComanda într-un singur lot
+                insert_order_lines(cursor, comanda_id, requested, prices)
+                record_sales(cursor, requested)
+                facts = [(now, client_id, requested, prices)]
+                record_orders(cursor, facts)
+                # confirm tranzacția
+                conn.commit()
+        except InsufficientStock as e:
+            # anulez și scăderile de stoc reușite, apoi actualizez catalogul cu stocurile curente
+            conn.rollback()
+            catalog.refresh_products(cursor, e.shortages.keys())
+            names = {record.id: record.descriere for record in catalog.products(e.shortages.keys())}
+            flash(shortage_message(e.shortages, names))
+            return redirect(url_for('customer_cart'))
+        except OrderTimeout as e:
+            # firul care scrie loturile nu a răspuns la timp; coșul rămâne neschimbat
+            flash(str(e))
+            return redirect(url_for('customer_cart'))
         except Exception as e:
             conn.rollback()
             flash(f"An error occurred: {str(e)}")
             return redirect(url_for('customer_cart'))
 
+        # comanda este deja salvată, așa că o eroare la actualizarea datelor din memorie este doar înregistrată
+        if facts is not None:
+            try:
+                catalog.adjust_stock({pid: -qty for pid, qty in requested.items()})
+                sales_ranking.apply(requested)
+                analytics_engine.apply_orders(facts)
+                approximate_analytics.apply_orders(facts)
+            except Exception:
+                app.logger.exception("Could not update the in-memory state after order %s", comanda_id)
+            finally:
+                report_jobs.invalidate()
+
+        # elimin coșul din sesiune
+        session['cart'] = {}
+        session.modified = True
+        if discount_pct:
+            flash(f"Loyalty discount applied: {discount_pct}%")
+        flash("Order placed successfully!")
+        return redirect(url_for('customer_orders'))
+
     # rută pentru vizualizarea istoricului comenzilor unui client
     @app.route('/customer-orders')
     def customer_orders():
@@ -726,13 +588,10 @@ def register(app):
                 c.ComandaId,
                 c.ComandaData,
                 c.ReducereLoialitate,
-                SUM(pc.ProdusComandaCantitate * p.Pret) AS TotalPret
+                c.ComandaTotal
             FROM dbo.Comanda c
             JOIN dbo.Client cl ON cl.ClientId = c.ClientId
-            LEFT JOIN dbo.ProdusComanda pc ON pc.ComandaId = c.ComandaId
-            LEFT JOIN dbo.Produs p ON p.ProdusId = pc.ProdusId
             WHERE cl.UserId = ?
-            GROUP BY c.ComandaId, c.ComandaData, c.ReducereLoialitate
             ORDER BY c.ComandaId DESC
             """,
             (session.get('id'),)
@@ -743,19 +602,19 @@ def register(app):
                 "id": row.ComandaId,
                 "date": row.ComandaData,
                 "discount_pct": int(row.ReducereLoialitate) if row.ReducereLoialitate is not None else 0,
-                "total_price": float(row.TotalPret) if row.TotalPret is not None else 0.0,
+                "total_price": float(row.ComandaTotal) if row.ComandaTotal is not None else 0.0,
             }
             for row in rows
         ]
 
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
 
         return render_template(
             'customer_order_history.html',
             orders=orders,
             cart_count=cart_count,
-            categories=categories,
+            category_nav=category_nav,
             is_guest=False
         )
 
@@ -791,7 +650,7 @@ def register(app):
             SELECT
                 p.Descriere,
                 pc.ProdusComandaCantitate,
-                p.Pret
+                pc.ProdusComandaPret
             FROM dbo.ProdusComanda pc
             JOIN dbo.Produs p ON p.ProdusId = pc.ProdusId
             WHERE pc.ComandaId = ?
@@ -800,15 +659,16 @@ def register(app):
             (order_id,)
         )
         item_rows = cursor.fetchall()
-        items = [
-            {
+        items = []
+        for row in item_rows:
+            # liniile completate din prețul curent al produsului pot rămâne fără preț (produs fără preț)
+            price = float(row.ProdusComandaPret) if row.ProdusComandaPret is not None else 0.0
+            items.append({
                 "product": row.Descriere,
                 "qty": row.ProdusComandaCantitate,
-                "price": float(row.Pret),
-                "line_total": float(row.Pret) * row.ProdusComandaCantitate,
-            }
-            for row in item_rows
-        ]
+                "price": price,
+                "line_total": price * row.ProdusComandaCantitate,
+            })
 
         order = {
             "id": order_row.ComandaId,
@@ -816,7 +676,7 @@ def register(app):
             "discount_pct": int(order_row.ReducereLoialitate) if order_row.ReducereLoialitate is not None else 0,
         }
 
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
 
         return render_template(
@@ -824,7 +684,7 @@ def register(app):
             order=order,
             items=items,
             cart_count=cart_count,
-            categories=categories,
+            category_nav=category_nav,
             is_guest=False
         )
 
@@ -861,17 +721,9 @@ def register(app):
             flash("Customer record not found.")
             return redirect(url_for('customer_dashboard'))
 
-        # extrag datele pentru cardul de fidelitate, și calculez vechimea cardului și discount-ul aferent
-        cursor.execute(
-            """
-            SELECT DataInregistrarii
-            FROM dbo.CardFidelitate
-            WHERE ClientId = ?
-            """,
-            (client_row.ClientId,)
-        )
-        card_row = cursor.fetchone()
-        card_start = card_row[0] if card_row else None
+        # preiau data cardului de fidelitate din memorie, și calculez vechimea cardului și discount-ul aferent
+        loyalty_entry = loyalty.client(client_row.ClientId)
+        card_start = loyalty_entry.card_start if loyalty_entry else None
 
         cursor.execute(
             """
@@ -896,10 +748,7 @@ def register(app):
         loyalty_discount = 0
         if card_start:
             loyalty_years = round((now - card_start).days / 365.25, 2)
-            if loyalty_years > 5:
-                loyalty_discount = 7
-            elif loyalty_years > 2:
-                loyalty_discount = 3
+            loyalty_discount = loyalty_entry.discount_pct(now)
 
         customer = {
             "name": f"{client_row.ClientNume} {client_row.ClientPrenume}",
@@ -913,14 +762,14 @@ def register(app):
             "loyalty_discount": loyalty_discount,
         }
 
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
 
         return render_template(
             'customer_details.html',
             customer=customer,
             cart_count=cart_count,
-            categories=categories,
+            category_nav=category_nav,
             is_guest=False
         )
     
@@ -986,6 +835,8 @@ def register(app):
                     )
 
                 conn.commit()
+                analytics_engine.invalidate_names()
+                report_jobs.invalidate()
                 flash("Profile updated successfully.")
                 return redirect(url_for('customer_details'))
             except Exception as e:
@@ -1002,13 +853,13 @@ def register(app):
             "judet": row.ClientJudet or "",
         }
 
-        categories = fetch_categories(cursor)
+        category_nav = render_category_nav()
         cart_count = sum(int(qty) for qty in session.get('cart', {}).values())
 
         return render_template(
             'customer_edit_profile.html',
             customer=customer,
             cart_count=cart_count,
-            categories=categories,
+            category_nav=category_nav,
             is_guest=False
         )
@@ -2,10 +2,17 @@ from datetime import datetime
 
 from flask import render_template, request, redirect, url_for, session, flash
 
+from utils.bulk import insert_delivery_lines, apply_stock_deltas, lines_total
+from utils.rollups import delivery_facts, record_deliveries
+
 # modul pentru gestionarea rutelor legate de livrări
 
 def register(app):
     conn = app.config['DB_CONN']
+    catalog = app.config['CATALOG']
+    analytics_engine = app.config['ANALYTICS_ENGINE']
+    approximate_analytics = app.config['APPROXIMATE_ANALYTICS']
+    report_jobs = app.config['REPORT_JOBS']
 
 
     # rută pentru crearea unei noi livrări de produse de la un distribuitor
@@ -91,11 +98,11 @@ def register(app):
                     key = name.strip()
                     requested[key] = requested.get(key, 0) + qty
 
-                # verificăm dacă toate produsele există
+                # verificăm dacă toate produsele există și preluăm prețurile și costurile lor de acum
                 placeholders = ",".join("?" for _ in requested)
                 cursor.execute(
                     f"""
-                    SELECT ProdusId, Descriere
+                    SELECT ProdusId, Descriere, Pret, Cost
                     FROM dbo.Produs
                     WHERE Descriere IN ({placeholders})
                     """,
@@ -103,6 +110,8 @@ def register(app):
                 )
                 product_rows = cursor.fetchall()
                 products_by_name = {row.Descriere: row.ProdusId for row in product_rows}
+                prices = {row.ProdusId: row.Pret for row in product_rows}
+                costs = {row.ProdusId: row.Cost for row in product_rows}
 
                 missing = [name for name in requested.keys() if name not in products_by_name]
                 if missing:
@@ -112,40 +121,42 @@ def register(app):
                 now = datetime.now()
 
 
-                # dacă toate verificările au trecut, inserăm livrarea și actualizăm stocurile
+                # dacă toate verificările au trecut, inserăm livrarea (cu totalurile ei) și actualizăm stocurile
+                received = {products_by_name[name]: qty for name, qty in requested.items()}
                 cursor.execute(
                     """
-                    INSERT INTO dbo.Livrare (DistribuitorId, DataLivrare, AngajatId)
+                    INSERT INTO dbo.Livrare (DistribuitorId, DataLivrare, AngajatId, LivrareTotalPret, LivrareTotalCost)
                     OUTPUT INSERTED.LivrareId
-                    VALUES (?, ?, ?)
+                    VALUES (?, ?, ?, ?, ?)
                     """,
-                    (distributor_id, now, angajat_id)
+                    (distributor_id, now, angajat_id, lines_total(received, prices), lines_total(received, costs))
                 )
                 livrare_id = cursor.fetchone()[0]
 
-                # inserăm fiecare produs în ProdusLivrare și actualizăm stocul în Produs
-                for name, qty in requested.items():
-                    produs_id = products_by_name[name]
-                    cursor.execute(
-                        """
-                        INSERT INTO dbo.ProdusLivrare (ProdusId, LivrareId, ProdusLivrareCantitate)
-                        VALUES (?, ?, ?)
-                        """,
-                        (produs_id, livrare_id, qty)
-                    )
-                    cursor.execute(
-                        "UPDATE dbo.Produs SET Stoc = Stoc + ? WHERE ProdusId = ?",
-                        (qty, produs_id)
-                    )
+                # inserăm toate produsele în ProdusLivrare într-un singur lot și actualizăm stocurile printr-un singur UPDATE
+                insert_delivery_lines(cursor, livrare_id, received, prices, costs)
+                apply_stock_deltas(cursor, received)
+                facts = [(now, distributor_id, received, costs)]
+                record_deliveries(cursor, facts)
 
                 conn.commit()
-                flash("Delivery created successfully!")
-                return redirect(url_for('create_delivery'))
             except Exception as e:
                 conn.rollback()
                 flash(f"An error occurred: {str(e)}")
                 return redirect(request.url)
 
+            # livrarea este deja salvată, așa că o eroare la actualizarea datelor din memorie este doar înregistrată
+            try:
+                catalog.adjust_stock(received)
+                analytics_engine.apply_deliveries(facts)
+                approximate_analytics.apply_deliveries(facts)
+            except Exception:
+                app.logger.exception("Could not update the in-memory state after delivery %s", livrare_id)
+            finally:
+                report_jobs.invalidate()
+            flash("Delivery created successfully!")
+            return redirect(url_for('create_delivery'))
+
         return render_template('create_delivery.html', products=products, distributors=distributors)
     
     # rută pentru afișarea istoricului livrărilor
@@ -155,7 +166,7 @@ def register(app):
             flash("Unauthorized: This action requires employee privileges.")
             return redirect(url_for('login'))
         
-        # preluăm istoricul livrărilor împreună cu totalurile aferente
+        # preluăm istoricul livrărilor împreună cu totalurile aferente, păstrate pe fiecare livrare
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -163,13 +174,10 @@ def register(app):
                 l.LivrareId,
                 d.DistribuitorNume,
                 l.DataLivrare,
-                SUM(pl.ProdusLivrareCantitate * p.Pret) AS TotalPret,
-                SUM(pl.ProdusLivrareCantitate * p.Cost) AS TotalCost
+                l.LivrareTotalPret,
+                l.LivrareTotalCost
             FROM dbo.Livrare l
             JOIN dbo.Distribuitor d ON d.DistribuitorId = l.DistribuitorId
-            LEFT JOIN dbo.ProdusLivrare pl ON pl.LivrareId = l.LivrareId
-            LEFT JOIN dbo.Produs p ON p.ProdusId = pl.ProdusId
-            GROUP BY l.LivrareId, d.DistribuitorNume, l.DataLivrare
             ORDER BY l.LivrareId DESC
             """
         )
@@ -179,8 +187,8 @@ def register(app):
                 "id": row.LivrareId,
                 "distributor": row.DistribuitorNume,
                 "date": row.DataLivrare,
-                "total_price": float(row.TotalPret) if row.TotalPret is not None else 0.0,
-                "total_cost": float(row.TotalCost) if row.TotalCost is not None else 0.0,
+                "total_price": float(row.LivrareTotalPret) if row.LivrareTotalPret is not None else 0.0,
+                "total_cost": float(row.LivrareTotalCost) if row.LivrareTotalCost is not None else 0.0,
             }
             for row in rows
         ]
@@ -273,6 +281,7 @@ def register(app):
                     (name, phone, email, street, number, city, county)
                 )
                 conn.commit()
+                report_jobs.invalidate()
                 flash("Delivery company added successfully!")
                 return redirect(url_for('view_distributors'))
             except Exception as e:
@@ -338,6 +347,8 @@ def register(app):
                     (name, phone, email, street, number, city, county, distributor_id)
                 )
                 conn.commit()
+                analytics_engine.invalidate_names()
+                report_jobs.invalidate()
                 flash("Delivery company updated successfully!")
                 return redirect(url_for('view_distributors'))
             except Exception as e:
@@ -376,8 +387,8 @@ def register(app):
             SELECT
                 p.Descriere,
                 pl.ProdusLivrareCantitate,
-                p.Pret,
-                p.Cost
+                pl.ProdusLivrarePret,
+                pl.ProdusLivrareCost
             FROM dbo.ProdusLivrare pl
             JOIN dbo.Produs p ON p.ProdusId = pl.ProdusId
             WHERE pl.LivrareId = ?
@@ -386,17 +397,19 @@ def register(app):
             (delivery_id,)
         )
         item_rows = cursor.fetchall()
-        items = [
-            {
+        items = []
+        for row in item_rows:
+            # liniile completate din prețul și costul curent al produsului pot rămâne fără aceste valori
+            price = float(row.ProdusLivrarePret) if row.ProdusLivrarePret is not None else 0.0
+            cost = float(row.ProdusLivrareCost) if row.ProdusLivrareCost is not None else 0.0
+            items.append({
                 "product": row.Descriere,
                 "qty": row.ProdusLivrareCantitate,
-                "price": float(row.Pret),
-                "cost": float(row.Cost),
-                "line_price": float(row.Pret) * row.ProdusLivrareCantitate,
-                "line_cost": float(row.Cost) * row.ProdusLivrareCantitate,
-            }
-            for row in item_rows
-        ]
+                "price": price,
+                "cost": cost,
+                "line_price": price * row.ProdusLivrareCantitate,
+                "line_cost": cost * row.ProdusLivrareCantitate,
+            })
 
         delivery = {
             "id": delivery_row.LivrareId,
@@ -413,19 +426,29 @@ def register(app):
             flash("Unauthorized: This action requires employee privileges.")
             return redirect(url_for('login'))
 
+        # citesc datele livrării înainte de ștergere, pentru totalurile zilnice
         cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM dbo.Livrare WHERE LivrareId = ?", (delivery_id,))
-        if not cursor.fetchone():
+        facts = delivery_facts(cursor, delivery_id)
+        if facts is None:
             flash("Delivery not found.")
             return redirect(url_for('delivery_history'))
 
         try:
+            record_deliveries(cursor, [facts], sign=-1)
             cursor.execute("DELETE FROM dbo.ProdusLivrare WHERE LivrareId = ?", (delivery_id,))
             cursor.execute("DELETE FROM dbo.Livrare WHERE LivrareId = ?", (delivery_id,))
             conn.commit()
-            flash("Delivery deleted successfully.")
         except Exception as e:
             conn.rollback()
             flash(f"An error occurred: {str(e)}")
+            return redirect(url_for('delivery_history'))
 
+        try:
+            analytics_engine.apply_deliveries([facts], sign=-1)
+            approximate_analytics.apply_deliveries([facts], sign=-1)
+        except Exception:
+            app.logger.exception("Could not update the in-memory state after deleting delivery %s", delivery_id)
+        finally:
+            report_jobs.invalidate()
+        flash("Delivery deleted successfully.")
         return redirect(url_for('delivery_history'))
@@ -1,11 +1,25 @@
 from datetime import datetime, timedelta
 
-from flask import render_template, request, redirect, url_for, session, flash
+from flask import render_template, request, redirect, url_for, session, flash, jsonify
+
+from utils.rollups import SERIES_BUCKETS, periods, totals_series
+
+# numărul maxim de perioade dintr-un răspuns al /revenues-expenses/series
+SERIES_MAX_PERIODS = 1000
+
+# secțiunile paginii de analize, fiecare cu propriul interval (parametrul <secțiune>_range)
+ANALYTICS_SECTIONS = ("customer", "delivery", "low_turnover", "top_products")
 
 # module pentru rutele angajaților
 
 def register(app):
     conn = app.config['DB_CONN']
+    pool = app.config['DB_POOL']
+    query_runner = app.config['QUERY_RUNNER']
+    analytics_engine = app.config['ANALYTICS_ENGINE']
+    approximate_analytics = app.config['APPROXIMATE_ANALYTICS']
+    report_jobs = app.config['REPORT_JOBS']
+    analytics_inline_wait = app.config['ANALYTICS_INLINE_WAIT']
 
     # rută pentru panoul de control al angajaților
     @app.route('/employee-dashboard')
@@ -81,34 +95,20 @@ def register(app):
                 if end_date < start_date:
                     flash("End date must be on or after start date.")
                 else:
-                    end_date = end_date + timedelta(days=1) - timedelta(seconds=1)
                     cursor = conn.cursor()
-                    # calculăm veniturile și cheltuielile în intervalul specificat
+                    # calculăm veniturile și cheltuielile în intervalul specificat (zile întregi),
+                    # din totalurile zilnice actualizate la fiecare comandă și livrare (utils.rollups)
                     cursor.execute(
                         """
-                        SELECT SUM(pc.ProdusComandaCantitate * p.Pret) AS TotalRevenue
-                        FROM dbo.Comanda c
-                        JOIN dbo.ProdusComanda pc ON pc.ComandaId = c.ComandaId
-                        JOIN dbo.Produs p ON p.ProdusId = pc.ProdusId
-                        WHERE c.ComandaData >= ? AND c.ComandaData <= ?
+                        SELECT SUM(Venituri) AS TotalRevenue, SUM(Cheltuieli) AS TotalExpense
+                        FROM dbo.TotaluriZilnice
+                        WHERE Zi >= ? AND Zi <= ?
                         """,
-                        (start_date, end_date)
+                        (start_date.date(), end_date.date())
                     )
-                    revenue_row = cursor.fetchone()
-                    revenue = float(revenue_row[0]) if revenue_row and revenue_row[0] is not None else 0.0
-
-                    cursor.execute(
-                        """
-                        SELECT SUM(pl.ProdusLivrareCantitate * p.Cost) AS TotalExpense
-                        FROM dbo.Livrare l
-                        JOIN dbo.ProdusLivrare pl ON pl.LivrareId = l.LivrareId
-                        JOIN dbo.Produs p ON p.ProdusId = pl.ProdusId
-                        WHERE l.DataLivrare >= ? AND l.DataLivrare <= ?
-                        """,
-                        (start_date, end_date)
-                    )
-                    expense_row = cursor.fetchone()
-                    expense = float(expense_row[0]) if expense_row and expense_row[0] is not None else 0.0
+                    row = cursor.fetchone()
+                    revenue = float(row.TotalRevenue) if row and row.TotalRevenue is not None else 0.0
+                    expense = float(row.TotalExpense) if row and row.TotalExpense is not None else 0.0
 
                     totals = {
                         "revenue": revenue,
@@ -124,238 +124,424 @@ def register(app):
             'revenues_expenses.html',
             totals=totals,
             start_date=start_date_str,
-            end_date=end_date_str
+            end_date=end_date_str,
+            series_buckets=list(SERIES_BUCKETS)
         )
+
+    # parametrii seriilor de venituri și cheltuieli (start, end, bucket) din cerere
+    # întoarce (parametri, None) sau (None, mesajul de eroare)
+    def revenues_params(args):
+        bucket = args.get('bucket', 'day').strip().lower()
+        if bucket not in SERIES_BUCKETS:
+            return None, f"Bucket must be one of: {', '.join(SERIES_BUCKETS)}."
+        try:
+            start = datetime.strptime(args.get('start', '').strip(), "%Y-%m-%d").date()
+            end = datetime.strptime(args.get('end', '').strip(), "%Y-%m-%d").date()
+        except ValueError:
+            return None, "Start and end must be dates (YYYY-MM-DD)."
+        if end < start:
+            return None, "End date must be on or after start date."
+        if len(periods(start, end, bucket)) > SERIES_MAX_PERIODS:
+            return None, f"At most {SERIES_MAX_PERIODS} periods per request; use a larger bucket."
+        return {"start": start, "end": end, "bucket": bucket}, None
+
+    # seriile de venituri și cheltuieli pe perioade și totalurile lor; rulează și în fundal, deci folosește pool-ul
+    # cheltuielile sunt negative, ca în tabelul paginii
+    # prima și ultima perioadă (săptămână sau lună) cuprind doar zilele din interval
+    def revenues_report(params, job):
+        with pool.transaction() as report_conn:
+            rows = totals_series(report_conn.cursor(), params["start"], params["end"], params["bucket"])
+        series = [
+            {
+                "period": period.isoformat(),
+                "revenue": revenue,
+                "expenses": 0.0 - expense,
+                "net": revenue - expense,
+            }
+            for period, revenue, expense in rows
+        ]
+        revenue = sum(point["revenue"] for point in series)
+        expenses = sum(point["expenses"] for point in series)
+        return {
+            "bucket": params["bucket"],
+            "start": params["start"].isoformat(),
+            "end": params["end"].isoformat(),
+            "series": series,
+            "totals": {"revenue": revenue, "expenses": expenses, "net": revenue + expenses},
+        }
+
+    report_jobs.register('revenues-expenses', revenues_report)
+
+    # seriile de venituri și cheltuieli pentru grafic: /revenues-expenses/series?start=...&end=...&bucket=day|week|month
+    # răspunde cu {"bucket": ..., "series": [{"period", "revenue", "expenses", "net"}], "totals": ...},
+    # cu câte un element pentru fiecare perioadă din interval
+    @app.route('/revenues-expenses/series')
+    def revenues_expenses_series():
+        if not session.get('loggedin') or session.get('role') != 'employee':
+            return jsonify({"series": []}), 403
+
+        params, error = revenues_params(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        return jsonify(revenues_report(params, None))
     
+    range_options = {
+        "month": ("Past Month", timedelta(days=30)),
+        "6months": ("Past 6 Months", timedelta(days=183)),
+        "all": ("All Time", None),
+    }
+
+    # analizele folosesc totalurile zilnice, așa că intervalul cuprinde zile întregi
+    def resolve_range(range_key):
+        key = range_key.strip().lower()
+        if key not in range_options:
+            key = "all"
+        label, delta = range_options[key]
+        if delta is None:
+            return key, label, None, None
+        end_date = datetime.now()
+        start_date = end_date - delta
+        return key, label, start_date.date(), end_date.date()
+
+    # intervalele secțiunilor paginii de analize, din parametrii <secțiune>_range ai cererii
+    # {secțiune: (cheie, etichetă, început, sfârșit)}
+    def analytics_ranges(args):
+        return {section: resolve_range(args.get(f'{section}_range', 'all')) for section in ANALYTICS_SECTIONS}
+
+    def analytics_params(ranges):
+        return {section: (start, end) for section, (_, _, start, end) in ranges.items()}
+
+    # raportul de analize despre clienți, distribuitori și produse, rulat în fundal (utils.report_jobs)
+    # params este {secțiune: (început, sfârșit)}; întoarce variabilele folosite de analytics.html
+    def analytics_report(params, job):
+        customer_start, customer_end = params["customer"]
+        delivery_start, delivery_end = params["delivery"]
+        low_turnover_start, low_turnover_end = params["low_turnover"]
+        top_products_start, top_products_end = params["top_products"]
+
+        if analytics_engine.enabled:
+            # cu NumPy, răspunsurile sunt calculate din totalurile zilnice păstrate în memorie (utils.analytics_engine)
+            prolific_by_orders = analytics_engine.top_client_by_orders(customer_start, customer_end)
+            prolific_by_spend = analytics_engine.top_client_by_spend(customer_start, customer_end)
+            prolific_distributor = analytics_engine.top_distributor_by_deliveries(delivery_start, delivery_end)
+            prolific_distributor_qty = analytics_engine.top_distributor_by_quantity(delivery_start, delivery_end)
+            top_products = analytics_engine.top_products(top_products_start, top_products_end)
+            low_turnover_products = analytics_engine.low_turnover_products(low_turnover_start, low_turnover_end)
+        else:
+            orders_filter = ""
+            orders_params = ()
+            if customer_start is not None and customer_end is not None:
+                orders_filter = "WHERE v.Zi >= ? AND v.Zi <= ?"
+                orders_params = (customer_start, customer_end)
+
+            delivery_filter = ""
+            delivery_params = ()
+            if delivery_start is not None and delivery_end is not None:
+                delivery_filter = "AND v.Zi >= ? AND v.Zi <= ?"
+                delivery_params = (delivery_start, delivery_end)
+
+            top_products_filter = ""
+            top_products_params = ()
+            if top_products_start is not None and top_products_end is not None:
+                top_products_filter = "WHERE v.Zi >= ? AND v.Zi <= ?"
+                top_products_params = (top_products_start, top_products_end)
+
+            turnover_filter = ""
+            turnover_params = ()
+            if low_turnover_start is not None and low_turnover_end is not None:
+                turnover_filter = "WHERE v.Zi >= ? AND v.Zi <= ?"
+                turnover_params = (low_turnover_start, low_turnover_end)
+
+            # interogările citesc totalurile zilnice (utils.rollups), nu liniile comenzilor și livrărilor
+            # sunt independente, așa că rulează în paralel, fiecare pe propria conexiune din pool
+            queries = {
+                # clienții cei mai activi
+                "prolific_by_orders": (
+                    f"""
+                    SELECT TOP 1
+                        cl.ClientId,
+                        cl.ClientNume,
+                        cl.ClientPrenume,
+                        u.Username,
+                        SUM(v.Comenzi) AS OrderCount
+                    FROM dbo.VanzariZilniceClient v
+                    JOIN dbo.Client cl ON cl.ClientId = v.ClientId
+                    JOIN dbo.Utilizatori u ON u.UserId = cl.UserId
+                    {orders_filter}
+                    GROUP BY cl.ClientId, cl.ClientNume, cl.ClientPrenume, u.Username
+                    ORDER BY SUM(v.Comenzi) DESC, cl.ClientId
+                    """,
+                    orders_params
+                ),
+                # clientul care a cheltuit cei mai mulți bani
+                "prolific_by_spend": (
+                    f"""
+                    SELECT TOP 1
+                        cl.ClientId,
+                        cl.ClientNume,
+                        cl.ClientPrenume,
+                        u.Username,
+                        SUM(v.Valoare) AS TotalSpent
+                    FROM dbo.VanzariZilniceClient v
+                    JOIN dbo.Client cl ON cl.ClientId = v.ClientId
+                    JOIN dbo.Utilizatori u ON u.UserId = cl.UserId
+                    {orders_filter}
+                    GROUP BY cl.ClientId, cl.ClientNume, cl.ClientPrenume, u.Username
+                    ORDER BY SUM(v.Valoare) DESC, cl.ClientId
+                    """,
+                    orders_params
+                ),
+                # distribuitorii cei mai activi
+                "prolific_distributor": (
+                    f"""
+                    SELECT TOP 1
+                        d.DistribuitorId,
+                        d.DistribuitorNume,
+                        ISNULL(SUM(v.Livrari), 0) AS DeliveryCount
+                    FROM dbo.Distribuitor d
+                    LEFT JOIN dbo.LivrariZilniceDistribuitor v ON v.DistribuitorId = d.DistribuitorId
+                    {delivery_filter}
+                    GROUP BY d.DistribuitorId, d.DistribuitorNume
+                    ORDER BY ISNULL(SUM(v.Livrari), 0) DESC, d.DistribuitorId
+                    """,
+                    delivery_params
+                ),
+                # distribuitorul care a livrat cele mai multe produse
+                "prolific_distributor_qty": (
+                    f"""
+                    SELECT TOP 1
+                        d.DistribuitorId,
+                        d.DistribuitorNume,
+                        SUM(v.Cantitate) AS QuantityTotal
+                    FROM dbo.Distribuitor d
+                    LEFT JOIN dbo.LivrariZilniceDistribuitor v ON v.DistribuitorId = d.DistribuitorId
+                    {delivery_filter}
+                    GROUP BY d.DistribuitorId, d.DistribuitorNume
+                    ORDER BY SUM(v.Cantitate) DESC, d.DistribuitorId
+                    """,
+                    delivery_params
+                ),
+                # cele mai bine vândute produse după venituri
+                "top_products": (
+                    f"""
+                    SELECT TOP 5
+                        p.ProdusId,
+                        p.Descriere,
+                        SUM(v.Valoare) AS Revenue
+                    FROM dbo.Produs p
+                    JOIN dbo.VanzariZilniceProdus v ON v.ProdusId = p.ProdusId
+                    {top_products_filter}
+                    GROUP BY p.ProdusId, p.Descriere
+                    ORDER BY SUM(v.Valoare) DESC, p.ProdusId
+                    """,
+                    top_products_params
+                ),
+                # produsele cu cele mai puține vânzări
+                "low_turnover_products": (
+                    f"""
+                    SELECT TOP 5
+                        p.ProdusId,
+                        p.Descriere,
+                        COALESCE(sales.TotalSold, 0) AS TotalSold
+                    FROM dbo.Produs p
+                    LEFT JOIN (
+                        SELECT
+                            v.ProdusId,
+                            SUM(v.Cantitate) AS TotalSold
+                        FROM dbo.VanzariZilniceProdus v
+                        {turnover_filter}
+                        GROUP BY v.ProdusId
+                    ) sales ON sales.ProdusId = p.ProdusId
+                    ORDER BY COALESCE(sales.TotalSold, 0) ASC, p.Descriere
+                    """,
+                    turnover_params
+                ),
+            }
+            # în modul aproximativ, aceste răspunsuri sunt estimate mai jos, fără interogări
+            if approximate_analytics.enabled:
+                for name in ("prolific_by_spend", "prolific_distributor_qty", "top_products"):
+                    del queries[name]
+            results = query_runner.fetch_all(queries, progress=job.report_progress)
+
+            rows = results["prolific_by_orders"]
+            prolific_by_orders = None
+            if rows:
+                row = rows[0]
+                prolific_by_orders = {
+                    "name": f"{row.ClientNume} {row.ClientPrenume}",
+                    "email": row.Username,
+                    "count": int(row.OrderCount),
+                }
+
+            rows = results.get("prolific_by_spend")
+            prolific_by_spend = None
+            if rows:
+                row = rows[0]
+                prolific_by_spend = {
+                    "name": f"{row.ClientNume} {row.ClientPrenume}",
+                    "email": row.Username,
+                    "total": float(row.TotalSpent) if row.TotalSpent is not None else 0.0,
+                }
+
+            rows = results["prolific_distributor"]
+            prolific_distributor = None
+            if rows:
+                row = rows[0]
+                prolific_distributor = {
+                    "name": row.DistribuitorNume,
+                    "count": int(row.DeliveryCount),
+                }
+
+            rows = results.get("prolific_distributor_qty")
+            prolific_distributor_qty = None
+            if rows and rows[0].QuantityTotal is not None:
+                row = rows[0]
+                prolific_distributor_qty = {
+                    "name": row.DistribuitorNume,
+                    "quantity": int(row.QuantityTotal),
+                }
+
+            top_products = [
+                {
+                    "id": row.ProdusId,
+                    "name": row.Descriere,
+                    "revenue": float(row.Revenue) if row.Revenue is not None else 0.0,
+                }
+                for row in results.get("top_products", [])
+            ]
+
+            low_turnover_products = [
+                {
+                    "id": row.ProdusId,
+                    "name": row.Descriere,
+                    "total_sold": int(row.TotalSold) if row.TotalSold is not None else 0,
+                }
+                for row in results["low_turnover_products"]
+            ]
+
+        # în modul aproximativ, clientul cu cele mai mari cheltuieli, distribuitorul cu cea mai mare cantitate
+        # și produsele cele mai vândute sunt estimate din structurile actualizate la fiecare scriere
+        # (utils.approximate_analytics), împreună cu numărul de clienți distincți și cu eroarea fiecărei estimări
+        approximate = None
+        if approximate_analytics.enabled:
+            spenders = approximate_analytics.top_clients(customer_start, customer_end)
+            distributors = approximate_analytics.top_distributors(delivery_start, delivery_end)
+            sellers = approximate_analytics.top_products(top_products_start, top_products_end)
+            prolific_by_spend = spenders["items"][0] if spenders["items"] else None
+            prolific_distributor_qty = distributors["items"][0] if distributors["items"] else None
+            top_products = sellers["items"]
+            approximate = {
+                "spend_error": spenders["error"],
+                "quantity_error": distributors["error"],
+                "revenue_error": sellers["error"],
+                "unique_buyers": approximate_analytics.unique_buyers(customer_start, customer_end),
+            }
+
+        return {
+            "prolific_by_orders": prolific_by_orders,
+            "prolific_by_spend": prolific_by_spend,
+            "prolific_distributor": prolific_distributor,
+            "prolific_distributor_qty": prolific_distributor_qty,
+            "top_products": top_products,
+            "low_turnover_products": low_turnover_products,
+            "approximate": approximate,
+        }
+
+    report_jobs.register('analytics', analytics_report)
+
     # rută pentru vizualizarea analizelor de date despre clienți, distribuitori și produse
+    # raportul rulează în fundal; dacă nu este gata în ANALYTICS_INLINE_WAIT secunde, pagina așteaptă rezultatul
+    # întrebând periodic starea lucrării, apoi deschide adresa cu id-ul lucrării (parametrul job)
+    # cu parametrul job este afișat rezultatul acelei lucrări, chiar dacă între timp au apărut scrieri noi;
+    # un calcul nou pornește doar fără acest parametru (la schimbarea intervalelor sau la cererea de reîmprospătare)
     @app.route('/analytics')
     def analytics():
         if not session.get('loggedin') or session.get('role') != 'employee':
             flash("Unauthorized: This action requires employee privileges.")
             return redirect(url_for('login'))
 
-        cursor = conn.cursor()
-        range_options = {
-            "month": ("Past Month", timedelta(days=30)),
-            "6months": ("Past 6 Months", timedelta(days=183)),
-            "all": ("All Time", None),
-        }
+        ranges = analytics_ranges(request.args)
+        range_args = {f'{section}_range': key for section, (key, _, _, _) in ranges.items()}
+        job = report_jobs.get(request.args.get('job', ''))
+        if job is None or job.report != 'analytics':
+            job = report_jobs.submit('analytics', analytics_params(ranges))
+            if not job.wait(analytics_inline_wait):
+                return render_template(
+                    'report_pending.html',
+                    job=job,
+                    title="Analytics",
+                    result_url=url_for('analytics', job=job.id, **range_args)
+                )
+        elif not job.done():
+            return render_template(
+                'report_pending.html',
+                job=job,
+                title="Analytics",
+                result_url=url_for('analytics', job=job.id, **range_args)
+            )
+        if job.status == 'failed':
+            flash(f"An error occurred: {job.error}")
+            return redirect(url_for('employee_dashboard'))
 
-        def resolve_range(range_key):
-            key = range_key.strip().lower()
-            if key not in range_options:
-                key = "all"
-            label, delta = range_options[key]
-            if delta is None:
-                return key, label, None, None
-            end_date = datetime.now()
-            start_date = end_date - delta
-            return key, label, start_date, end_date
-
-        customer_range_key = request.args.get('customer_range', 'all')
-        delivery_range_key = request.args.get('delivery_range', 'all')
-        low_turnover_range_key = request.args.get('low_turnover_range', 'all')
-        top_products_range_key = request.args.get('top_products_range', 'all')
-        current_customer_range, customer_range_label, customer_start, customer_end = resolve_range(customer_range_key)
-        current_delivery_range, delivery_range_label, delivery_start, delivery_end = resolve_range(delivery_range_key)
-        current_low_turnover_range, low_turnover_range_label, low_turnover_start, low_turnover_end = resolve_range(
-            low_turnover_range_key
-        )
-        current_top_products_range, top_products_range_label, top_products_start, top_products_end = resolve_range(
-            top_products_range_key
+        return render_template(
+            'analytics.html',
+            **job.result,
+            current_customer_range=ranges["customer"][0],
+            customer_range_label=ranges["customer"][1],
+            current_delivery_range=ranges["delivery"][0],
+            delivery_range_label=ranges["delivery"][1],
+            current_low_turnover_range=ranges["low_turnover"][0],
+            low_turnover_range_label=ranges["low_turnover"][1],
+            current_top_products_range=ranges["top_products"][0],
+            top_products_range_label=ranges["top_products"][1],
+            refresh_url=url_for('analytics', **range_args)
         )
 
-        orders_filter = ""
-        orders_params = ()
-        if customer_start is not None and customer_end is not None:
-            orders_filter = "WHERE c.ComandaData >= ? AND c.ComandaData <= ?"
-            orders_params = (customer_start, customer_end)
+    def job_status(job):
+        status = {"job_id": job.id, "report": job.report, "status": job.status, "progress": round(job.progress, 3)}
+        if job.status == 'failed':
+            status["error"] = job.error
+        return status
 
-        # analizăm clienții cei mai activi și cei care au cheltuit cei mai mulți bani
-        cursor.execute(
-            f"""
-            SELECT TOP 1
-                cl.ClientId,
-                cl.ClientNume,
-                cl.ClientPrenume,
-                u.Username,
-                COUNT(*) AS OrderCount
-            FROM dbo.Comanda c
-            JOIN dbo.Client cl ON cl.ClientId = c.ClientId
-            JOIN dbo.Utilizatori u ON u.UserId = cl.UserId
-            {orders_filter}
-            GROUP BY cl.ClientId, cl.ClientNume, cl.ClientPrenume, u.Username
-            ORDER BY COUNT(*) DESC, cl.ClientId
-            """,
-            orders_params
-        )
-        row = cursor.fetchone()
-        prolific_by_orders = None
-        if row:
-            prolific_by_orders = {
-                "name": f"{row.ClientNume} {row.ClientPrenume}",
-                "email": row.Username,
-                "count": int(row.OrderCount),
-            }
+    # rapoartele rulate în fundal (utils.report_jobs):
+    #   POST /reports/analytics          (customer_range, delivery_range, low_turnover_range, top_products_range)
+    #   POST /reports/revenues-expenses  (start, end, bucket)
+    # întorc id-ul lucrării; starea și progresul se citesc din /reports/jobs/<id>, iar rezultatul din
+    # /reports/jobs/<id>/result, după ce starea devine "done"
+    @app.route('/reports/<report>', methods=['POST'])
+    def submit_report(report):
+        if not session.get('loggedin') or session.get('role') != 'employee':
+            return jsonify({"error": "Unauthorized."}), 403
 
-        # analizăm clientul care a cheltuit cei mai mulți bani
-        cursor.execute(
-            f"""
-            SELECT TOP 1
-                cl.ClientId,
-                cl.ClientNume,
-                cl.ClientPrenume,
-                u.Username,
-                SUM(pc.ProdusComandaCantitate * p.Pret) AS TotalSpent
-            FROM dbo.Comanda c
-            JOIN dbo.ProdusComanda pc ON pc.ComandaId = c.ComandaId
-            JOIN dbo.Produs p ON p.ProdusId = pc.ProdusId
-            JOIN dbo.Client cl ON cl.ClientId = c.ClientId
-            JOIN dbo.Utilizatori u ON u.UserId = cl.UserId
-            {orders_filter}
-            GROUP BY cl.ClientId, cl.ClientNume, cl.ClientPrenume, u.Username
-            ORDER BY SUM(pc.ProdusComandaCantitate * p.Pret) DESC, cl.ClientId
-            """,
-            orders_params
-        )
-        row = cursor.fetchone()
-        prolific_by_spend = None
-        if row:
-            prolific_by_spend = {
-                "name": f"{row.ClientNume} {row.ClientPrenume}",
-                "email": row.Username,
-                "total": float(row.TotalSpent) if row.TotalSpent is not None else 0.0,
-            }
+        if report == 'analytics':
+            params = analytics_params(analytics_ranges(request.values))
+        elif report == 'revenues-expenses':
+            params, error = revenues_params(request.values)
+            if error:
+                return jsonify({"error": error}), 400
+        else:
+            return jsonify({"error": "Unknown report."}), 404
 
-        # analizăm distribuitorii cei mai activi și cei care au livrat cele mai multe produse
-        cursor.execute(
-            f"""
-            SELECT TOP 1
-                d.DistribuitorId,
-                d.DistribuitorNume,
-                COUNT(l.LivrareId) AS DeliveryCount
-            FROM dbo.Distribuitor d
-            LEFT JOIN dbo.Livrare l ON l.DistribuitorId = d.DistribuitorId
-            {"AND l.DataLivrare >= ? AND l.DataLivrare <= ?" if delivery_start is not None and delivery_end is not None else ""}
-            GROUP BY d.DistribuitorId, d.DistribuitorNume
-            ORDER BY COUNT(l.LivrareId) DESC, d.DistribuitorId
-            """,
-            (delivery_start, delivery_end) if delivery_start is not None and delivery_end is not None else ()
-        )
-        row = cursor.fetchone()
-        prolific_distributor = None
-        if row:
-            prolific_distributor = {
-                "name": row.DistribuitorNume,
-                "count": int(row.DeliveryCount),
-            }
-    
-        # analizăm distribuitorul care a livrat cele mai multe produse
-        cursor.execute(
-            f"""
-            SELECT TOP 1
-                d.DistribuitorId,
-                d.DistribuitorNume,
-                SUM(pl.ProdusLivrareCantitate) AS QuantityTotal
-            FROM dbo.Distribuitor d
-            LEFT JOIN dbo.Livrare l ON l.DistribuitorId = d.DistribuitorId
-            {"AND l.DataLivrare >= ? AND l.DataLivrare <= ?" if delivery_start is not None and delivery_end is not None else ""}
-            LEFT JOIN dbo.ProdusLivrare pl ON pl.LivrareId = l.LivrareId
-            GROUP BY d.DistribuitorId, d.DistribuitorNume
-            ORDER BY SUM(pl.ProdusLivrareCantitate) DESC, d.DistribuitorId
-            """,
-            (delivery_start, delivery_end) if delivery_start is not None and delivery_end is not None else ()
-        )
-        row = cursor.fetchone()
-        prolific_distributor_qty = None
-        if row and row.QuantityTotal is not None:
-            prolific_distributor_qty = {
-                "name": row.DistribuitorNume,
-                "quantity": int(row.QuantityTotal),
-            }
+        return jsonify(job_status(report_jobs.submit(report, params))), 202
 
-        # analizăm cele mai bine vândute produse după venituri
-        top_products_filter = ""
-        top_products_params = ()
-        if top_products_start is not None and top_products_end is not None:
-            top_products_filter = "WHERE c.ComandaData >= ? AND c.ComandaData <= ?"
-            top_products_params = (top_products_start, top_products_end)
-
-        cursor.execute(
-            f"""
-            SELECT TOP 5
-                p.ProdusId,
-                p.Descriere,
-                SUM(pc.ProdusComandaCantitate * p.Pret) AS Revenue
-            FROM dbo.Produs p
-            JOIN dbo.ProdusComanda pc ON pc.ProdusId = p.ProdusId
-            JOIN dbo.Comanda c ON c.ComandaId = pc.ComandaId
-            {top_products_filter}
-            GROUP BY p.ProdusId, p.Descriere
-            ORDER BY SUM(pc.ProdusComandaCantitate * p.Pret) DESC, p.ProdusId
-            """,
-            top_products_params
-        )
-        rows = cursor.fetchall()
-        top_products = [
-            {
-                "id": row.ProdusId,
-                "name": row.Descriere,
-                "revenue": float(row.Revenue) if row.Revenue is not None else 0.0,
-            }
-            for row in rows
-        ]
+    @app.route('/reports/jobs/<job_id>')
+    def report_job_status(job_id):
+        if not session.get('loggedin') or session.get('role') != 'employee':
+            return jsonify({"error": "Unauthorized."}), 403
 
-        turnover_filter = ""
-        turnover_params = ()
-        if low_turnover_start is not None and low_turnover_end is not None:
-            turnover_filter = "WHERE c.ComandaData >= ? AND c.ComandaData <= ?"
-            turnover_params = (low_turnover_start, low_turnover_end)
+        job = report_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown or expired job."}), 404
+        return jsonify(job_status(job))
 
-        cursor.execute(
-            f"""
-            SELECT TOP 5
-                p.ProdusId,
-                p.Descriere,
-                COALESCE(sales.TotalSold, 0) AS TotalSold
-            FROM dbo.Produs p
-            LEFT JOIN (
-                SELECT
-                    pc.ProdusId,
-                    SUM(pc.ProdusComandaCantitate) AS TotalSold
-                FROM dbo.Comanda c
-                JOIN dbo.ProdusComanda pc ON pc.ComandaId = c.ComandaId
-                {turnover_filter}
-                GROUP BY pc.ProdusId
-            ) sales ON sales.ProdusId = p.ProdusId
-            ORDER BY COALESCE(sales.TotalSold, 0) ASC, p.Descriere
-            """,
-            turnover_params
-        )
-        rows = cursor.fetchall()
-        low_turnover_products = [
-            {
-                "id": row.ProdusId,
-                "name": row.Descriere,
-                "total_sold": int(row.TotalSold) if row.TotalSold is not None else 0,
-            }
-            for row in rows
-        ]
+    @app.route('/reports/jobs/<job_id>/result')
+    def report_job_result(job_id):
+        if not session.get('loggedin') or session.get('role') != 'employee':
+            return jsonify({"error": "Unauthorized."}), 403
 
-        return render_template(
-            'analytics.html',
-            prolific_by_orders=prolific_by_orders,
-            prolific_by_spend=prolific_by_spend,
-            prolific_distributor=prolific_distributor,
-            prolific_distributor_qty=prolific_distributor_qty,
-            top_products=top_products,
-            low_turnover_products=low_turnover_products,
-            current_customer_range=current_customer_range,
-            customer_range_label=customer_range_label,
-            current_delivery_range=current_delivery_range,
-            delivery_range_label=delivery_range_label,
-            current_low_turnover_range=current_low_turnover_range,
-            low_turnover_range_label=low_turnover_range_label,
-            current_top_products_range=current_top_products_range,
-            top_products_range_label=top_products_range_label
-        )
+        job = report_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown or expired job."}), 404
+        if job.status != 'done':
+            return jsonify(job_status(job)), 409
+        return jsonify({"job_id": job.id, "report": job.report, "result": job.result})
@@ -2,10 +2,25 @@ from datetime import datetime
 
 from flask import render_template, request, redirect, url_for, session, flash, jsonify
 
+from utils.bulk import insert_order_lines, lines_total
+from utils.rollups import order_facts, record_orders
+from utils.sales import record_sales
+from utils.stock import InsufficientStock, reserve_stock, shortage_message
+
 # rute pentru gestionarea comenzilor
 
+# numărul maxim de adrese de email dintr-o cerere către /loyalty-discounts
+LOYALTY_BATCH_LIMIT = 100
+
+
 def register(app):
     conn = app.config['DB_CONN']
+    catalog = app.config['CATALOG']
+    sales_ranking = app.config['SALES_RANKING']
+    loyalty = app.config['LOYALTY']
+    analytics_engine = app.config['ANALYTICS_ENGINE']
+    approximate_analytics = app.config['APPROXIMATE_ANALYTICS']
+    report_jobs = app.config['REPORT_JOBS']
     
 
     @app.route('/create-order', methods=['GET', 'POST'])
@@ -55,21 +70,12 @@ def register(app):
                 return redirect(request.url)
 
             try:
-                # obținem ID-ul clientului pe baza adresei de email
-                cursor.execute(
-                    """
-                    SELECT c.ClientId
-                    FROM dbo.Client c
-                    JOIN dbo.Utilizatori u ON u.UserId = c.UserId
-                    WHERE u.Username = ?
-                    """,
-                    (email,)
-                )
-                client_row = cursor.fetchone()
-                if not client_row:
+                # obținem clientul (și data cardului de fidelitate) pe baza adresei de email
+                client = loyalty.client_for_email(email)
+                if client is None:
                     flash("No customer found for this email address.")
                     return redirect(request.url)
-                client_id = client_row[0]
+                client_id = client.client_id
 
                 cursor.execute(
                     "SELECT AngajatId FROM dbo.Angajat WHERE UserId = ?",
@@ -112,61 +118,57 @@ def register(app):
 
                 now = datetime.now()
 
-                # extragem data înregistrării cardului de fidelitate pentru a calcula reducerea
-                cursor.execute(
-                    """
-                    SELECT DataInregistrarii
-                    FROM dbo.CardFidelitate
-                    WHERE ClientId = ?
-                    """,
-                    (client_id,)
-                )
-                card_row = cursor.fetchone()
-                discount_pct = None
-                if card_row and card_row[0]:
-                    days_active = (now - card_row[0]).days
-                    years_active = days_active / 365.25
-                    if years_active > 5:
-                        discount_pct = 7
-                    elif years_active > 2:
-                        discount_pct = 3
-
-
-                # creăm comanda și actualizăm stocurile produselor
+                # reducerea de loialitate, după vechimea cardului de fidelitate
+                discount_pct = client.discount_pct(now) or None
+
+                # rezervăm stocul (scădere condiționată, sigură la comenzi simultane), apoi creăm comanda
+                sold = {products_by_name[name][0]: qty for name, qty in requested.items()}
+                prices = reserve_stock(cursor, sold)
+
+                # totalul comenzii este calculat din prețurile de acum și păstrat împreună cu comanda
                 cursor.execute(
                     """
-                    INSERT INTO dbo.Comanda (ComandaData, ClientId, AngajatId, ReducereLoialitate)
+                    INSERT INTO dbo.Comanda (ComandaData, ClientId, AngajatId, ReducereLoialitate, ComandaTotal)
                     OUTPUT INSERTED.ComandaId
-                    VALUES (?, ?, ?, ?)
+                    VALUES (?, ?, ?, ?, ?)
                     """,
-                    (now, client_id, angajat_id, discount_pct)
+                    (now, client_id, angajat_id, discount_pct, lines_total(sold, prices))
                 )
                 comanda_id = cursor.fetchone()[0]
 
-                for name, qty in requested.items():
-                    produs_id, stock = products_by_name[name]
-                    cursor.execute(
-                        """
-                        INSERT INTO dbo.ProdusComanda (ProdusId, ComandaId, ProdusComandaCantitate)
-                        VALUES (?, ?, ?)
-                        """,
-                        (produs_id, comanda_id, qty)
-                    )
-                    cursor.execute(
-                        "UPDATE dbo.Produs SET Stoc = ? WHERE ProdusId = ?",
-                        (stock - qty, produs_id)
-                    )
-
+                # liniile comenzii sunt inserate într-un singur lot
+                insert_order_lines(cursor, comanda_id, sold, prices)
+                record_sales(cursor, sold)
+                facts = [(now, client_id, sold, prices)]
+                record_orders(cursor, facts)
                 conn.commit()
-                if discount_pct:
-                    flash(f"Loyalty discount applied: {discount_pct}%")
-                flash("Order created successfully!")
-                return redirect(url_for('create_order'))
+            except InsufficientStock as e:
+                # stocul s-a schimbat între verificare și rezervare (de exemplu, o comandă plasată simultan)
+                conn.rollback()
+                catalog.refresh_products(cursor, e.shortages.keys())
+                names = {product_id: name for name, (product_id, _) in products_by_name.items()}
+                flash(shortage_message(e.shortages, names))
+                return redirect(request.url)
             except Exception as e:
                 conn.rollback()
                 flash(f"An error occurred: {str(e)}")
                 return redirect(request.url)
 
+            # comanda este deja salvată, așa că o eroare la actualizarea datelor din memorie este doar înregistrată
+            try:
+                catalog.adjust_stock({pid: -qty for pid, qty in sold.items()})
+                sales_ranking.apply(sold)
+                analytics_engine.apply_orders(facts)
+                approximate_analytics.apply_orders(facts)
+            except Exception:
+                app.logger.exception("Could not update the in-memory state after order %s", comanda_id)
+            finally:
+                report_jobs.invalidate()
+            if discount_pct:
+                flash(f"Loyalty discount applied: {discount_pct}%")
+            flash("Order created successfully!")
+            return redirect(url_for('create_order'))
+
         return render_template('create_order.html', products=products)
 
 
@@ -178,7 +180,7 @@ def register(app):
             return redirect(url_for('login'))
 
         cursor = conn.cursor()
-        # extragem lista comenzilor cu detalii sumare, și calculăm prețul total al fiecărei comenzi
+        # extragem lista comenzilor cu detalii sumare; prețul total este păstrat pe fiecare comandă
         cursor.execute(
             """
             SELECT
@@ -186,13 +188,10 @@ def register(app):
                 cl.ClientNume,
                 cl.ClientPrenume,
                 u.Username,
-                SUM(pc.ProdusComandaCantitate * p.Pret) AS TotalPret
+                c.ComandaTotal
             FROM dbo.Comanda c
             JOIN dbo.Client cl ON cl.ClientId = c.ClientId
             JOIN dbo.Utilizatori u ON u.UserId = cl.UserId
-            LEFT JOIN dbo.ProdusComanda pc ON pc.ComandaId = c.ComandaId
-            LEFT JOIN dbo.Produs p ON p.ProdusId = pc.ProdusId
-            GROUP BY c.ComandaId, cl.ClientNume, cl.ClientPrenume, u.Username
             ORDER BY c.ComandaId DESC
             """
         )
@@ -202,7 +201,7 @@ def register(app):
                 "id": row.ComandaId,
                 "customer_name": f"{row.ClientNume} {row.ClientPrenume}",
                 "email": row.Username,
-                "total_price": float(row.TotalPret) if row.TotalPret is not None else 0.0,
+                "total_price": float(row.ComandaTotal) if row.ComandaTotal is not None else 0.0,
             }
             for row in rows
         ]
@@ -244,7 +243,7 @@ def register(app):
             SELECT
                 p.Descriere,
                 pc.ProdusComandaCantitate,
-                p.Pret
+                pc.ProdusComandaPret
             FROM dbo.ProdusComanda pc
             JOIN dbo.Produs p ON p.ProdusId = pc.ProdusId
             WHERE pc.ComandaId = ?
@@ -253,15 +252,16 @@ def register(app):
             (order_id,)
         )
         item_rows = cursor.fetchall()
-        items = [
-            {
+        items = []
+        for row in item_rows:
+            # liniile completate din prețul curent al produsului pot rămâne fără preț (produs fără preț)
+            price = float(row.ProdusComandaPret) if row.ProdusComandaPret is not None else 0.0
+            items.append({
                 "product": row.Descriere,
                 "qty": row.ProdusComandaCantitate,
-                "price": float(row.Pret),
-                "line_total": float(row.Pret) * row.ProdusComandaCantitate,
-            }
-            for row in item_rows
-        ]
+                "price": price,
+                "line_total": price * row.ProdusComandaCantitate,
+            })
 
         order = {
             "id": order_row.ComandaId,
@@ -281,21 +281,35 @@ def register(app):
             flash("Unauthorized: This action requires employee privileges.")
             return redirect(url_for('login'))
 
+        # citesc datele comenzii (data, clientul și liniile) înainte de ștergere
         cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM dbo.Comanda WHERE ComandaId = ?", (order_id,))
-        if not cursor.fetchone():
+        facts = order_facts(cursor, order_id)
+        if facts is None:
             flash("Order not found.")
             return redirect(url_for('order_history'))
 
         try:
+            # scad din contoarele de vânzări și din totalurile zilnice produsele comenzii șterse
+            removed = {pid: -qty for pid, qty in facts[2].items()}
+            record_sales(cursor, removed)
+            record_orders(cursor, [facts], sign=-1)
             cursor.execute("DELETE FROM dbo.ProdusComanda WHERE ComandaId = ?", (order_id,))
             cursor.execute("DELETE FROM dbo.Comanda WHERE ComandaId = ?", (order_id,))
             conn.commit()
-            flash("Order deleted successfully.")
         except Exception as e:
             conn.rollback()
             flash(f"An error occurred: {str(e)}")
+            return redirect(url_for('order_history'))
 
+        try:
+            sales_ranking.apply(removed)
+            analytics_engine.apply_orders([facts], sign=-1)
+            approximate_analytics.apply_orders([facts], sign=-1)
+        except Exception:
+            app.logger.exception("Could not update the in-memory state after deleting order %s", order_id)
+        finally:
+            report_jobs.invalidate()
+        flash("Order deleted successfully.")
         return redirect(url_for('order_history'))
 
     # ruta pentru calcularea reducerii de loialitate pe baza adresei de email
@@ -307,31 +321,19 @@ def register(app):
         email = request.args.get('email', '').strip()
         if not email:
             return jsonify({"discount_pct": 0})
-        
-        # extragem data înregistrării cardului de fidelitate pentru a calcula reducerea
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT cf.DataInregistrarii
-            FROM dbo.CardFidelitate cf
-            JOIN dbo.Client c ON c.ClientId = cf.ClientId
-            JOIN dbo.Utilizatori u ON u.UserId = c.UserId
-            WHERE u.Username = ?
-            """,
-            (email,)
-        )
-        row = cursor.fetchone()
 
-        if not row or not row[0]:
-            return jsonify({"discount_pct": 0})
+        # reducerea este calculată din datele cardurilor păstrate în memorie
+        return jsonify({"discount_pct": loyalty.discounts_for_emails([email])[email]})
+
+    # ruta pentru reducerile mai multor clienți deodată: /loyalty-discounts?email=a@b.c&email=d@e.f
+    # răspunde cu {"discounts": {email: reducere}}, cu 0 pentru adresele fără card sau necunoscute
+    @app.route('/loyalty-discounts')
+    def loyalty_discounts():
+        if not session.get('loggedin') or session.get('role') != 'employee':
+            return jsonify({"discounts": {}}), 403
 
-        now = datetime.now()
-        years_active = (now - row[0]).days / 365.25
-        if years_active > 5:
-            discount_pct = 7
-        elif years_active > 2:
-            discount_pct = 3
-        else:
-            discount_pct = 0
+        emails = list(dict.fromkeys(email.strip() for email in request.args.getlist('email') if email.strip()))
+        if len(emails) > LOYALTY_BATCH_LIMIT:
+            return jsonify({"error": f"At most {LOYALTY_BATCH_LIMIT} emails per request."}), 400
 
-        return jsonify({"discount_pct": discount_pct})
+        return jsonify({"discounts": loyalty.discounts_for_emails(emails)})
@@ -1,16 +1,24 @@
-import base64
 import hashlib
+import io
 import re
 from datetime import datetime
 
-from flask import render_template, request, redirect, url_for, session, flash
-from pyodbc import Binary
+from flask import render_template, request, redirect, url_for, session, flash, abort, send_file
+
+from utils.uploads import UploadTooLarge, receive_upload, write_product_image
+from utils.images import IMMUTABLE_MAX_AGE, guess_image_mimetype, image_version, product_image_url, variant_candidates
 
 # rute pentru gestionarea produselor, categoriilor, subcategoriilor și clienților
 
 def register(app):
     conn = app.config['DB_CONN']
     max_image_bytes = app.config['MAX_IMAGE_BYTES']
+    image_max_age = app.config['IMAGE_CACHE_MAX_AGE']
+    image_variants = app.config['IMAGE_VARIANT_WORKER']
+    blob_cache = app.config['IMAGE_BLOB_CACHE']
+    catalog = app.config['CATALOG']
+    report_jobs = app.config['REPORT_JOBS']
+    loyalty = app.config['LOYALTY']
 
 
     # ruta pentru crearea unui produs nou
@@ -39,6 +47,7 @@ def register(app):
         ]
 
         if request.method == 'POST':
+            upload = None
             try:
                 # preluăm datele din formular
                 sub_id = request.form.get('SubcategorieId') or None
@@ -48,28 +57,50 @@ def register(app):
                 descriere = request.form.get('Descriere')
 
                 file = request.files.get('Imagine')
-                image_binary = None
                 if file and file.filename != '':
-                    image_binary = file.read()
-                    if len(image_binary) > max_image_bytes:
+                    try:
+                        upload = receive_upload(file, max_image_bytes)
+                    except UploadTooLarge:
                         flash("Image file is too large. Max size is 5 MB.")
                         return redirect(request.url)
+                    if upload.size == 0:
+                        upload.close()
+                        upload = None
 
-                # inserăm produsul în baza de date
+                # inserăm produsul în baza de date, apoi imaginea
                 query = """
                     INSERT INTO dbo.Produs (SubcategorieId, Imagine, Stoc, Pret, Descriere, Cost)
-                    VALUES (?, ?, ?, ?, ?, ?)
+                    OUTPUT INSERTED.ProdusId
+                    VALUES (?, NULL, ?, ?, ?, ?)
                 """
-                cursor.execute(query, (sub_id, Binary(image_binary) if image_binary else None, stoc, pret, descriere, cost))
+                cursor.execute(query, (sub_id, stoc, pret, descriere, cost))
+                product_id = cursor.fetchone()[0]
+                if upload:
+                    write_product_image(cursor, product_id, upload)
                 conn.commit()
-                flash("Product created successfully!")
-                return redirect(url_for('view_products'))
-
             except Exception as e:
                 conn.rollback()
+                if upload:
+                    upload.close()
                 flash(f"An error occurred: {str(e)}")
                 return redirect(request.url)
 
+            # produsul este deja salvat, așa că o eroare la actualizarea catalogului sau a cache-ului este doar înregistrată
+            try:
+                catalog.refresh_products(cursor, [product_id])
+                # imaginea este pusă direct în cache-ul de pe disc, iar variantele redimensionate sunt generate în fundal
+                if upload:
+                    blob_cache.put_file(upload.sha256.hex(), upload.size, upload.file)
+                    image_variants.submit(product_id)
+            except Exception:
+                app.logger.exception("Could not update the in-memory state after creating product %s", product_id)
+            finally:
+                report_jobs.invalidate()
+                if upload:
+                    upload.close()
+            flash("Product created successfully!")
+            return redirect(url_for('view_products'))
+
         return render_template('create_product.html', categories=categories, subcategories=subcategories)
     
     # ruta pentru crearea unei subcategorii noi
@@ -108,13 +139,18 @@ def register(app):
                 """
                 cursor.execute(query, (nume_subcategorie, categorie_id, descriere_subcategorie))
                 conn.commit()
-                flash("Subcategory created successfully!")
-                return redirect(url_for('create_subcategory'))
             except Exception as e:
                 conn.rollback()
                 flash(f"An error occurred: {str(e)}")
                 return redirect(request.url)
 
+            try:
+                catalog.refresh_taxonomy(cursor)
+            except Exception:
+                app.logger.exception("Could not refresh the catalog taxonomy after creating a subcategory")
+            flash("Subcategory created successfully!")
+            return redirect(url_for('create_subcategory'))
+
         return render_template('create_subcategory.html', categories=categories)
 
     # ruta pentru crearea unei categorii noi
@@ -142,13 +178,18 @@ def register(app):
                 """
                 cursor.execute(query, (nume_categorie,))
                 conn.commit()
-                flash("Category created successfully!")
-                return redirect(url_for('create_category'))
             except Exception as e:
                 conn.rollback()
                 flash(f"An error occurred: {str(e)}")
                 return redirect(request.url)
 
+            try:
+                catalog.refresh_taxonomy(cursor)
+            except Exception:
+                app.logger.exception("Could not refresh the catalog taxonomy after creating a category")
+            flash("Category created successfully!")
+            return redirect(url_for('create_category'))
+
         return render_template('create_category.html')
 
     # ruta pentru crearea unui client nou
@@ -220,21 +261,27 @@ def register(app):
                 client_id = cursor.fetchone()[0]
 
                 # dacă s-a bifat opțiunea, creăm și cardul de fidelitate
+                card_start = None
                 if request.form.get('CardFidelitate'):
-                    now = datetime.now()
+                    card_start = datetime.now()
                     cursor.execute("""
                         INSERT INTO dbo.CardFidelitate (ClientId, DataInregistrarii)
                         VALUES (?, ?)
-                    """, (client_id, now))
+                    """, (client_id, card_start))
 
                 conn.commit()
-                flash("Customer added successfully!")
-                return redirect(url_for('create_customer'))
             except Exception as e:
                 conn.rollback()
                 flash(f"An error occurred: {str(e)}")
                 return redirect(request.url)
 
+            try:
+                loyalty.add_client(client_id, email, card_start)
+            except Exception:
+                app.logger.exception("Could not add customer %s to the loyalty directory", client_id)
+            flash("Customer added successfully!")
+            return redirect(url_for('create_customer'))
+
         return render_template('create_customer.html')
 
     # ruta pentru vizualizarea produselor
@@ -253,7 +300,7 @@ def register(app):
             SELECT
                 p.ProdusId,
                 p.SubcategorieId,
-                p.Imagine,
+                p.ImagineHash,
                 p.Stoc,
                 p.Pret,
                 p.Cost,
@@ -269,16 +316,12 @@ def register(app):
 
         products = []
         for row in rows:
-            image_base64 = None
-            if row.Imagine:
-                image_base64 = base64.b64encode(row.Imagine).decode('utf-8')
-
             products.append({
                 "id": row.ProdusId,
                 "sub_id": row.SubcategorieId,
                 "subcategory": row.SubcategorieNume.strip() if row.SubcategorieNume else None,
                 "category": row.CategorieNume.strip() if row.CategorieNume else None,
-                "image": image_base64,
+                "image": product_image_url(row.ProdusId, row.ImagineHash, 'thumb'),
                 "stoc": row.Stoc,
                 "pret": row.Pret,
                 "cost": row.Cost,
@@ -354,7 +397,11 @@ def register(app):
         cursor = conn.cursor()
         cursor.execute(
             """
-            SELECT ProdusId, Imagine, Stoc, Descriere
+            SELECT
+                ProdusId,
+                ImagineHash,
+                Stoc,
+                Descriere
             FROM dbo.Produs
             WHERE ProdusId = ?
             """,
@@ -388,54 +435,171 @@ def register(app):
 
             file = request.files.get('Imagine')
             update_image = False
-            image_binary = None
+            upload = None
 
             if file and file.filename:
                 update_image = True
-                image_binary = file.read()
-                if len(image_binary) > max_image_bytes:
+                try:
+                    upload = receive_upload(file, max_image_bytes)
+                except UploadTooLarge:
                     flash("Image file is too large. Max size is 5 MB.")
                     return redirect(request.url)
+                if upload.size == 0:
+                    upload.close()
+                    upload = None
             elif request.form.get('RemoveImage') == '1':
                 update_image = True
-                image_binary = None
 
             try:
+                cursor.execute(
+                    """
+                    UPDATE dbo.Produs
+                    SET Stoc = ?, Descriere = ?
+                    WHERE ProdusId = ?
+                    """,
+                    (stoc, descriere, product_id)
+                )
                 if update_image:
-                    cursor.execute(
-                        """
-                        UPDATE dbo.Produs
-                        SET Imagine = ?, Stoc = ?, Descriere = ?
-                        WHERE ProdusId = ?
-                        """,
-                        (Binary(image_binary) if image_binary else None, stoc, descriere, product_id)
-                    )
-                else:
-                    cursor.execute(
-                        """
-                        UPDATE dbo.Produs
-                        SET Stoc = ?, Descriere = ?
-                        WHERE ProdusId = ?
-                        """,
-                        (stoc, descriere, product_id)
-                    )
+                    if upload:
+                        write_product_image(cursor, product_id, upload)
+                    else:
+                        cursor.execute("UPDATE dbo.Produs SET Imagine = NULL WHERE ProdusId = ?", (product_id,))
+                    # variantele vechi nu mai corespund imaginii noi
+                    cursor.execute("DELETE FROM dbo.ProdusImagineVarianta WHERE ProdusId = ?", (product_id,))
                 conn.commit()
-                flash("Product updated successfully.")
-                return redirect(url_for('view_products'))
             except Exception as e:
                 conn.rollback()
+                if upload:
+                    upload.close()
                 flash(f"An error occurred: {str(e)}")
                 return redirect(request.url)
 
-        image_base64 = None
-        if row.Imagine:
-            image_base64 = base64.b64encode(row.Imagine).decode('utf-8')
+            # produsul este deja salvat, așa că o eroare la actualizarea catalogului sau a cache-ului este doar înregistrată
+            try:
+                catalog.refresh_products(cursor, [product_id])
+                if upload:
+                    blob_cache.put_file(upload.sha256.hex(), upload.size, upload.file)
+                    image_variants.submit(product_id)
+            except Exception:
+                app.logger.exception("Could not update the in-memory state after updating product %s", product_id)
+            finally:
+                report_jobs.invalidate()
+                if upload:
+                    upload.close()
+            flash("Product updated successfully.")
+            return redirect(url_for('view_products'))
 
         product = {
             "id": row.ProdusId,
-            "image": image_base64,
+            "image": product_image_url(row.ProdusId, row.ImagineHash, 'thumb'),
             "stoc": int(row.Stoc) if row.Stoc is not None else 0,
             "descriere": row.Descriere or ""
         }
 
         return render_template('edit_product.html', product=product)
+
+    # trimit o imagine împreună cu header-ele de cache
+    # ETag-ul este hash-ul SHA-256 al imaginii; dacă browserul are deja imaginea, răspund cu 304
+    # imaginea este citită din baza de date o singură dată pentru fiecare versiune, apoi este servită din cache-ul
+    # de pe disc; send_file trimite fișierul direct (sendfile / X-Sendfile) și tratează cererile parțiale (Range)
+    # dacă URL-ul conține versiunea curentă a imaginii originale (parametrul v), răspunsul poate fi păstrat oricât de browser
+    def serve_image(meta_query, image_query, params, vary_accept=False, cacheable_forever=True):
+        cursor = conn.cursor()
+        cursor.execute(meta_query, params)
+        row = cursor.fetchone()
+        if not row:
+            return None
+
+        etag = bytes(row.ImagineHash).hex()
+        content_type = row.ContentType
+        max_age = image_max_age
+        version = request.args.get('v')
+        if cacheable_forever and version and version == image_version(row.SourceHash):
+            max_age = IMMUTABLE_MAX_AGE
+
+        def with_cache_headers(response):
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            if max_age == IMMUTABLE_MAX_AGE:
+                response.cache_control.immutable = True
+            if vary_accept:
+                response.vary.add('Accept')
+            return response
+
+        if request.if_none_match.contains(etag):
+            return with_cache_headers(app.response_class(status=304))
+
+        path = blob_cache.get(etag)
+        if path is not None:
+            try:
+                if content_type is None:
+                    with open(path, 'rb') as image_file:
+                        content_type = guess_image_mimetype(image_file.read(16))
+                return with_cache_headers(send_file(path, mimetype=content_type, conditional=True, etag=etag, max_age=max_age))
+            except FileNotFoundError:
+                blob_cache.discard(etag)
+
+        cursor.execute(image_query, params)
+        row = cursor.fetchone()
+        if not row:
+            return None
+        # imaginea poate fi înlocuită între cele două interogări, așa că folosesc hash-ul citit împreună cu ea
+        data = bytes(row.Imagine)
+        etag = bytes(row.ImagineHash).hex()
+        content_type = content_type or guess_image_mimetype(data)
+
+        path = blob_cache.put(etag, data)
+        source = path if path is not None else io.BytesIO(data)
+        return with_cache_headers(send_file(source, mimetype=content_type, conditional=True, etag=etag, max_age=max_age))
+
+    # ruta care servește imaginea unui produs
+    # cu parametrul size (thumb, medium) se servește varianta redimensionată, în format WebP dacă browserul îl acceptă;
+    # dacă varianta nu a fost încă generată, se servește imaginea originală
+    @app.route('/product-image/<int:product_id>')
+    def product_image(product_id):
+        accept_webp = 'image/webp' in request.headers.get('Accept', '')
+        candidates = variant_candidates(request.args.get('size', ''), accept_webp)
+        if candidates:
+            placeholders = ",".join("?" for _ in candidates)
+            params = (product_id, *candidates, candidates[0])
+            response = serve_image(
+                f"""
+                SELECT TOP 1 v.ImagineHash, v.ContentType, p.ImagineHash AS SourceHash
+                FROM dbo.ProdusImagineVarianta v
+                JOIN dbo.Produs p ON p.ProdusId = v.ProdusId
+                WHERE v.ProdusId = ? AND v.Varianta IN ({placeholders})
+                ORDER BY CASE WHEN v.Varianta = ? THEN 0 ELSE 1 END
+                """,
+                f"""
+                SELECT TOP 1 Imagine, ImagineHash
+                FROM dbo.ProdusImagineVarianta
+                WHERE ProdusId = ? AND Varianta IN ({placeholders})
+                ORDER BY CASE WHEN Varianta = ? THEN 0 ELSE 1 END
+                """,
+                params,
+                vary_accept=True
+            )
+            if response is not None:
+                return response
+
+        # dacă se cerea o variantă care nu există încă, imaginea originală nu este păstrată permanent de browser,
+        # pentru ca varianta să fie preluată după ce este generată
+        response = serve_image(
+            """
+            SELECT ImagineHash, NULL AS ContentType, ImagineHash AS SourceHash
+            FROM dbo.Produs
+            WHERE ProdusId = ? AND Imagine IS NOT NULL
+            """,
+            """
+            SELECT Imagine, ImagineHash
+            FROM dbo.Produs
+            WHERE ProdusId = ? AND Imagine IS NOT NULL
+            """,
+            (product_id,),
+            vary_accept=bool(candidates),
+            cacheable_forever=not candidates
+        )
+        if response is None:
+            abort(404)
+        return response
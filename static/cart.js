@@ -0,0 +1,111 @@
+// formularele coșului sunt trimise prin fetch, fără reîncărcarea paginii
+// serverul răspunde cu JSON (numărul de produse din coș, totalul și linia modificată)
+// fără JavaScript, formularele funcționează în continuare ca înainte (redirecționare)
+(function () {
+  const CART_ACTIONS = ['/cart/add', '/cart/update', '/cart/remove'];
+
+  function formatMoney(value) {
+    return value.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 }) + ' lei';
+  }
+
+  function showMessage(text) {
+    if (!text) {
+      return;
+    }
+    let list = document.querySelector('.flashes');
+    if (!list) {
+      list = document.createElement('ul');
+      list.className = 'flashes';
+      const page = document.querySelector('.page');
+      page.insertBefore(list, page.firstChild);
+    }
+    const item = document.createElement('li');
+    const span = document.createElement('span');
+    span.textContent = text;
+    const closeButton = document.createElement('button');
+    closeButton.className = 'flash-close';
+    closeButton.type = 'button';
+    closeButton.setAttribute('aria-label', 'Close');
+    closeButton.innerHTML = '&times;';
+    closeButton.addEventListener('click', () => {
+      item.classList.add('hide');
+      setTimeout(() => item.remove(), 200);
+    });
+    item.addEventListener('animationend', (event) => {
+      if (event.animationName === 'flashFade') {
+        item.remove();
+      }
+    });
+    item.append(span, closeButton);
+    list.appendChild(item);
+  }
+
+  function updateCart(data) {
+    document.querySelectorAll('[data-cart-count]').forEach((el) => {
+      el.textContent = data.cart_count;
+    });
+    document.querySelectorAll('[data-cart-total]').forEach((el) => {
+      el.textContent = formatMoney(data.total);
+    });
+
+    const item = data.item;
+    if (!item) {
+      return;
+    }
+    const row = document.querySelector(`[data-cart-item="${item.id}"]`);
+    if (!row) {
+      return;
+    }
+    if (item.qty <= 0) {
+      row.remove();
+      // coșul a rămas gol: reîncarc pagina pentru a afișa mesajul corespunzător
+      if (!document.querySelector('[data-cart-item]')) {
+        window.location.reload();
+      }
+      return;
+    }
+    row.querySelector('[data-cart-qty]').textContent = item.qty;
+    row.querySelector('[data-cart-line-total]').textContent = formatMoney(item.line_total);
+
+    const availability = row.querySelector('[data-cart-available]');
+    if (availability) {
+      const short = item.qty > item.available;
+      availability.classList.toggle('short', short);
+      if (item.available <= 0) {
+        availability.textContent = 'Out of stock';
+      } else if (short) {
+        availability.textContent = `Only ${item.available} in stock`;
+      } else {
+        availability.textContent = `${item.available} in stock`;
+      }
+    }
+  }
+
+  document.addEventListener('submit', async (event) => {
+    const form = event.target;
+    const action = new URL(form.action, window.location.href).pathname;
+    if (!CART_ACTIONS.includes(action)) {
+      return;
+    }
+    event.preventDefault();
+
+    const buttons = [...form.querySelectorAll('button')].filter((button) => !button.disabled);
+    buttons.forEach((button) => { button.disabled = true; });
+    try {
+      const response = await fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: { Accept: 'application/json' },
+      });
+      const data = await response.json();
+      updateCart(data);
+      showMessage(data.message);
+    } catch (error) {
+      // dacă cererea eșuează, trimit formularul normal
+      form.submit();
+      return;
+    } finally {
+      buttons.forEach((button) => { button.disabled = false; });
+    }
+  });
+})();
@@ -0,0 +1,307 @@
+import threading
+import time
+
+# NumPy este opțional: fără el, pagina de analize interoghează totalurile zilnice din baza de date
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# motorul de analize din memorie
+# totalurile zilnice (utils.rollups) pe produs, client și distribuitor sunt încărcate o singură dată în coloane NumPy
+# (zi, id, două valori numerice), iar comenzile și livrările noi sau șterse sunt adăugate ca rânduri cu semn
+# fiecare întrebare din pagina de analize devine o mască pe coloana zilei, o însumare pe id (bincount)
+# și o selecție a primelor valori (argpartition), așa că orice interval se calculează fără interogări
+# numele clienților și ale distribuitorilor sunt păstrate separat și reîncărcate după modificări
+# scrierile aplicate cât timp o reîncărcare este în curs sunt păstrate și aplicate din nou coloanelor noi, pentru ca
+# o scriere confirmată după citire să nu se piardă; una confirmată chiar înainte de citire, dar aplicată după începerea
+# reîncărcării, poate fi astfel numărată de două ori până la următoarea reîncărcare
+
+
+class _Columns:
+    # rândurile noi sunt adunate într-o listă și adăugate la coloane abia la următoarea citire
+    def __init__(self, rows=()):
+        self._lock = threading.Lock()
+        self._pending = list(rows)
+        self._arrays = (
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+        )
+
+    def append(self, rows):
+        with self._lock:
+            self._pending.extend(rows)
+
+    # (zi, id, prima valoare, a doua valoare); zilele sunt numerele ordinale ale datelor (date.toordinal)
+    def arrays(self):
+        with self._lock:
+            if self._pending:
+                day, key, first, second = zip(*self._pending)
+                self._pending = []
+                added = (
+                    np.fromiter(day, dtype=np.int32, count=len(day)),
+                    np.fromiter(key, dtype=np.int64, count=len(key)),
+                    np.fromiter(first, dtype=np.float64, count=len(first)),
+                    np.fromiter(second, dtype=np.float64, count=len(second)),
+                )
+                self._arrays = tuple(np.concatenate((old, new)) for old, new in zip(self._arrays, added))
+            return self._arrays
+
+    # însumează cele două valori pe id, pentru zilele din interval (None înseamnă fără limită)
+    # întoarce id-urile prezente în interval (crescător) și sumele lor
+    def totals(self, start, end):
+        day, key, first, second = self.arrays()
+        mask = np.ones(len(day), dtype=bool)
+        if start is not None:
+            mask &= day >= start.toordinal()
+        if end is not None:
+            mask &= day <= end.toordinal()
+        ids, index = np.unique(key[mask], return_inverse=True)
+        return (
+            ids,
+            np.bincount(index, weights=first[mask], minlength=len(ids)),
+            np.bincount(index, weights=second[mask], minlength=len(ids)),
+        )
+
+
+# pozițiile celor mai mari limit valori, descrescător, apoi după id crescător (ids este sortat crescător)
+def _top(values, ids, limit):
+    if len(values) > limit:
+        threshold = values[np.argpartition(values, len(values) - limit)[len(values) - limit]]
+        candidates = np.flatnonzero(values >= threshold)
+    else:
+        candidates = np.arange(len(values))
+    order = np.lexsort((ids[candidates], -values[candidates]))
+    return candidates[order[:limit]]
+
+
+class AnalyticsEngine:
+    def __init__(self, pool, catalog, refresh_interval=300.0, enabled=True):
+        self.pool = pool
+        self.catalog = catalog
+        self.refresh_interval = refresh_interval
+        self.enabled = enabled and np is not None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._products = None
+        self._clients = None
+        self._distributors = None
+        # scrierile aplicate în timpul reîncărcării în curs: [(coloană, rânduri)], sau None
+        self._replay = None
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._client_names = None
+        self._distributor_names = None
+
+    def reload(self):
+        with self._reload_lock:
+            with self._lock:
+                self._replay = []
+            try:
+                self._reload()
+            finally:
+                with self._lock:
+                    self._replay = None
+
+    def _reload(self):
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT Zi, ProdusId, Cantitate, Valoare FROM dbo.VanzariZilniceProdus")
+            products = _Columns(
+                (row.Zi.toordinal(), row.ProdusId, row.Cantitate, float(row.Valoare)) for row in cursor.fetchall()
+            )
+            cursor.execute("SELECT Zi, ClientId, Comenzi, Valoare FROM dbo.VanzariZilniceClient")
+            clients = _Columns(
+                (row.Zi.toordinal(), row.ClientId, row.Comenzi, float(row.Valoare)) for row in cursor.fetchall()
+            )
+            cursor.execute("SELECT Zi, DistribuitorId, Livrari, Cantitate FROM dbo.LivrariZilniceDistribuitor")
+            distributors = _Columns(
+                (row.Zi.toordinal(), row.DistribuitorId, row.Livrari, row.Cantitate) for row in cursor.fetchall()
+            )
+        with self._lock:
+            columns = {'products': products, 'clients': clients, 'distributors': distributors}
+            for name, rows in self._replay:
+                columns[name].append(rows)
+            self._products = products
+            self._clients = clients
+            self._distributors = distributors
+            self._loaded_at = time.monotonic()
+            self._client_names = None
+            self._distributor_names = None
+
+    def _background_reload(self):
+        try:
+            self.reload()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_loaded(self):
+        if self._products is None:
+            self.reload()
+            return
+        if self.refresh_interval and time.monotonic() - self._loaded_at > self.refresh_interval:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._background_reload, daemon=True).start()
+
+    # numele sunt citite la prima folosire după încărcare, după invalidate_names
+    # sau când lipsește un id (un client sau distribuitor adăugat după citire)
+    def _names(self, client_id=None, distributor_id=None):
+        client_names, distributor_names = self._client_names, self._distributor_names
+        if (
+            client_names is None or distributor_names is None
+            or (client_id is not None and client_id not in client_names)
+            or (distributor_id is not None and distributor_id not in distributor_names)
+        ):
+            with self.pool.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT cl.ClientId, cl.ClientNume, cl.ClientPrenume, u.Username
+                    FROM dbo.Client cl
+                    JOIN dbo.Utilizatori u ON u.UserId = cl.UserId
+                    """
+                )
+                client_names = {
+                    row.ClientId: (f"{row.ClientNume} {row.ClientPrenume}", row.Username) for row in cursor.fetchall()
+                }
+                cursor.execute("SELECT DistribuitorId, DistribuitorNume FROM dbo.Distribuitor")
+                distributor_names = {row.DistribuitorId: row.DistribuitorNume for row in cursor.fetchall()}
+            self._client_names, self._distributor_names = client_names, distributor_names
+        return client_names, distributor_names
+
+    # se apelează după modificarea numelui unui client sau al unui distribuitor
+    def invalidate_names(self):
+        self._client_names = None
+        self._distributor_names = None
+
+    # se apelează după commit, cu aceleași date transmise lui rollups.record_orders / record_deliveries
+    def apply_orders(self, orders, sign=1):
+        if not self.enabled:
+            return
+        product_rows, client_rows = [], []
+        for placed_at, client_id, quantities, prices in orders:
+            day = placed_at.date().toordinal()
+            total = 0.0
+            for product_id, qty in quantities.items():
+                value = qty * float(prices.get(product_id) or 0)
+                product_rows.append((day, product_id, sign * qty, sign * value))
+                total += value
+            client_rows.append((day, client_id, sign, sign * total))
+        self._append(('products', product_rows), ('clients', client_rows))
+
+    def apply_deliveries(self, deliveries, sign=1):
+        if not self.enabled:
+            return
+        self._append(('distributors', [
+            (delivered_at.date().toordinal(), distributor_id, sign, sign * sum(quantities.values()))
+            for delivered_at, distributor_id, quantities, _ in deliveries
+        ]))
+
+    # adaugă rândurile la coloanele curente și, dacă o reîncărcare este în curs, le păstrează pentru coloanele noi
+    # înainte de prima încărcare nu există coloane, iar rândurile sunt păstrate doar dacă încărcarea a început
+    def _append(self, *changes):
+        with self._lock:
+            columns = {'products': self._products, 'clients': self._clients, 'distributors': self._distributors}
+            for name, rows in changes:
+                if columns[name] is not None:
+                    columns[name].append(rows)
+                if self._replay is not None:
+                    self._replay.append((name, rows))
+
+    # întrebările din pagina de analize; start și end sunt date (inclusiv), sau None pentru tot istoricul
+    # rezultatele au aceeași formă ca în routes.employee.analytics
+
+    def _top_client(self, start, end, by_value):
+        self._ensure_loaded()
+        ids, orders, values = self._clients.totals(start, end)
+        present = orders > 0
+        if not present.any():
+            return None
+        # la egalitate, argmax alege primul id (cel mai mic), ca ORDER BY ..., ClientId
+        index = int(np.argmax(np.where(present, values if by_value else orders, -np.inf)))
+        client_id = int(ids[index])
+        name, email = self._names(client_id=client_id)[0].get(client_id, ("", ""))
+        if by_value:
+            return {"name": name, "email": email, "total": float(values[index])}
+        return {"name": name, "email": email, "count": int(orders[index])}
+
+    def top_client_by_orders(self, start, end):
+        return self._top_client(start, end, by_value=False)
+
+    def top_client_by_spend(self, start, end):
+        return self._top_client(start, end, by_value=True)
+
+    # ca în interogarea SQL, sunt luați în considerare și distribuitorii fără livrări în interval
+    def top_distributor_by_deliveries(self, start, end):
+        self._ensure_loaded()
+        ids, deliveries, _ = self._distributors.totals(start, end)
+        distributor_names = self._names()[1]
+        all_ids = np.union1d(ids, np.fromiter(distributor_names, dtype=np.int64, count=len(distributor_names)))
+        if not len(all_ids):
+            return None
+        counts = np.zeros(len(all_ids))
+        counts[np.searchsorted(all_ids, ids)] = deliveries
+        distributor_id = int(all_ids[np.argmax(counts)])
+        name = self._names(distributor_id=distributor_id)[1].get(distributor_id, "")
+        return {"name": name, "count": int(counts.max())}
+
+    def top_distributor_by_quantity(self, start, end):
+        self._ensure_loaded()
+        ids, _, quantities = self._distributors.totals(start, end)
+        if not len(ids):
+            return None
+        index = int(np.argmax(quantities))
+        distributor_id = int(ids[index])
+        name = self._names(distributor_id=distributor_id)[1].get(distributor_id, "")
+        return {"name": name, "quantity": int(quantities[index])}
+
+    # produsele care nu mai există în catalog sunt ignorate, ca în interogarea SQL (JOIN cu dbo.Produs)
+    def top_products(self, start, end, limit=5):
+        self._ensure_loaded()
+        ids, _, revenue = self._products.totals(start, end)
+        products = self.catalog.snapshot().products
+        known = np.fromiter((int(product_id) in products for product_id in ids), dtype=bool, count=len(ids))
+        ids, revenue = ids[known], revenue[known]
+        return [
+            {"id": int(ids[i]), "name": products[int(ids[i])].descriere, "revenue": float(revenue[i])}
+            for i in _top(revenue, ids, limit)
+        ]
+
+    # toate produsele din catalog, cu 0 pentru cele fără vânzări în interval, crescător după cantitate, apoi după nume
+    def low_turnover_products(self, start, end, limit=5):
+        self._ensure_loaded()
+        ids, sold, _ = self._products.totals(start, end)
+        products = self.catalog.snapshot().products
+        catalog_ids = np.fromiter(products, dtype=np.int64, count=len(products))
+        if not len(catalog_ids):
+            return []
+        totals = np.zeros(len(catalog_ids))
+        position = np.searchsorted(ids, catalog_ids)
+        found = position < len(ids)
+        found[found] = ids[position[found]] == catalog_ids[found]
+        totals[found] = sold[position[found]]
+
+        # pragul este a limit-a cea mai mică valoare; egalitățile de la prag sunt departajate după nume
+        if len(totals) > limit:
+            threshold = totals[np.argpartition(totals, limit - 1)[limit - 1]]
+            candidates = np.flatnonzero(totals <= threshold)
+        else:
+            candidates = np.arange(len(totals))
+        ranked = sorted(
+            candidates,
+            key=lambda i: (totals[i], (products[int(catalog_ids[i])].descriere or "").casefold())
+        )
+        return [
+            {
+                "id": int(catalog_ids[i]),
+                "name": products[int(catalog_ids[i])].descriere,
+                "total_sold": int(totals[i]),
+            }
+            for i in ranked[:limit]
+        ]
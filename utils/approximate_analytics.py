@@ -0,0 +1,288 @@
+import threading
+from datetime import date
+
+from utils.sketches import CountMinSketch, HyperLogLog, SpaceSaving
+
+# modul aproximativ al analizelor (ANALYTICS_APPROXIMATE=1), pentru istorice foarte mari
+# în loc de agregări exacte, comenzile și livrările sunt trecute, la fiecare scriere, prin structuri de dimensiune fixă
+# (utils.sketches): Count-Min pentru cantitățile și valorile pe produs, client și distribuitor, Space-Saving
+# pentru candidații la primele locuri și HyperLogLog pentru numărul de clienți distincți
+# se păstrează un set de structuri pentru tot istoricul și, pentru ultimele retention_days zile, câte unul pe zi
+# și câte unul pe săptămână (de luni până duminică); un interval este răspuns combinând săptămânile cuprinse
+# integral în el și zilele de la capete, așa că memoria nu depinde de numărul de comenzi
+# fiecare rezultat vine cu eroarea maximă a estimării
+# la prima folosire, structurile sunt completate din totalurile zilnice (utils.rollups), citite în loturi;
+# scrierile confirmate cât timp citirea este în curs sunt păstrate și aplicate apoi structurilor noi
+# fiecare set ocupă cel mult aproximativ 110 KB cu dimensiunile implicite (patru Count-Min de 512 × 4 valori,
+# trei Space-Saving și un HyperLogLog), deci în jur de 24 MB pentru 184 de zile, săptămânile lor și tot istoricul
+
+LOAD_BATCH_SIZE = 5000
+
+
+class _Sketches:
+    def __init__(self, width, depth, capacity, precision):
+        self.product_revenue = CountMinSketch(width, depth)
+        self.product_quantity = CountMinSketch(width, depth)
+        self.product_candidates = SpaceSaving(capacity)
+        self.client_spend = CountMinSketch(width, depth)
+        self.client_candidates = SpaceSaving(capacity)
+        self.buyers = HyperLogLog(precision)
+        self.distributor_quantity = CountMinSketch(width, depth)
+        self.distributor_candidates = SpaceSaving(capacity)
+
+    def add_product(self, product_id, quantity, revenue):
+        self.product_revenue.add(product_id, revenue)
+        self.product_quantity.add(product_id, quantity)
+        self.product_candidates.add(product_id, revenue)
+
+    # numărul de clienți distincți nu poate fi micșorat, așa că o comandă ștearsă rămâne numărată în buyers
+    def add_client(self, client_id, spend):
+        self.client_spend.add(client_id, spend)
+        self.client_candidates.add(client_id, spend)
+        if spend > 0:
+            self.buyers.add(client_id)
+
+    def add_distributor(self, distributor_id, quantity):
+        self.distributor_quantity.add(distributor_id, quantity)
+        self.distributor_candidates.add(distributor_id, quantity)
+
+
+# structura Count-Min pentru întreg intervalul, obținută prin adunarea celor zilnice
+def _combined(buckets, sketch):
+    if len(buckets) == 1:
+        return getattr(buckets[0], sketch)
+    combined = CountMinSketch(getattr(buckets[0], sketch).width, getattr(buckets[0], sketch).depth)
+    for bucket in buckets:
+        combined.update(getattr(bucket, sketch))
+    return combined
+
+
+# cheile cu cele mai mari sume estimate într-un interval: candidații sunt cheile urmărite de Space-Saving
+# în oricare dintre zile (o cheie care depășește total / capacity în interval o depășește într-una dintre zile),
+# iar suma fiecăruia este estimarea Count-Min pe interval; întoarce și eroarea maximă a estimărilor
+def _heavy_hitters(buckets, sketch, candidates, limit):
+    keys = set()
+    for bucket in buckets:
+        keys.update(getattr(bucket, candidates).keys())
+    cms = _combined(buckets, sketch)
+    estimates = ((key, cms.estimate(key)) for key in keys)
+    ranked = sorted(((key, value) for key, value in estimates if value > 0), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit], cms.error_bound()
+
+
+class ApproximateAnalytics:
+    def __init__(self, pool, catalog, enabled=False, retention_days=184, width=512, depth=4, capacity=128, precision=12):
+        self.pool = pool
+        self.catalog = catalog
+        self.enabled = enabled
+        self.retention_days = retention_days
+        self._sizes = (width, depth, capacity, precision)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._all_time = None
+        self._days = {}
+        self._weeks = {}
+        # scrierile confirmate în timpul unei încărcări, ca (funcție, date, semn); None când nu rulează nicio încărcare
+        self._replay = None
+
+    def _new(self):
+        return _Sketches(*self._sizes)
+
+    def _first_day(self):
+        return date.today().toordinal() - self.retention_days + 1
+
+    # seturile în care se adaugă o valoare din ziua day (numărul ordinal al datei): tot istoricul, ziua și săptămâna
+    # (o săptămână este identificată prin lunea ei; date.toordinal() al unei zile de luni este multiplu de 7 plus 1)
+    def _targets(self, all_time, days, weeks, day):
+        if day < self._first_day():
+            return (all_time,)
+        day_bucket = days.get(day)
+        if day_bucket is None:
+            day_bucket = days[day] = self._new()
+        monday = day - (day - 1) % 7
+        week_bucket = weeks.get(monday)
+        if week_bucket is None:
+            week_bucket = weeks[monday] = self._new()
+        return all_time, day_bucket, week_bucket
+
+    def load(self):
+        with self._load_lock:
+            with self._lock:
+                self._replay = []
+            try:
+                self._load()
+            finally:
+                with self._lock:
+                    self._replay = None
+
+    def _load(self):
+        all_time, days, weeks = self._new(), {}, {}
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT Zi, ProdusId, Cantitate, Valoare FROM dbo.VanzariZilniceProdus")
+            for rows in iter(lambda: cursor.fetchmany(LOAD_BATCH_SIZE), []):
+                for row in rows:
+                    for target in self._targets(all_time, days, weeks, row.Zi.toordinal()):
+                        target.add_product(row.ProdusId, row.Cantitate, float(row.Valoare))
+            cursor.execute("SELECT Zi, ClientId, Valoare FROM dbo.VanzariZilniceClient")
+            for rows in iter(lambda: cursor.fetchmany(LOAD_BATCH_SIZE), []):
+                for row in rows:
+                    for target in self._targets(all_time, days, weeks, row.Zi.toordinal()):
+                        target.add_client(row.ClientId, float(row.Valoare))
+            cursor.execute("SELECT Zi, DistribuitorId, Cantitate FROM dbo.LivrariZilniceDistribuitor")
+            for rows in iter(lambda: cursor.fetchmany(LOAD_BATCH_SIZE), []):
+                for row in rows:
+                    for target in self._targets(all_time, days, weeks, row.Zi.toordinal()):
+                        target.add_distributor(row.DistribuitorId, row.Cantitate)
+        with self._lock:
+            for apply, changes, sign in self._replay:
+                apply(all_time, days, weeks, changes, sign)
+            self._all_time, self._days, self._weeks = all_time, days, weeks
+
+    def _ensure_loaded(self):
+        if self._all_time is None:
+            with self._load_lock:
+                loaded = self._all_time is not None
+            if not loaded:
+                self.load()
+
+    # se apelează după commit, cu aceleași date transmise lui rollups.record_orders / record_deliveries
+    # scrierile făcute înainte de prima încărcare sunt ignorate, fiindcă încărcarea le citește din baza de date
+    def apply_orders(self, orders, sign=1):
+        if self.enabled:
+            self._apply(self._add_orders, orders, sign)
+
+    def apply_deliveries(self, deliveries, sign=1):
+        if self.enabled:
+            self._apply(self._add_deliveries, deliveries, sign)
+
+    # aplică scrierile structurilor curente și, dacă o încărcare este în curs, le păstrează pentru structurile noi
+    def _apply(self, apply, changes, sign):
+        with self._lock:
+            if self._all_time is not None:
+                apply(self._all_time, self._days, self._weeks, changes, sign)
+            if self._replay is not None:
+                self._replay.append((apply, changes, sign))
+
+    def _add_orders(self, all_time, days, weeks, orders, sign):
+        for placed_at, client_id, quantities, prices in orders:
+            targets = self._targets(all_time, days, weeks, placed_at.date().toordinal())
+            spend = 0.0
+            for product_id, qty in quantities.items():
+                revenue = qty * float(prices.get(product_id) or 0)
+                spend += revenue
+                for target in targets:
+                    target.add_product(product_id, sign * qty, sign * revenue)
+            for target in targets:
+                target.add_client(client_id, sign * spend)
+
+    def _add_deliveries(self, all_time, days, weeks, deliveries, sign):
+        for delivered_at, distributor_id, quantities, _ in deliveries:
+            day = delivered_at.date().toordinal()
+            for target in self._targets(all_time, days, weeks, day):
+                target.add_distributor(distributor_id, sign * sum(quantities.values()))
+
+    # seturile care acoperă intervalul [start, end] (date, inclusiv); None înseamnă tot istoricul
+    # zilele mai vechi de retention_days nu mai au set propriu, așa că intervalul începe cel mai devreme atunci
+    # o săptămână este folosită doar dacă începe după prima zi păstrată, altfel ar fi incompletă
+    # se apelează cu self._lock luat
+    def _buckets(self, start, end):
+        first_day = self._first_day()
+        for day in [day for day in self._days if day < first_day]:
+            del self._days[day]
+        for monday in [monday for monday in self._weeks if monday < first_day]:
+            del self._weeks[monday]
+        if start is None and end is None:
+            return [self._all_time]
+        day = max(start.toordinal(), first_day) if start is not None else first_day
+        end = end.toordinal() if end is not None else date.today().toordinal()
+        buckets = []
+        while day <= end:
+            if (day - 1) % 7 == 0 and day + 6 <= end:
+                bucket, day = self._weeks.get(day), day + 7
+            else:
+                bucket, day = self._days.get(day), day + 1
+            if bucket is not None:
+                buckets.append(bucket)
+        return buckets or [self._new()]
+
+    def _client_details(self, client_ids):
+        if not client_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in client_ids)
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT cl.ClientId, cl.ClientNume, cl.ClientPrenume, u.Username
+                FROM dbo.Client cl
+                JOIN dbo.Utilizatori u ON u.UserId = cl.UserId
+                WHERE cl.ClientId IN ({placeholders})
+                """,
+                tuple(client_ids)
+            )
+            return {row.ClientId: (f"{row.ClientNume} {row.ClientPrenume}", row.Username) for row in cursor.fetchall()}
+
+    def _distributor_names(self, distributor_ids):
+        if not distributor_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in distributor_ids)
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT DistribuitorId, DistribuitorNume FROM dbo.Distribuitor WHERE DistribuitorId IN ({placeholders})",
+                tuple(distributor_ids)
+            )
+            return {row.DistribuitorId: row.DistribuitorNume for row in cursor.fetchall()}
+
+    # rezultatele au forma {"items": [...], "error": eroarea maximă a fiecărei valori}
+    # produsele care nu mai există în catalog sunt ignorate
+    def top_products(self, start, end, limit=5):
+        self._ensure_loaded()
+        products = self.catalog.snapshot().products
+        items = []
+        with self._lock:
+            buckets = self._buckets(start, end)
+            ranked, error = _heavy_hitters(buckets, 'product_revenue', 'product_candidates', len(products))
+            quantities = _combined(buckets, 'product_quantity')
+            for product_id, revenue in ranked:
+                product = products.get(product_id)
+                if product is None:
+                    continue
+                items.append({"id": product_id, "name": product.descriere, "revenue": revenue, "quantity": int(quantities.estimate(product_id))})
+                if len(items) == limit:
+                    break
+        return {"items": items, "error": error}
+
+    def top_clients(self, start, end, limit=1):
+        self._ensure_loaded()
+        with self._lock:
+            ranked, error = _heavy_hitters(self._buckets(start, end), 'client_spend', 'client_candidates', limit)
+        details = self._client_details([client_id for client_id, _ in ranked])
+        items = []
+        for client_id, total in ranked:
+            name, email = details.get(client_id, ("", ""))
+            items.append({"id": client_id, "name": name, "email": email, "total": total})
+        return {"items": items, "error": error}
+
+    def top_distributors(self, start, end, limit=1):
+        self._ensure_loaded()
+        with self._lock:
+            ranked, error = _heavy_hitters(
+                self._buckets(start, end), 'distributor_quantity', 'distributor_candidates', limit
+            )
+        names = self._distributor_names([distributor_id for distributor_id, _ in ranked])
+        items = [
+            {"id": distributor_id, "name": names.get(distributor_id, ""), "quantity": int(quantity)}
+            for distributor_id, quantity in ranked
+        ]
+        return {"items": items, "error": error}
+
+    # numărul de clienți distincți care au comandat în interval, cu eroarea relativă tipică
+    def unique_buyers(self, start, end):
+        self._ensure_loaded()
+        buyers = HyperLogLog(self._sizes[3])
+        with self._lock:
+            for bucket in self._buckets(start, end):
+                buyers.update(bucket.buyers)
+        return {"count": buyers.count(), "relative_error": buyers.relative_error()}
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+# cache pe disc pentru imaginile produselor, adresat după conținut:
+# fiecare imagine este salvată într-un fișier numit după hash-ul ei SHA-256, așa că
+# imaginile identice (chiar dacă aparțin unor produse diferite) sunt salvate o singură dată,
+# iar o imagine modificată primește automat o cheie nouă
+# dimensiunea totală este limitată; când limita este depășită, sunt șterse fișierele folosite cel mai demult
+
+
+class BlobCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # hash -> dimensiune, în ordinea ultimei folosiri (primul element este cel folosit cel mai demult)
+        self._entries = OrderedDict()
+        self._total = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # la pornire, preiau fișierele existente, în ordinea ultimei modificări
+    def _load(self):
+        found = []
+        for prefix in os.scandir(self.directory):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    # întoarce calea fișierului pentru hash-ul dat, sau None dacă imaginea nu este în cache
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        return self._path(key)
+
+    # salvează imaginea și întoarce calea fișierului
+    # imaginile mai mari decât întregul cache nu sunt salvate (se întoarce None)
+    def put(self, key, data):
+        return self._store(key, len(data), lambda tmp_file: tmp_file.write(data))
+
+    # la fel ca put, dar copiază conținutul dintr-un fișier deschis, pe bucăți
+    def put_file(self, key, size, source):
+        def copy(tmp_file):
+            source.seek(0)
+            shutil.copyfileobj(source, tmp_file)
+        return self._store(key, size, copy)
+
+    def _store(self, key, size, write):
+        if size > self.max_bytes:
+            return None
+        path = self._path(key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return path
+
+        # scriu mai întâi într-un fișier temporar, apoi îl redenumesc,
+        # astfel încât un fișier din cache este întotdeauna complet
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                write(tmp_file)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = size
+                self._total += size
+            self._evict()
+        return path
+
+    # se apelează când fișierul a dispărut de pe disc (de exemplu, șters de alt proces)
+    def discard(self, key):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._total -= size
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
@@ -0,0 +1,92 @@
+# scrieri în bloc pentru liniile comenzilor și ale livrărilor
+# în locul unui INSERT și al unui UPDATE pentru fiecare produs, toate liniile sunt trimise într-un singur lot
+# (fast_executemany), iar stocurile sunt modificate printr-un singur UPDATE, așa că durata tranzacției
+# (și a blocărilor ținute de ea) aproape nu mai depinde de numărul de linii
+
+# SQL Server acceptă cel mult 1000 de rânduri într-un constructor VALUES și 2100 de parametri într-o cerere
+VALUES_MAX_ROWS = 1000
+VALUES_MAX_PARAMS = 2100
+
+
+# numărul de rânduri dintr-un grup, astfel încât să fie respectate ambele limite
+def values_batch_size(columns):
+    return max(1, min(VALUES_MAX_ROWS, VALUES_MAX_PARAMS // columns))
+
+
+# împarte rândurile în grupuri și întoarce, pentru fiecare grup, textul VALUES și parametrii lui
+def values_batches(rows, columns):
+    rows = list(rows)
+    row_sql = "(" + ", ".join("?" for _ in range(columns)) + ")"
+    size = values_batch_size(columns)
+    for start in range(0, len(rows), size):
+        batch = rows[start:start + size]
+        params = tuple(value for row in batch for value in row)
+        yield ", ".join(row_sql for _ in batch), params
+
+
+def _insert_many(cursor, query, rows):
+    if not rows:
+        return
+    previous = cursor.fast_executemany
+    cursor.fast_executemany = True
+    try:
+        cursor.executemany(query, rows)
+    finally:
+        cursor.fast_executemany = previous
+
+
+# valoarea totală a unor linii; quantities este {id produs: cantitate}, iar prices {id produs: preț unitar}
+# un preț NULL este socotit 0, la fel ca în rollups și în analizele aproximative
+def lines_total(quantities, prices):
+    return sum((prices[product_id] or 0) * qty for product_id, qty in quantities.items())
+
+
+# liniile unei comenzi; quantities este {id produs: cantitate}, iar prices {id produs: preț unitar}
+# prețul unitar este păstrat pe fiecare linie, așa că istoricul nu se schimbă când se modifică prețul produsului
+def insert_order_lines(cursor, order_id, quantities, prices):
+    insert_order_line_rows(cursor, [
+        (product_id, order_id, qty, prices[product_id] or 0) for product_id, qty in quantities.items()
+    ])
+
+
+# liniile mai multor comenzi, ca tupluri (id produs, id comandă, cantitate, preț unitar)
+def insert_order_line_rows(cursor, rows):
+    _insert_many(
+        cursor,
+        """
+        INSERT INTO dbo.ProdusComanda (ProdusId, ComandaId, ProdusComandaCantitate, ProdusComandaPret)
+        VALUES (?, ?, ?, ?)
+        """,
+        rows
+    )
+
+
+# liniile unei livrări; quantities este {id produs: cantitate}, prices și costs {id produs: preț / cost unitar}
+def insert_delivery_lines(cursor, delivery_id, quantities, prices, costs):
+    _insert_many(
+        cursor,
+        """
+        INSERT INTO dbo.ProdusLivrare (ProdusId, LivrareId, ProdusLivrareCantitate, ProdusLivrarePret, ProdusLivrareCost)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [
+            (product_id, delivery_id, qty, prices[product_id] or 0, costs[product_id] or 0)
+            for product_id, qty in quantities.items()
+        ]
+    )
+
+
+# modifică stocurile mai multor produse printr-un singur UPDATE; deltas este {id produs: cantitate},
+# cu cantități negative pentru comenzi și pozitive pentru livrări
+def apply_stock_deltas(cursor, deltas):
+    rows = [(product_id, delta) for product_id, delta in deltas.items() if delta]
+    for values, params in values_batches(rows, 2):
+        cursor.execute(
+            f"""
+            UPDATE p
+            SET Stoc = ISNULL(p.Stoc, 0) + d.Delta
+            FROM dbo.Produs p
+            JOIN (VALUES {values}) AS d (ProdusId, Delta) ON d.ProdusId = p.ProdusId
+            """,
+            params
+        )
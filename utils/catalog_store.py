@@ -0,0 +1,516 @@
+import bisect
+import random
+import threading
+import time
+from collections import Counter
+
+from utils.search import SearchIndex, SuggestionIndex
+
+# model de citire al catalogului, păstrat în memoria procesului
+# produsele, categoriile și subcategoriile se schimbă doar când un angajat le modifică (sau la comenzi/livrări, pentru stoc),
+# așa că paginile magazinului le pot citi de aici, fără interogări la baza de date
+# catalogul este încărcat integral la prima folosire, apoi este actualizat de rutele care îl modifică;
+# periodic este reîncărcat în fundal, pentru a prelua și modificările făcute de alte procese
+# stocul produselor (folosit și pentru verificările din coș) este reconciliat separat, mai des, citind doar coloana Stoc
+
+
+class ProductRecord:
+    __slots__ = ('id', 'subcategory_id', 'descriere', 'pret', 'cost', 'stoc', 'image_hash')
+
+    def __init__(self, id, subcategory_id, descriere, pret, cost, stoc, image_hash):
+        self.id = id
+        self.subcategory_id = subcategory_id
+        self.descriere = descriere
+        self.pret = pret
+        self.cost = cost
+        self.stoc = stoc
+        self.image_hash = image_hash
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row.ProdusId,
+            row.SubcategorieId,
+            row.Descriere,
+            float(row.Pret) if row.Pret is not None else 0.0,
+            float(row.Cost) if row.Cost is not None else 0.0,
+            int(row.Stoc) if row.Stoc is not None else 0,
+            bytes(row.ImagineHash) if row.ImagineHash is not None else None,
+        )
+
+
+class CategoryRecord:
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class SubcategoryRecord:
+    __slots__ = ('id', 'name', 'description', 'category_id')
+
+    def __init__(self, id, name, description, category_id):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.category_id = category_id
+
+
+PRODUCT_COLUMNS = "ProdusId, SubcategorieId, Descriere, Pret, Cost, Stoc, ImagineHash"
+
+# numărul de produse afișate în secțiunile cu o categorie și o subcategorie aleatorie din pagina magazinului
+FEATURED_COUNT = 12
+
+# ponderile câmpurilor în indexul de căutare
+SEARCH_WEIGHT_DESCRIPTION = 3.0
+SEARCH_WEIGHT_SUBCATEGORY = 1.5
+SEARCH_WEIGHT_CATEGORY = 1.0
+
+
+def _sort_key(product):
+    return ((product.descriere or "").casefold(), product.id)
+
+
+# textele după care poate fi găsit un produs: descrierea, numele subcategoriei și al categoriei
+def _search_fields(product, categories, subcategories):
+    fields = [(product.descriere, SEARCH_WEIGHT_DESCRIPTION)]
+    subcategory = subcategories.get(product.subcategory_id)
+    if subcategory is not None:
+        fields.append((subcategory.name, SEARCH_WEIGHT_SUBCATEGORY))
+        category = categories.get(subcategory.category_id)
+        if category is not None:
+            fields.append((category.name, SEARCH_WEIGHT_CATEGORY))
+    return fields
+
+
+def _build_search_index(products, categories, subcategories):
+    return SearchIndex.build(
+        (product.id, product.descriere, _search_fields(product, categories, subcategories))
+        for product in products.values()
+    )
+
+
+# o versiune completă a catalogului, împreună cu indecșii ei
+# nu este modificată după construire (cu excepția stocului produselor), deci poate fi citită fără lock
+class _Snapshot:
+    __slots__ = (
+        'products', 'categories', 'subcategories',
+        'by_subcategory', 'by_category', 'category_tree', 'suggestions',
+        'nonempty_categories', 'nonempty_subcategories', 'featured_by_category', 'featured_by_subcategory'
+    )
+
+    def __init__(self, products, categories, subcategories):
+        self.products = products
+        self.categories = categories
+        self.subcategories = subcategories
+
+        by_subcategory = {}
+        by_category = {}
+        for product in sorted(products.values(), key=_sort_key):
+            if product.subcategory_id is None:
+                continue
+            by_subcategory.setdefault(product.subcategory_id, []).append(product)
+            subcategory = subcategories.get(product.subcategory_id)
+            if subcategory is not None:
+                by_category.setdefault(subcategory.category_id, []).append(product)
+        self.by_subcategory = by_subcategory
+        self.by_category = by_category
+
+        # categoriile și subcategoriile care au cel puțin un produs, din care pagina magazinului alege una aleatoriu,
+        # împreună cu primele lor produse
+        self.nonempty_categories = tuple(cid for cid in by_category if cid in categories)
+        self.nonempty_subcategories = tuple(
+            sid for sid in by_subcategory
+            if sid in subcategories and subcategories[sid].category_id in categories
+        )
+        self.featured_by_category = {cid: by_category[cid][:FEATURED_COUNT] for cid in self.nonempty_categories}
+        self.featured_by_subcategory = {
+            sid: by_subcategory[sid][:FEATURED_COUNT] for sid in self.nonempty_subcategories
+        }
+
+        # arborele de categorii pentru meniul magazinului (categorii cu subcategoriile lor, în ordine alfabetică)
+        tree = [
+            {"id": cat.id, "name": cat.name, "subcategories": []}
+            for cat in sorted(categories.values(), key=lambda c: (c.name.casefold(), c.id))
+            if cat.name
+        ]
+        tree_by_id = {cat["id"]: cat for cat in tree}
+        for sub in sorted(subcategories.values(), key=lambda s: ((s.name or "").casefold(), s.id)):
+            if not sub.name:
+                continue
+            cat = tree_by_id.get(sub.category_id)
+            if cat is not None:
+                cat["subcategories"].append({"id": sub.id, "name": sub.name})
+        self.category_tree = tree
+
+        # sugestiile pentru câmpul de căutare (numele produselor)
+        self.suggestions = SuggestionIndex(p.descriere for p in products.values())
+
+    # o versiune nouă, în care au fost modificate doar produsele changed (adăugate, modificate sau șterse)
+    # products este noul dicționar de produse; listele, produsele recomandate și sugestiile sunt corectate doar
+    # pentru produsele modificate, iar restul structurilor (inclusiv arborele de categorii) sunt preluate ca atare
+    def patched(self, products, changed):
+        snapshot = _Snapshot.__new__(_Snapshot)
+        snapshot.products = products
+        snapshot.categories = self.categories
+        snapshot.subcategories = self.subcategories
+        snapshot.category_tree = self.category_tree
+
+        by_subcategory = dict(self.by_subcategory)
+        by_category = dict(self.by_category)
+        # listele modificate sunt copiate (o singură dată), pentru ca versiunea curentă să rămână neschimbată
+        copied = set()
+
+        def group(groups, kind, key):
+            if (kind, key) not in copied:
+                copied.add((kind, key))
+                groups[key] = list(groups.get(key, ()))
+            return groups[key]
+
+        def groups_of(product):
+            if product.subcategory_id is None:
+                return []
+            result = [(by_subcategory, 'subcategory', product.subcategory_id)]
+            subcategory = self.subcategories.get(product.subcategory_id)
+            if subcategory is not None:
+                result.append((by_category, 'category', subcategory.category_id))
+            return result
+
+        removed_names, added_names = [], []
+        for pid in changed:
+            previous, current = self.products.get(pid), products.get(pid)
+            if previous is not None:
+                removed_names.append(previous.descriere)
+                for groups, kind, key in groups_of(previous):
+                    items = group(groups, kind, key)
+                    pos = bisect.bisect_left(items, _sort_key(previous), key=_sort_key)
+                    if pos < len(items) and items[pos].id == pid:
+                        del items[pos]
+            if current is not None:
+                added_names.append(current.descriere)
+                for groups, kind, key in groups_of(current):
+                    bisect.insort(group(groups, kind, key), current, key=_sort_key)
+        for kind, key in copied:
+            groups = by_category if kind == 'category' else by_subcategory
+            if not groups[key]:
+                del groups[key]
+        snapshot.by_subcategory = by_subcategory
+        snapshot.by_category = by_category
+
+        categories, subcategories = self.categories, self.subcategories
+        snapshot.nonempty_categories = tuple(cid for cid in by_category if cid in categories)
+        snapshot.nonempty_subcategories = tuple(
+            sid for sid in by_subcategory
+            if sid in subcategories and subcategories[sid].category_id in categories
+        )
+        featured_by_category = dict(self.featured_by_category)
+        featured_by_subcategory = dict(self.featured_by_subcategory)
+        for kind, key in copied:
+            if kind == 'category':
+                groups, featured, nonempty = by_category, featured_by_category, snapshot.nonempty_categories
+            else:
+                groups, featured, nonempty = by_subcategory, featured_by_subcategory, snapshot.nonempty_subcategories
+            featured.pop(key, None)
+            if key in nonempty:
+                featured[key] = groups[key][:FEATURED_COUNT]
+        snapshot.featured_by_category = featured_by_category
+        snapshot.featured_by_subcategory = featured_by_subcategory
+
+        if Counter(removed_names) != Counter(added_names):
+            snapshot.suggestions = self.suggestions.updated(removed_names, added_names)
+        else:
+            snapshot.suggestions = self.suggestions
+        return snapshot
+
+
+class CatalogStore:
+    def __init__(self, pool, refresh_interval=300.0, stock_reconcile_interval=30.0):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self.stock_reconcile_interval = stock_reconcile_interval
+        self._snapshot = None
+        self._search = None
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+        self._refreshing = False
+        # produsele modificate cât timp o reîncărcare completă este în curs; sunt recitite după reîncărcare,
+        # pentru ca datele citite înaintea modificării să nu o suprascrie
+        self._pending = None
+        self._pending_taxonomy = False
+        self._stock_checked_at = 0.0
+        self._reconciling = False
+        # produsele al căror stoc a fost modificat în timpul unei reconcilieri; valoarea citită pentru ele
+        # poate fi anterioară modificării, așa că nu o aplic
+        self._stock_touched = None
+        # versiunea catalogului crește la fiecare modificare a produselor sau a categoriilor, dar nu și la modificările
+        # de stoc (comenzi, livrări, reconciliere), care cresc doar stock_version; astfel cache-urile care depind
+        # doar de forma catalogului (clasamente, liste) nu sunt invalidate la fiecare comandă
+        self.version = 0
+        self.stock_version = 0
+        # versiunea arborelui de categorii crește doar când acesta se schimbă (meniul magazinului depinde doar de el)
+        self.taxonomy_version = 0
+
+    # --- încărcare ---
+
+    def _fetch(self, cursor):
+        cursor.execute(f"SELECT {PRODUCT_COLUMNS} FROM dbo.Produs")
+        products = {row.ProdusId: ProductRecord.from_row(row) for row in cursor.fetchall()}
+        categories, subcategories = self._fetch_taxonomy(cursor)
+        return products, categories, subcategories
+
+    @staticmethod
+    def _fetch_taxonomy(cursor):
+        cursor.execute("SELECT CategorieId, CategorieNume FROM dbo.Categorie")
+        categories = {
+            row.CategorieId: CategoryRecord(row.CategorieId, row.CategorieNume)
+            for row in cursor.fetchall()
+        }
+        cursor.execute(
+            "SELECT SubcategorieId, SubcategorieNume, SubcategorieDescriere, CategorieId FROM dbo.Subcategorie"
+        )
+        subcategories = {
+            row.SubcategorieId: SubcategoryRecord(
+                row.SubcategorieId,
+                row.SubcategorieNume,
+                row.SubcategorieDescriere.strip() if row.SubcategorieDescriere else None,
+                row.CategorieId
+            )
+            for row in cursor.fetchall()
+        }
+        return categories, subcategories
+
+    def reload(self):
+        with self._lock:
+            self._pending = set()
+            self._pending_taxonomy = False
+        try:
+            with self.pool.transaction() as conn:
+                products, categories, subcategories = self._fetch(conn.cursor())
+            search = _build_search_index(products, categories, subcategories)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            pending_taxonomy = self._pending_taxonomy
+            self._install(_Snapshot(products, categories, subcategories))
+            self._search = search
+            self._loaded_at = time.monotonic()
+
+        if pending or pending_taxonomy:
+            with self.pool.transaction() as conn:
+                cursor = conn.cursor()
+                if pending_taxonomy:
+                    self.refresh_taxonomy(cursor)
+                if pending:
+                    self.refresh_products(cursor, pending)
+
+    def _background_reload(self):
+        try:
+            self.reload()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    # întoarce versiunea curentă a catalogului; prima apelare încarcă tot catalogul,
+    # iar dacă acesta este mai vechi decât refresh_interval, pornesc o reîncărcare în fundal
+    # (până la finalul ei, cererile folosesc în continuare versiunea existentă)
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.reload()
+                return self._snapshot
+        if self.refresh_interval and time.monotonic() - self._loaded_at > self.refresh_interval:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._background_reload, daemon=True).start()
+        elif (self.stock_reconcile_interval
+              and time.monotonic() - max(self._loaded_at, self._stock_checked_at) > self.stock_reconcile_interval):
+            with self._lock:
+                start = not self._reconciling
+                self._reconciling = True
+            if start:
+                threading.Thread(target=self._background_reconcile, daemon=True).start()
+        return snapshot
+
+    # recitesc doar stocurile tuturor produselor și le corectez pe cele care diferă
+    def reconcile_stock(self):
+        with self._lock:
+            self._stock_touched = set()
+        try:
+            with self.pool.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT ProdusId, Stoc FROM dbo.Produs")
+                rows = cursor.fetchall()
+        except Exception:
+            with self._lock:
+                self._stock_touched = None
+            raise
+
+        with self._lock:
+            touched, self._stock_touched = self._stock_touched, None
+            self._stock_checked_at = time.monotonic()
+            if self._snapshot is None:
+                return
+            products = self._snapshot.products
+            changed = False
+            for row in rows:
+                product = products.get(row.ProdusId)
+                if product is None or row.ProdusId in touched:
+                    continue
+                stoc = int(row.Stoc) if row.Stoc is not None else 0
+                if product.stoc != stoc:
+                    product.stoc = stoc
+                    changed = True
+            if changed:
+                self.stock_version += 1
+
+    def _background_reconcile(self):
+        try:
+            self.reconcile_stock()
+        finally:
+            with self._lock:
+                self._reconciling = False
+
+    # --- citire ---
+
+    def product(self, product_id):
+        return self.snapshot().products.get(product_id)
+
+    def products(self, product_ids):
+        products = self.snapshot().products
+        return [products[pid] for pid in product_ids if pid in products]
+
+    def category(self, category_id):
+        return self.snapshot().categories.get(category_id)
+
+    def subcategory(self, subcategory_id):
+        return self.snapshot().subcategories.get(subcategory_id)
+
+    def products_in_category(self, category_id, limit=None):
+        products = self.snapshot().by_category.get(category_id, [])
+        return products[:limit] if limit is not None else products
+
+    def products_in_subcategory(self, subcategory_id, limit=None):
+        products = self.snapshot().by_subcategory.get(subcategory_id, [])
+        return products[:limit] if limit is not None else products
+
+    # stocul curent al unui produs, sau None dacă produsul nu există
+    def stock(self, product_id):
+        product = self.snapshot().products.get(product_id)
+        return product.stoc if product is not None else None
+
+    # căutare în catalog; întoarce (produsele din pagina cerută, numărul total de rezultate)
+    def search(self, query, offset=0, limit=24):
+        self.snapshot()
+        product_ids, total = self._search.search(query, offset, limit)
+        return self.products(product_ids), total
+
+    # o categorie cu produse, aleasă aleatoriu, împreună cu primele ei produse; (None, []) dacă nu există
+    def random_category(self):
+        snapshot = self.snapshot()
+        if not snapshot.nonempty_categories:
+            return None, []
+        category_id = random.choice(snapshot.nonempty_categories)
+        return snapshot.categories[category_id], snapshot.featured_by_category[category_id]
+
+    # analog, pentru subcategorii
+    def random_subcategory(self):
+        snapshot = self.snapshot()
+        if not snapshot.nonempty_subcategories:
+            return None, []
+        subcategory_id = random.choice(snapshot.nonempty_subcategories)
+        return snapshot.subcategories[subcategory_id], snapshot.featured_by_subcategory[subcategory_id]
+
+    def category_tree(self):
+        return self.snapshot().category_tree
+
+    def suggest(self, text, limit=10):
+        return self.snapshot().suggestions.complete(text, limit)
+
+    # --- actualizări (write-through), apelate după commit de rutele care modifică baza de date ---
+
+    def _install(self, snapshot):
+        previous = self._snapshot
+        self._snapshot = snapshot
+        self.version += 1
+        self.stock_version += 1
+        if previous is None or previous.category_tree != snapshot.category_tree:
+            self.taxonomy_version += 1
+
+    def _replace(self, products=None, categories=None, subcategories=None):
+        current = self._snapshot
+        self._install(_Snapshot(
+            products if products is not None else current.products,
+            categories if categories is not None else current.categories,
+            subcategories if subcategories is not None else current.subcategories
+        ))
+
+    # recitesc din baza de date produsele create sau modificate
+    def refresh_products(self, cursor, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ",".join("?" for _ in product_ids)
+        cursor.execute(
+            f"SELECT {PRODUCT_COLUMNS} FROM dbo.Produs WHERE ProdusId IN ({placeholders})",
+            tuple(product_ids)
+        )
+        rows = cursor.fetchall()
+        with self._lock:
+            if self._pending is not None:
+                self._pending.update(product_ids)
+            if self._stock_touched is not None:
+                self._stock_touched.update(product_ids)
+            if self._snapshot is None:
+                return
+            snapshot = self._snapshot
+            products = dict(snapshot.products)
+            for pid in product_ids:
+                products.pop(pid, None)
+                self._search.remove(pid)
+            for row in rows:
+                product = products[row.ProdusId] = ProductRecord.from_row(row)
+                self._search.update(
+                    product.id, product.descriere,
+                    _search_fields(product, snapshot.categories, snapshot.subcategories)
+                )
+            # doar produsele modificate sunt corectate în indecși, fără a reconstrui întreaga versiune
+            self._install(snapshot.patched(products, set(product_ids)))
+
+    # recitesc categoriile și subcategoriile (tabele mici)
+    def refresh_taxonomy(self, cursor):
+        categories, subcategories = self._fetch_taxonomy(cursor)
+        with self._lock:
+            if self._pending is not None:
+                self._pending_taxonomy = True
+            if self._snapshot is None:
+                return
+            # numele categoriilor fac parte din indexul de căutare, așa că îl reconstruiesc (tabelele sunt mici,
+            # iar modificările rare)
+            self._search = _build_search_index(self._snapshot.products, categories, subcategories)
+            self._replace(categories=categories, subcategories=subcategories)
+
+    # aplic modificările de stoc în urma unei comenzi (cantități negative) sau a unei livrări (cantități pozitive)
+    # indecșii nu se schimbă, deci modific doar înregistrările produselor
+    def adjust_stock(self, deltas):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.update(deltas)
+            if self._stock_touched is not None:
+                self._stock_touched.update(deltas)
+            if self._snapshot is None:
+                return
+            products = self._snapshot.products
+            for pid, delta in deltas.items():
+                product = products.get(pid)
+                if product is not None:
+                    product.stoc += delta
+            self.stock_version += 1
@@ -0,0 +1,163 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g
+from pyodbc import connect, Error
+from werkzeug.local import LocalProxy
+
+# utilitare pentru gestionarea conexiunilor la baza de date
+# în loc de o singură conexiune partajată, folosesc un pool de conexiuni:
+# fiecare cerere HTTP primește propria conexiune (și propria tranzacție), iar la final o returnează în pool
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connection_string, min_size=1, max_size=10, timeout=30.0, health_check_interval=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: expected 0 <= min_size <= max_size and max_size >= 1.")
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        # conexiunile libere sunt păstrate ca perechi (conexiune, momentul ultimei folosiri)
+        # folosesc o stivă, astfel încât conexiunile folosite recent (deci valide) sunt refolosite primele
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+
+        for _ in range(min_size):
+            self._idle.append((self._open(), time.monotonic()))
+            self._size += 1
+
+    def _open(self):
+        return connect(self.connection_string)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    # verific că o conexiune inactivă de mai mult timp este încă validă
+    def _is_healthy(self, conn, last_used):
+        if getattr(conn, 'closed', False):
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Error:
+            return False
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # rezerv locul înainte de a deschide conexiunea, pentru a nu depăși max_size
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout("No database connection available.")
+                self._cond.wait(remaining)
+
+        # deschiderea și verificarea conexiunii se fac în afara lock-ului, deoarece pot dura
+        try:
+            if conn is not None and self._is_healthy(conn, last_used):
+                return conn
+            if conn is not None:
+                self._close(conn)
+            return self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard=False):
+        # orice modificare necomisă este anulată, pentru ca următoarea cerere să primească o conexiune curată
+        if not discard:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if discard:
+            self._close(conn)
+
+    # o unitate de lucru: tranzacția este comisă la final dacă nu apare nicio excepție, altfel este anulată
+    # folosită de codul care rulează în afara unei cereri HTTP (fire de execuție în fundal)
+    @contextmanager
+    def transaction(self):
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            # release face rollback pentru orice a rămas necomis
+            self.release(conn)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max_size": self.max_size}
+
+
+# conexiunea cererii curente este luată din pool abia la prima folosire și este păstrată în g
+def get_db():
+    if 'db_conn' not in g:
+        g.db_conn = current_app.config['DB_POOL'].acquire()
+    return g.db_conn
+
+
+def release_db(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        current_app.config['DB_POOL'].release(conn, discard=isinstance(exc, Error))
+
+
+# proxy către conexiunea cererii curente; modulele de rute îl folosesc la fel ca pe o conexiune pyodbc
+db = LocalProxy(get_db)
+
+
+def init_app(app):
+    pool = ConnectionPool(
+        app.config['SQL_CONNECTION_STRING'],
+        min_size=app.config['DB_POOL_MIN_SIZE'],
+        max_size=app.config['DB_POOL_MAX_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        health_check_interval=app.config['DB_POOL_HEALTH_CHECK_INTERVAL'],
+    )
+    app.config['DB_POOL'] = pool
+    app.config['DB_CONN'] = db
+    app.teardown_appcontext(release_db)
+    return pool
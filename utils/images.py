@@ -0,0 +1,162 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import url_for
+from pyodbc import Binary
+
+# Pillow este opțional: fără el, produsele sunt servite doar cu imaginea originală
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+# utilitare pentru imaginile produselor
+# imaginile sunt servite printr-o rută separată (/product-image/<id>), în loc să fie incluse ca base64 în pagini
+
+logger = logging.getLogger(__name__)
+
+# variantele redimensionate generate pentru fiecare imagine (dimensiunea maximă, păstrând proporțiile)
+# thumb: cardurile din grilele magazinului, coșul și listele angajaților; medium: pagina produsului
+IMAGE_VARIANTS = {
+    "thumb": (320, 320),
+    "medium": (800, 800),
+}
+
+
+# imaginile sunt salvate în baza de date fără tipul lor, așa că îl deduc din primii octeți ai fișierului
+def guess_image_mimetype(data):
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:2] == b'BM':
+        return 'image/bmp'
+    return 'application/octet-stream'
+
+
+# răspunsurile al căror URL conține versiunea curentă a imaginii pot fi păstrate de browser un an
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+# versiunea imaginii, inclusă în URL: primele caractere ale hash-ului SHA-256 (coloana ImagineHash)
+def image_version(image_hash):
+    return bytes(image_hash).hex()[:16]
+
+
+# URL-ul imaginii unui produs, sau None dacă produsul nu are imagine
+# deoarece URL-ul se schimbă odată cu imaginea, browserul nu trebuie să revalideze imaginea la fiecare pagină
+def product_image_url(product_id, image_hash, size=None):
+    if image_hash is None:
+        return None
+    if size:
+        return url_for('product_image', product_id=product_id, size=size, v=image_version(image_hash))
+    return url_for('product_image', product_id=product_id, v=image_version(image_hash))
+
+
+# numele variantelor care pot fi servite pentru o dimensiune cerută, în ordinea preferinței
+def variant_candidates(size, accept_webp):
+    if size not in IMAGE_VARIANTS:
+        return []
+    if accept_webp:
+        return [f"{size}.webp", size]
+    return [size]
+
+
+def webp_supported():
+    return Image is not None and features.check('webp')
+
+
+# generez variantele redimensionate ale unei imagini
+# întorc o listă de tupluri (nume variantă, content type, octeți)
+def render_variants(data):
+    source = Image.open(io.BytesIO(data))
+    source = ImageOps.exif_transpose(source)
+    has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+    with_webp = webp_supported()
+
+    variants = []
+    for name, box in IMAGE_VARIANTS.items():
+        image = source.copy()
+        image.thumbnail(box, Image.LANCZOS)
+        # imaginile cu transparență rămân PNG, restul devin JPEG
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        buffer = io.BytesIO()
+        if has_alpha:
+            image.save(buffer, format='PNG', optimize=True)
+            variants.append((name, 'image/png', buffer.getvalue()))
+        else:
+            image.save(buffer, format='JPEG', quality=85, optimize=True, progressive=True)
+            variants.append((name, 'image/jpeg', buffer.getvalue()))
+
+        if with_webp:
+            buffer = io.BytesIO()
+            image.save(buffer, format='WEBP', quality=80)
+            variants.append((f"{name}.webp", 'image/webp', buffer.getvalue()))
+
+    return variants
+
+
+# generarea variantelor se face într-un fir de execuție separat, pentru ca salvarea produsului să nu aștepte după ea
+class ImageVariantWorker:
+    def __init__(self, pool):
+        self.pool = pool
+        self.enabled = Image is not None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-variants')
+
+    def submit(self, product_id):
+        if not self.enabled:
+            return None
+        return self._executor.submit(self.generate, product_id)
+
+    def generate(self, product_id):
+        try:
+            with self.pool.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT Imagine, ImagineHash
+                    FROM dbo.Produs
+                    WHERE ProdusId = ? AND Imagine IS NOT NULL
+                    """,
+                    (product_id,)
+                )
+                row = cursor.fetchone()
+            if not row:
+                return
+
+            # procesarea imaginii se face în afara tranzacției
+            source_hash = bytes(row.ImagineHash)
+            variants = render_variants(bytes(row.Imagine))
+
+            with self.pool.transaction() as conn:
+                cursor = conn.cursor()
+                # scriu variantele doar dacă imaginea originală nu a fost înlocuită între timp
+                # UPDLOCK împiedică o editare concurentă a produsului până la finalul tranzacției
+                cursor.execute(
+                    """
+                    SELECT 1
+                    FROM dbo.Produs WITH (UPDLOCK)
+                    WHERE ProdusId = ? AND ImagineHash = ?
+                    """,
+                    (product_id, source_hash)
+                )
+                if not cursor.fetchone():
+                    return
+                cursor.execute("DELETE FROM dbo.ProdusImagineVarianta WHERE ProdusId = ?", (product_id,))
+                for name, content_type, data in variants:
+                    cursor.execute(
+                        """
+                        INSERT INTO dbo.ProdusImagineVarianta (ProdusId, Varianta, ContentType, Imagine, ImagineHash)
+                        VALUES (?, ?, ?, ?, ?)
+                        """,
+                        (product_id, name, content_type, Binary(data), Binary(hashlib.sha256(data).digest()))
+                    )
+        except Exception:
+            logger.exception("Could not generate image variants for product %s", product_id)
@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+# reducerea de loialitate a clienților cu card de fidelitate
+# regula: un card mai vechi de 2 ani primește 3%, iar unul mai vechi de 5 ani primește 7%
+# datele cardurilor (și adresele de email ale clienților) sunt păstrate în memorie, împreună cu momentele în care
+# fiecare client trece în nivelul următor, așa că reducerea se obține fără interogări; un email necunoscut
+# (de exemplu, un client înregistrat de alt proces) este căutat o singură dată în baza de date, iar dacă nu există
+# este ținut minte miss_ttl secunde (sau până la înregistrarea unui client cu acest email)
+
+# (vechime în ani, reducere în procente), de la nivelul cel mai mare la cel mai mic
+LOYALTY_TIERS = ((5, 7), (2, 3))
+
+
+# momentele de la care cardul emis la card_start primește fiecare reducere, în ordine crescătoare
+# vechimea este calculată în zile întregi, ca (acum - card_start).days / 365.25
+def tier_changes(card_start):
+    return sorted(
+        (card_start + timedelta(days=math.floor(years * 365.25) + 1), discount_pct)
+        for years, discount_pct in LOYALTY_TIERS
+    )
+
+
+def email_key(email):
+    return (email or "").strip().casefold()
+
+
+class LoyaltyEntry:
+    __slots__ = ('client_id', 'email', 'card_start', 'changes')
+
+    def __init__(self, client_id, email, card_start):
+        self.client_id = client_id
+        self.email = email
+        self.card_start = card_start
+        self.changes = tier_changes(card_start) if card_start else []
+
+    def discount_pct(self, now=None):
+        now = now or datetime.now()
+        discount_pct = 0
+        for starts_at, tier_pct in self.changes:
+            if now < starts_at:
+                break
+            discount_pct = tier_pct
+        return discount_pct
+
+
+_CLIENTS_QUERY = """
+    SELECT c.ClientId, u.Username, cf.DataInregistrarii
+    FROM dbo.Client c
+    JOIN dbo.Utilizatori u ON u.UserId = c.UserId
+    LEFT JOIN dbo.CardFidelitate cf ON cf.ClientId = c.ClientId
+"""
+
+
+class LoyaltyDirectory:
+    def __init__(self, pool, refresh_interval=300.0, miss_ttl=30.0):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self.miss_ttl = miss_ttl
+        self._lock = threading.Lock()
+        self._by_client = None
+        self._by_email = None
+        # emailurile căutate fără rezultat -> momentul până la care nu mai sunt căutate
+        self._missing = {}
+        self._loaded_at = 0.0
+        self._refreshing = False
+
+    def reload(self):
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_CLIENTS_QUERY)
+            entries = [LoyaltyEntry(row.ClientId, row.Username, row.DataInregistrarii) for row in cursor.fetchall()]
+        by_client = {entry.client_id: entry for entry in entries}
+        by_email = {email_key(entry.email): entry for entry in entries}
+        with self._lock:
+            self._by_client = by_client
+            self._by_email = by_email
+            self._missing = {}
+            self._loaded_at = time.monotonic()
+
+    def _background_reload(self):
+        try:
+            self.reload()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_loaded(self):
+        if self._by_client is None:
+            self.reload()
+            return
+        if self.refresh_interval and time.monotonic() - self._loaded_at > self.refresh_interval:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._background_reload, daemon=True).start()
+
+    def _store(self, entry):
+        with self._lock:
+            if self._by_client is None:
+                return
+            self._by_client[entry.client_id] = entry
+            self._by_email[email_key(entry.email)] = entry
+            self._missing.pop(email_key(entry.email), None)
+
+    # caută în baza de date clienții care lipsesc din memorie; filter_sql este condiția WHERE
+    def _fetch_missing(self, filter_sql, params):
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"{_CLIENTS_QUERY} WHERE {filter_sql}", params)
+            entries = [LoyaltyEntry(row.ClientId, row.Username, row.DataInregistrarii) for row in cursor.fetchall()]
+        for entry in entries:
+            self._store(entry)
+        return entries
+
+    # se apelează după commit-ul înregistrării unui client nou (card_start este None dacă nu are card)
+    # emailul clientului nu mai este considerat necunoscut
+    def add_client(self, client_id, email, card_start):
+        self._ensure_loaded()
+        self._store(LoyaltyEntry(client_id, email, card_start))
+
+    def client(self, client_id):
+        self._ensure_loaded()
+        entry = self._by_client.get(client_id)
+        if entry is None:
+            found = self._fetch_missing("c.ClientId = ?", (client_id,))
+            entry = found[0] if found else None
+        return entry
+
+    def client_for_email(self, email):
+        return self.clients_for_emails([email]).get(email)
+
+    # {email: LoyaltyEntry} pentru adresele cunoscute; cele necunoscute sunt căutate împreună, într-o singură cerere,
+    # cu excepția celor căutate deja fără rezultat în ultimele miss_ttl secunde
+    def clients_for_emails(self, emails):
+        self._ensure_loaded()
+        by_email = self._by_email
+        now = time.monotonic()
+        found = {}
+        missing = set()
+        with self._lock:
+            known_missing = {key for key, expires_at in self._missing.items() if expires_at > now}
+        for email in emails:
+            entry = by_email.get(email_key(email))
+            if entry is not None:
+                found[email] = entry
+            elif email_key(email) and email_key(email) not in known_missing:
+                missing.add(email_key(email))
+        if missing:
+            placeholders = ",".join("?" for _ in missing)
+            fetched = {
+                email_key(entry.email): entry
+                for entry in self._fetch_missing(f"u.Username IN ({placeholders})", tuple(missing))
+            }
+            for email in emails:
+                entry = fetched.get(email_key(email))
+                if entry is not None:
+                    found[email] = entry
+            with self._lock:
+                self._missing = {key: expires_at for key, expires_at in self._missing.items() if expires_at > now}
+                self._missing.update((key, now + self.miss_ttl) for key in missing - fetched.keys())
+        return found
+
+    # reducerea (în procente, 0 dacă nu există) pentru fiecare adresă de email
+    def discounts_for_emails(self, emails, now=None):
+        now = now or datetime.now()
+        entries = self.clients_for_emails(emails)
+        return {email: entries[email].discount_pct(now) if email in entries else 0 for email in emails}
+
+    def discount_pct(self, client_id, now=None):
+        entry = self.client(client_id)
+        return entry.discount_pct(now) if entry is not None else 0
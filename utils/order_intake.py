@@ -0,0 +1,231 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from utils.bulk import apply_stock_deltas, insert_order_line_rows, lines_total, values_batches
+from utils.rollups import record_orders
+from utils.sales import record_sales
+from utils.stock import InsufficientStock
+
+# preluarea grupată a comenzilor din coș (opțională, pentru perioadele cu trafic mare, de exemplu reducerile)
+# în loc ca fiecare cerere să deschidă și să confirme propria tranzacție, comenzile sunt puse într-o coadă,
+# iar un singur fir le preia în loturi mici (la cel mult max_wait secunde sau max_batch comenzi) și le scrie
+# pe toate într-o singură tranzacție: stocul produselor din lot este citit și blocat o dată, comenzile sunt
+# verificate în memorie, în ordinea sosirii, iar cele acceptate sunt inserate împreună
+# fiecare cerere așteaptă rezultatul propriei comenzi (id-ul comenzii sau InsufficientStock)
+
+logger = logging.getLogger(__name__)
+
+
+class OrderTimeout(Exception):
+    pass
+
+
+class _PendingOrder:
+    __slots__ = ('client_id', 'quantities', 'placed_at', 'discount_pct', 'future')
+
+    def __init__(self, client_id, quantities, placed_at, discount_pct):
+        self.client_id = client_id
+        self.quantities = quantities
+        self.placed_at = placed_at
+        self.discount_pct = discount_pct
+        self.future = Future()
+
+
+class OrderIntake:
+    def __init__(
+        self, pool, catalog, sales_ranking, analytics_engine, approximate_analytics, report_jobs,
+        enabled=False, max_batch=100, max_wait=0.02, timeout=30.0
+    ):
+        self.pool = pool
+        self.catalog = catalog
+        self.sales_ranking = sales_ranking
+        self.analytics_engine = analytics_engine
+        self.approximate_analytics = approximate_analytics
+        self.report_jobs = report_jobs
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='order-intake', daemon=True)
+                self._thread.start()
+
+    # pune comanda în coadă și așteaptă rezultatul; întoarce id-ul comenzii create
+    # ridică InsufficientStock dacă stocul nu ajunge, sau excepția apărută la scrierea lotului
+    # ridică OrderTimeout dacă rezultatul nu vine în timeout secunde (de exemplu, firul de scriere așteaptă un lock);
+    # o comandă care nu a fost încă preluată de firul de scriere este anulată, ca să nu fie scrisă după răspuns
+    def place(self, client_id, quantities, placed_at, discount_pct):
+        self._ensure_started()
+        order = _PendingOrder(client_id, dict(quantities), placed_at, discount_pct)
+        self._queue.put(order)
+        try:
+            return order.future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if order.future.cancel():
+                raise OrderTimeout("Your order could not be placed right now. Please try again.")
+            raise OrderTimeout(
+                "Your order is taking longer than expected. Check your order history before placing it again."
+            )
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # comenzile anulate de cererile care nu au mai așteptat sunt sărite
+            batch = [order for order in batch if order.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._process(batch)
+            except Exception as e:
+                logger.exception("Could not write a batch of %d orders", len(batch))
+                for order in batch:
+                    if not order.future.done():
+                        order.future.set_exception(e)
+
+    # scrie lotul; dacă tranzacția lotului eșuează (de exemplu, o cheie străină greșită într-o singură comandă),
+    # comenzile sunt reluate pe rând, fiecare în propria tranzacție, ca o comandă greșită să nu le anuleze pe celelalte
+    # rezultatele sunt transmise cererilor imediat după commit; actualizările din memorie (catalog, clasament,
+    # analize) rulează după aceea, iar o eroare a lor este doar înregistrată, fiindcă comenzile sunt deja salvate
+    def _process(self, batch):
+        try:
+            written = [self._write(batch)]
+        except Exception:
+            if len(batch) == 1:
+                raise
+            logger.exception("Could not write a batch of %d orders, retrying them one by one", len(batch))
+            written = None
+        if written is None:
+            written = []
+            for order in batch:
+                try:
+                    written.append(self._write([order]))
+                except Exception as e:
+                    logger.exception("Could not write an order for client %s", order.client_id)
+                    order.future.set_exception(e)
+
+        sold = {}
+        facts = []
+        for outcomes, batch_sold, batch_facts in written:
+            for order, outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    order.future.set_exception(outcome)
+                else:
+                    order.future.set_result(outcome)
+            for pid, qty in batch_sold.items():
+                sold[pid] = sold.get(pid, 0) + qty
+            facts.extend(batch_facts)
+
+        if not facts:
+            return
+        try:
+            self.catalog.adjust_stock({pid: -qty for pid, qty in sold.items()})
+            self.sales_ranking.apply(sold)
+            self.analytics_engine.apply_orders(facts)
+            self.approximate_analytics.apply_orders(facts)
+        except Exception:
+            logger.exception("Could not update the in-memory state after %d orders", len(facts))
+        finally:
+            self.report_jobs.invalidate()
+
+    # scrie comenzile într-o singură tranzacție și întoarce, după commit, (rezultate, vândute, date pentru rapoarte)
+    # rezultatele sunt perechi (comandă, id-ul comenzii create sau InsufficientStock)
+    def _write(self, batch):
+        product_ids = sorted({pid for order in batch for pid in order.quantities})
+        outcomes = []
+        accepted = []
+        sold = {}
+        facts = []
+
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+
+            # citesc și blochez (UPDLOCK) stocul și prețul tuturor produselor din lot, în ordinea id-urilor
+            stock = {}
+            prices = {}
+            for start in range(0, len(product_ids), 1000):
+                chunk = product_ids[start:start + 1000]
+                placeholders = ",".join("?" for _ in chunk)
+                cursor.execute(
+                    f"""
+                    SELECT ProdusId, Stoc, Pret
+                    FROM dbo.Produs WITH (UPDLOCK, ROWLOCK)
+                    WHERE ProdusId IN ({placeholders})
+                    """,
+                    tuple(chunk)
+                )
+                for row in cursor.fetchall():
+                    stock[row.ProdusId] = int(row.Stoc) if row.Stoc is not None else 0
+                    prices[row.ProdusId] = row.Pret
+
+            # verific comenzile în ordinea sosirii; o comandă este acceptată doar dacă toate produsele ei au stoc
+            for order in batch:
+                shortages = {
+                    pid: stock.get(pid)
+                    for pid, qty in order.quantities.items()
+                    if pid not in stock or stock[pid] < qty
+                }
+                if shortages:
+                    outcomes.append((order, InsufficientStock(shortages)))
+                    continue
+                for pid, qty in order.quantities.items():
+                    stock[pid] -= qty
+                    sold[pid] = sold.get(pid, 0) + qty
+                accepted.append(order)
+
+            if not accepted:
+                return outcomes, sold, facts
+
+            # inserez comenzile acceptate; MERGE permite asocierea fiecărui id generat cu poziția comenzii în lot
+            order_ids = {}
+            rows = [
+                (index, order.placed_at, order.client_id, order.discount_pct, lines_total(order.quantities, prices))
+                for index, order in enumerate(accepted)
+            ]
+            for values, params in values_batches(rows, 5):
+                cursor.execute(
+                    f"""
+                    MERGE INTO dbo.Comanda AS t
+                    USING (VALUES {values}) AS s (Pozitie, ComandaData, ClientId, ReducereLoialitate, ComandaTotal)
+                        ON 1 = 0
+                    WHEN NOT MATCHED THEN
+                        INSERT (ComandaData, ClientId, AngajatId, ReducereLoialitate, ComandaTotal)
+                        VALUES (s.ComandaData, s.ClientId, NULL, s.ReducereLoialitate, s.ComandaTotal)
+                    OUTPUT s.Pozitie, INSERTED.ComandaId;
+                    """,
+                    params
+                )
+                order_ids.update((row[0], row[1]) for row in cursor.fetchall())
+
+            insert_order_line_rows(cursor, [
+                (pid, order_ids[index], qty, prices[pid] or 0)
+                for index, order in enumerate(accepted)
+                for pid, qty in order.quantities.items()
+            ])
+            # rândurile produselor sunt deja blocate de această tranzacție, deci scăderea nu mai trebuie condiționată
+            apply_stock_deltas(cursor, {pid: -qty for pid, qty in sold.items()})
+            record_sales(cursor, sold)
+            facts = [(order.placed_at, order.client_id, order.quantities, prices) for order in accepted]
+            record_orders(cursor, facts)
+
+        outcomes.extend((order, order_ids[index]) for index, order in enumerate(accepted))
+        return outcomes, sold, facts
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from flask import current_app, request, session, make_response
+
+# cache pentru paginile complete ale magazinului, afișate vizitatorilor neautentificați
+# un vizitator fără coș și fără mesaje flash vede exact aceeași pagină ca oricare altul, așa că răspunsul randat
+# o dată poate fi refolosit; fiecare intrare reține versiunea catalogului (și a stocurilor) pentru care a fost randată
+# o intrare expirată (mai veche decât ttl sau randată pentru o versiune mai veche a catalogului) este servită
+# în continuare, în timp ce un singur fir din fundal o randează din nou
+# stocurile se schimbă la fiecare comandă, așa că o pagină randată pentru stocuri mai vechi expiră abia după
+# stock_ttl secunde; astfel o pagină este randată cel mult o dată la stock_ttl secunde, oricâte comenzi sosesc
+# dimensiunea totală este limitată; la depășirea limitei sunt șterse paginile folosite cel mai demult
+
+
+class _Entry:
+    __slots__ = ('body', 'status', 'headers', 'version', 'stock_version', 'created_at')
+
+    def __init__(self, body, status, headers, version, stock_version, created_at):
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.version = version
+        self.stock_version = stock_version
+        self.created_at = created_at
+
+
+class PageCache:
+    def __init__(self, catalog, max_bytes, ttl, stock_ttl=5.0):
+        self.catalog = catalog
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stock_ttl = stock_ttl
+        self._lock = threading.Lock()
+        # URL -> intrare, în ordinea ultimei folosiri
+        self._entries = OrderedDict()
+        self._total = 0
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='page-cache')
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    # doar cererile GET ale vizitatorilor neautentificați, fără coș și fără mesaje flash, folosesc cache-ul
+    @staticmethod
+    def _cacheable():
+        return (
+            request.method == 'GET'
+            and not session.get('loggedin')
+            and not session.get('cart')
+            and not session.get('_flashes')
+        )
+
+    # decorator pentru rutele ale căror pagini pot fi păstrate în cache
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self._cacheable():
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+
+            if entry is None:
+                self.misses += 1
+                return self._render(key, view, args, kwargs)
+
+            if self._is_stale(entry):
+                self.stale_hits += 1
+                self._schedule_refresh(key, view, args, kwargs)
+            else:
+                self.hits += 1
+            return current_app.response_class(entry.body, status=entry.status, headers=entry.headers)
+
+        return wrapper
+
+    def _is_stale(self, entry):
+        age = time.monotonic() - entry.created_at
+        return (
+            entry.version != self.catalog.version
+            or age > self.ttl
+            or (entry.stock_version != self.catalog.stock_version and age > self.stock_ttl)
+        )
+
+    # randez pagina și o salvez; versiunea catalogului este citită înainte de randare, așa că o modificare
+    # făcută în timpul randării face intrarea să fie considerată expirată
+    def _render(self, key, view, args, kwargs):
+        version, stock_version = self.catalog.version, self.catalog.stock_version
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough:
+            headers = [
+                (name, value) for name, value in response.headers.items()
+                if name.lower() not in ('set-cookie', 'content-length')
+            ]
+            self._store(key, _Entry(
+                response.get_data(), response.status_code, headers, version, stock_version, time.monotonic()
+            ))
+        return response
+
+    def _schedule_refresh(self, key, view, args, kwargs):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        app = current_app._get_current_object()
+        self._executor.submit(self._refresh, app, key, view, args, kwargs)
+
+    # randarea din fundal rulează într-un context de cerere nou, fără sesiune (adică tot ca vizitator)
+    def _refresh(self, app, key, view, args, kwargs):
+        try:
+            with app.test_request_context(key):
+                self._render(key, view, args, kwargs)
+        except Exception:
+            app.logger.exception("Could not refresh cached page %s", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, entry):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total -= len(previous.body)
+            self._entries[key] = entry
+            self._total += size
+            while self._total > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total -= len(evicted.body)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+            }
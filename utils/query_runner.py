@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# rularea în paralel a unor interogări de citire independente (de exemplu, agregările din pagina de analize)
+# fiecare interogare primește propria conexiune din pool, așa că durata totală devine aproximativ durata
+# celei mai lente interogări, nu suma lor
+# firele sunt comune pentru toate cererile, deci numărul de conexiuni folosite astfel este limitat la max_workers
+
+
+class QueryRunner:
+    def __init__(self, pool, max_workers=6):
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query-runner')
+
+    def _fetch(self, query, params):
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    # queries este {nume: (interogare, parametri)}; întoarce {nume: rândurile rezultate}
+    # dacă o interogare eșuează, excepția ei este ridicată după ce se termină toate celelalte
+    # progress(terminate, total), dacă este dat, este apelat după fiecare interogare terminată
+    def fetch_all(self, queries, progress=None):
+        futures = {
+            name: self._executor.submit(self._fetch, query, params)
+            for name, (query, params) in queries.items()
+        }
+        if progress is not None:
+            for done, _ in enumerate(as_completed(futures.values()), 1):
+                progress(done, len(futures))
+        errors = [future.exception() for future in futures.values()]
+        for error in errors:
+            if error is not None:
+                raise error
+        return {name: future.result() for name, future in futures.items()}
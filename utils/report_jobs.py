@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# rapoartele lungi (analize, venituri și cheltuieli) rulate în fundal, pe un număr fix de fire
+# o cerere trimite raportul și primește un id, apoi întreabă periodic starea și progresul și, la final, rezultatul
+# - două trimiteri identice (același raport, aceiași parametri) cât timp prima rulează primesc aceeași lucrare
+# - rezultatul terminat este refolosit pentru aceiași parametri până la următoarea scriere (invalidate)
+#   sau până expiră după result_ttl secunde
+# se folosesc fire, nu procese, pentru că rapoartele au nevoie de pool-ul de conexiuni și de datele din memorie
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownReport(Exception):
+    pass
+
+
+class ReportJob:
+    def __init__(self, report, params, generation):
+        self.id = uuid.uuid4().hex
+        self.report = report
+        self.params = params
+        self.generation = generation
+        self.status = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    # apelată de raport, de exemplu după fiecare interogare terminată
+    def report_progress(self, done, total):
+        self.progress = min(1.0, done / total) if total else 1.0
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class ReportJobs:
+    def __init__(self, max_workers=2, result_ttl=600.0):
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report-jobs')
+        self._lock = threading.Lock()
+        self._reports = {}
+        self._jobs = {}
+        self._by_key = {}
+        self._generation = 0
+
+    # func(params, job) întoarce rezultatul raportului; params este un dict cu valori hashable
+    def register(self, report, func):
+        self._reports[report] = func
+
+    # se apelează după fiecare scriere care poate schimba rapoartele; rezultatele deja calculate nu mai sunt refolosite
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self, now):
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            key = (job.report, tuple(sorted(job.params.items())))
+            if self._by_key.get(key) is job:
+                del self._by_key[key]
+
+    # întoarce lucrarea pentru raport și parametri: una în curs, un rezultat încă valabil sau o lucrare nouă
+    def submit(self, report, params):
+        if report not in self._reports:
+            raise UnknownReport(report)
+        key = (report, tuple(sorted(params.items())))
+        with self._lock:
+            self._prune(time.monotonic())
+            job = self._by_key.get(key)
+            # o lucrare în curs este refolosită mereu; un rezultat terminat doar dacă nu a venit nicio scriere între timp
+            if job is not None and job.status in ('queued', 'running'):
+                return job
+            if job is not None and job.status == 'done' and job.generation == self._generation:
+                return job
+            job = ReportJob(report, params, self._generation)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        job.status = 'running'
+        try:
+            job.result = self._reports[job.report](job.params, job)
+            job.progress = 1.0
+            job.status = 'done'
+        except Exception as e:
+            logger.exception("Report %s failed", job.report)
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.monotonic()
+            job._done.set()
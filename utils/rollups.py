@@ -0,0 +1,232 @@
+import random
+from datetime import timedelta
+
+from utils.bulk import values_batches
+
+# totaluri zilnice pentru rapoarte (venituri și cheltuieli, analize)
+# în loc ca rapoartele să parcurgă toate liniile comenzilor și livrărilor din interval, fiecare scriere actualizează,
+# în aceeași tranzacție, câte un rând pe zi pentru produs, client, distribuitor și pentru întreg magazinul
+# rapoartele citesc apoi cel mult câte un rând pe zi (și pe produs / client / distribuitor)
+#   dbo.VanzariZilniceProdus       (Zi, ProdusId)       -> Cantitate, Valoare
+#   dbo.VanzariZilniceClient       (Zi, ClientId)       -> Comenzi, Valoare
+#   dbo.LivrariZilniceDistribuitor (Zi, DistribuitorId) -> Livrari, Cantitate
+#   dbo.TotaluriZilnice            (Zi, Slot)           -> Venituri, Cheltuieli
+# valorile folosesc prețurile și costurile păstrate pe linii, deci coincid cu totalurile comenzilor și livrărilor
+# totalurile magazinului pe o zi sunt împărțite în TOTALS_SLOTS rânduri, iar fiecare scriere îl actualizează pe unul
+# ales la întâmplare; altfel toate comenzile din aceeași zi ar aștepta, până la commit, blocarea aceluiași rând
+# cititorii adună rândurile zilei (SUM ... GROUP BY Zi)
+TOTALS_SLOTS = 16
+
+# interogările care recalculează fiecare tabelă din istoric; folosite la crearea tabelelor (utils.schema)
+# și de comanda rebuild-rollups
+REBUILD_STATEMENTS = {
+    'dbo.VanzariZilniceProdus': """
+        INSERT INTO dbo.VanzariZilniceProdus (Zi, ProdusId, Cantitate, Valoare)
+        SELECT
+            CAST(c.ComandaData AS DATE),
+            pc.ProdusId,
+            SUM(pc.ProdusComandaCantitate),
+            SUM(pc.ProdusComandaCantitate * ISNULL(pc.ProdusComandaPret, 0))
+        FROM dbo.Comanda c
+        JOIN dbo.ProdusComanda pc ON pc.ComandaId = c.ComandaId
+        GROUP BY CAST(c.ComandaData AS DATE), pc.ProdusId
+        HAVING SUM(pc.ProdusComandaCantitate) <> 0
+    """,
+    'dbo.VanzariZilniceClient': """
+        INSERT INTO dbo.VanzariZilniceClient (Zi, ClientId, Comenzi, Valoare)
+        SELECT CAST(c.ComandaData AS DATE), c.ClientId, COUNT(*), SUM(ISNULL(c.ComandaTotal, 0))
+        FROM dbo.Comanda c
+        GROUP BY CAST(c.ComandaData AS DATE), c.ClientId
+    """,
+    'dbo.LivrariZilniceDistribuitor': """
+        INSERT INTO dbo.LivrariZilniceDistribuitor (Zi, DistribuitorId, Livrari, Cantitate)
+        SELECT CAST(l.DataLivrare AS DATE), l.DistribuitorId, COUNT(*), SUM(ISNULL(q.Cantitate, 0))
+        FROM dbo.Livrare l
+        OUTER APPLY (
+            SELECT SUM(pl.ProdusLivrareCantitate) AS Cantitate
+            FROM dbo.ProdusLivrare pl
+            WHERE pl.LivrareId = l.LivrareId
+        ) q
+        GROUP BY CAST(l.DataLivrare AS DATE), l.DistribuitorId
+    """,
+    'dbo.TotaluriZilnice': """
+        INSERT INTO dbo.TotaluriZilnice (Zi, Slot, Venituri, Cheltuieli)
+        SELECT Zi, 0, SUM(Venituri), SUM(Cheltuieli)
+        FROM (
+            SELECT CAST(ComandaData AS DATE) AS Zi, ISNULL(ComandaTotal, 0) AS Venituri, 0 AS Cheltuieli
+            FROM dbo.Comanda
+            UNION ALL
+            SELECT CAST(DataLivrare AS DATE), 0, ISNULL(LivrareTotalCost, 0)
+            FROM dbo.Livrare
+        ) t
+        GROUP BY Zi
+    """,
+}
+
+
+# golește și recalculează toate tabelele, într-o singură tranzacție (cursorul apelantului)
+def rebuild_rollups(cursor):
+    for table, statement in REBUILD_STATEMENTS.items():
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(statement)
+
+
+# adaugă valorile rows ({cheie: valori}) la rândurile tabelei; rândurile al căror contor remove_when_zero
+# ajunge la 0 (de exemplu, după ștergerea singurei comenzi a unui client într-o zi) sunt eliminate
+def _merge(cursor, table, key_columns, value_columns, rows, remove_when_zero=None):
+    rows = [key + values for key, values in sorted(rows.items())]
+    columns = key_columns + value_columns
+    on = " AND ".join(f"t.{column} = s.{column}" for column in key_columns)
+    remove = ""
+    if remove_when_zero:
+        remove = f"WHEN MATCHED AND t.{remove_when_zero} + s.{remove_when_zero} = 0 THEN DELETE"
+    update = ", ".join(f"{column} = t.{column} + s.{column}" for column in value_columns)
+    for values, params in values_batches(rows, len(columns)):
+        cursor.execute(
+            f"""
+            MERGE {table} WITH (HOLDLOCK) AS t
+            USING (VALUES {values}) AS s ({", ".join(columns)})
+                ON {on}
+            {remove}
+            WHEN MATCHED THEN
+                UPDATE SET {update}
+            WHEN NOT MATCHED THEN
+                INSERT ({", ".join(columns)}) VALUES ({", ".join("s." + column for column in columns)});
+            """,
+            params
+        )
+
+
+def _add(totals, key, *values):
+    current = totals.get(key)
+    totals[key] = values if current is None else tuple(a + b for a, b in zip(current, values))
+
+
+# înregistrează comenzi noi (sign=1) sau șterse (sign=-1), cu cursorul tranzacției care le scrie
+# orders conține tupluri (data comenzii, id client, {id produs: cantitate}, {id produs: preț unitar})
+def record_orders(cursor, orders, sign=1):
+    products, clients, days = {}, {}, {}
+    slot = random.randrange(TOTALS_SLOTS)
+    for placed_at, client_id, quantities, prices in orders:
+        day = placed_at.date()
+        total = 0
+        for product_id, qty in quantities.items():
+            value = qty * (prices.get(product_id) or 0)
+            _add(products, (day, product_id), sign * qty, sign * value)
+            total += value
+        _add(clients, (day, client_id), sign, sign * total)
+        _add(days, (day, slot), sign * total, 0)
+
+    _merge(cursor, 'dbo.VanzariZilniceProdus', ('Zi', 'ProdusId'), ('Cantitate', 'Valoare'), products, 'Cantitate')
+    _merge(cursor, 'dbo.VanzariZilniceClient', ('Zi', 'ClientId'), ('Comenzi', 'Valoare'), clients, 'Comenzi')
+    _merge(cursor, 'dbo.TotaluriZilnice', ('Zi', 'Slot'), ('Venituri', 'Cheltuieli'), days)
+
+
+# înregistrează livrări noi (sign=1) sau șterse (sign=-1)
+# deliveries conține tupluri (data livrării, id distribuitor, {id produs: cantitate}, {id produs: cost unitar})
+def record_deliveries(cursor, deliveries, sign=1):
+    distributors, days = {}, {}
+    slot = random.randrange(TOTALS_SLOTS)
+    for delivered_at, distributor_id, quantities, costs in deliveries:
+        day = delivered_at.date()
+        expense = sum(qty * (costs.get(product_id) or 0) for product_id, qty in quantities.items())
+        _add(distributors, (day, distributor_id), sign, sign * sum(quantities.values()))
+        _add(days, (day, slot), 0, sign * expense)
+
+    _merge(cursor, 'dbo.LivrariZilniceDistribuitor', ('Zi', 'DistribuitorId'), ('Livrari', 'Cantitate'), distributors, 'Livrari')
+    _merge(cursor, 'dbo.TotaluriZilnice', ('Zi', 'Slot'), ('Venituri', 'Cheltuieli'), days)
+
+
+# datele unei comenzi, în forma primită de record_orders; citite înainte de ștergerea ei (None dacă nu există)
+def order_facts(cursor, order_id):
+    cursor.execute(
+        """
+        SELECT c.ComandaData, c.ClientId, pc.ProdusId, pc.ProdusComandaCantitate, pc.ProdusComandaPret
+        FROM dbo.Comanda c
+        LEFT JOIN dbo.ProdusComanda pc ON pc.ComandaId = c.ComandaId
+        WHERE c.ComandaId = ?
+        """,
+        (order_id,)
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    quantities, prices = {}, {}
+    for row in rows:
+        if row.ProdusId is None:
+            continue
+        quantities[row.ProdusId] = quantities.get(row.ProdusId, 0) + row.ProdusComandaCantitate
+        prices[row.ProdusId] = row.ProdusComandaPret
+    return rows[0].ComandaData, rows[0].ClientId, quantities, prices
+
+
+# datele unei livrări, în forma primită de record_deliveries (None dacă nu există)
+def delivery_facts(cursor, delivery_id):
+    cursor.execute(
+        """
+        SELECT l.DataLivrare, l.DistribuitorId, pl.ProdusId, pl.ProdusLivrareCantitate, pl.ProdusLivrareCost
+        FROM dbo.Livrare l
+        LEFT JOIN dbo.ProdusLivrare pl ON pl.LivrareId = l.LivrareId
+        WHERE l.LivrareId = ?
+        """,
+        (delivery_id,)
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    quantities, costs = {}, {}
+    for row in rows:
+        if row.ProdusId is None:
+            continue
+        quantities[row.ProdusId] = quantities.get(row.ProdusId, 0) + row.ProdusLivrareCantitate
+        costs[row.ProdusId] = row.ProdusLivrareCost
+    return rows[0].DataLivrare, rows[0].DistribuitorId, quantities, costs
+
+
+# perioadele seriilor de venituri și cheltuieli, cu expresia SQL care dă începutul perioadei unei zile
+# (săptămânile încep luni, indiferent de setarea DATEFIRST a serverului)
+SERIES_BUCKETS = {
+    'day': "Zi",
+    'week': "DATEADD(DAY, -((DATEPART(WEEKDAY, Zi) + @@DATEFIRST - 2) % 7), Zi)",
+    'month': "DATEFROMPARTS(YEAR(Zi), MONTH(Zi), 1)",
+}
+
+
+def period_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+# începuturile tuturor perioadelor din intervalul [start, end], în ordine
+def periods(start, end, bucket):
+    current = period_start(start, bucket)
+    result = []
+    while current <= end:
+        result.append(current)
+        if bucket == 'week':
+            current += timedelta(days=7)
+        elif bucket == 'month':
+            current = (current + timedelta(days=32)).replace(day=1)
+        else:
+            current += timedelta(days=1)
+    return result
+
+
+# veniturile și cheltuielile pe perioade, dintr-o singură interogare grupată pe totalurile zilnice
+# întoarce [(începutul perioadei, venituri, cheltuieli)] pentru toate perioadele, cu 0 pentru cele fără activitate
+def totals_series(cursor, start, end, bucket):
+    expression = SERIES_BUCKETS[bucket]
+    cursor.execute(
+        f"""
+        SELECT {expression} AS Perioada, SUM(Venituri) AS Venituri, SUM(Cheltuieli) AS Cheltuieli
+        FROM dbo.TotaluriZilnice
+        WHERE Zi >= ? AND Zi <= ?
+        GROUP BY {expression}
+        """,
+        (start, end)
+    )
+    found = {row.Perioada: (float(row.Venituri or 0), float(row.Cheltuieli or 0)) for row in cursor.fetchall()}
+    return [(period, *found.get(period, (0.0, 0.0))) for period in periods(start, end, bucket)]
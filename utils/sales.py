@@ -0,0 +1,127 @@
+import heapq
+import threading
+import time
+
+from utils.bulk import values_batches
+
+# contoarele de vânzări ale produselor, folosite pentru produsele cele mai vândute din pagina magazinului
+# tabela dbo.ProdusVanzari păstrează cantitatea totală vândută din fiecare produs și este actualizată în aceeași
+# tranzacție cu liniile de comandă, așa că nu mai este nevoie de un SUM peste tot istoricul comenzilor
+# în memorie păstrez aceleași contoare și clasamentul calculat din ele, care este refăcut doar după o modificare
+
+
+# adaugă (sau scade, pentru cantități negative) vânzările unor produse; deltas este {id produs: cantitate}
+# se apelează înainte de commit, cu cursorul tranzacției care inserează sau șterge liniile de comandă
+# toate produsele sunt actualizate printr-un singur MERGE
+def record_sales(cursor, deltas):
+    rows = [(product_id, quantity) for product_id, quantity in deltas.items() if quantity]
+    for values, params in values_batches(rows, 2):
+        cursor.execute(
+            f"""
+            MERGE dbo.ProdusVanzari WITH (HOLDLOCK) AS t
+            USING (VALUES {values}) AS s (ProdusId, Cantitate)
+                ON t.ProdusId = s.ProdusId
+            WHEN MATCHED THEN
+                UPDATE SET Cantitate = t.Cantitate + s.Cantitate
+            WHEN NOT MATCHED THEN
+                INSERT (ProdusId, Cantitate) VALUES (s.ProdusId, s.Cantitate);
+            """,
+            params
+        )
+
+
+class SalesRanking:
+    def __init__(self, pool, catalog, refresh_interval=300.0):
+        self.pool = pool
+        self.catalog = catalog
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._counts = None
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._version = 0
+        # clasamentul calculat ultima dată: (versiunea contoarelor, versiunea catalogului, lungime, id-uri)
+        self._ranking = None
+
+    def reload(self):
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT ProdusId, Cantitate FROM dbo.ProdusVanzari WHERE Cantitate > 0")
+            counts = {row.ProdusId: int(row.Cantitate) for row in cursor.fetchall()}
+        with self._lock:
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+            self._version += 1
+
+    def _background_reload(self):
+        try:
+            self.reload()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    # contoarele sunt reîncărcate periodic din baza de date, pentru a prelua comenzile plasate de alte procese
+    # (o comandă plasată chiar în timpul reîncărcării poate fi numărată de două ori până la următoarea reîncărcare)
+    def _ensure_loaded(self):
+        if self._counts is None:
+            self.reload()
+            return
+        if self.refresh_interval and time.monotonic() - self._loaded_at > self.refresh_interval:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._background_reload, daemon=True).start()
+
+    # se apelează după commit, cu aceleași cantități transmise lui record_sales
+    # dacă vânzările doar cresc (o comandă nouă), clasamentul calculat este corectat pe loc: un produs din afara lui
+    # poate intra în clasament doar dacă vânzările lui au crescut, deci candidații sunt produsele din clasament
+    # și cele din comandă; altfel (ștergeri) clasamentul este recalculat la următoarea citire
+    def apply(self, deltas):
+        with self._lock:
+            if self._counts is None:
+                return
+            for product_id, quantity in deltas.items():
+                total = self._counts.get(product_id, 0) + quantity
+                if total > 0:
+                    self._counts[product_id] = total
+                else:
+                    self._counts.pop(product_id, None)
+            ranking = self._ranking
+            self._version += 1
+            if ranking is None or ranking[0] != self._version - 1 or any(q < 0 for q in deltas.values()):
+                return
+            products = self.catalog.snapshot().products
+            candidates = [
+                (product_id, self._counts[product_id])
+                for product_id in set(ranking[3]).union(deltas)
+                if product_id in products and product_id in self._counts
+            ]
+            best = heapq.nsmallest(ranking[2], candidates, key=self._sort_key(products))
+            self._ranking = (self._version, ranking[1], ranking[2], [product_id for product_id, _ in best])
+
+    @staticmethod
+    def _sort_key(products):
+        def sort_key(item):
+            product = products[item[0]]
+            return -item[1], (product.descriere or "").casefold(), product.id
+        return sort_key
+
+    # cele mai vândute limit produse (înregistrări din catalog), în ordinea descrescătoare a vânzărilor,
+    # apoi alfabetic; clasamentul este refăcut doar când s-a schimbat catalogul (nu și stocurile) sau când
+    # vânzările nu au putut fi aplicate direct clasamentului
+    def top(self, limit):
+        self._ensure_loaded()
+        catalog_version = self.catalog.version
+        ranking = self._ranking
+        if ranking is None or ranking[:2] != (self._version, catalog_version) or ranking[2] < limit:
+            with self._lock:
+                version = self._version
+                counts = list(self._counts.items())
+            products = self.catalog.snapshot().products
+            best = heapq.nsmallest(
+                limit, (item for item in counts if item[0] in products), key=self._sort_key(products)
+            )
+            ranking = (version, catalog_version, limit, [product_id for product_id, _ in best])
+            self._ranking = ranking
+        return self.catalog.products(ranking[3][:limit])
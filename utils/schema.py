@@ -0,0 +1,174 @@
+from utils.rollups import REBUILD_STATEMENTS
+
+# structurile auxiliare de care are nevoie aplicația, pe lângă tabelele principale ale bazei de date
+# sunt create la pornirea aplicației doar dacă nu există deja, așa că rularea repetată nu are efect
+
+SCHEMA_STATEMENTS = [
+    # hash-ul SHA-256 al imaginii produsului, calculat și păstrat automat de SQL Server la fiecare modificare
+    # permite identificarea versiunii unei imagini fără a citi imaginea
+    """
+    IF COL_LENGTH('dbo.Produs', 'ImagineHash') IS NULL
+    ALTER TABLE dbo.Produs ADD ImagineHash AS CAST(HASHBYTES('SHA2_256', Imagine) AS BINARY(32)) PERSISTED
+    """,
+    # variantele redimensionate ale imaginilor de produs (thumbnail, mediu, eventual WebP)
+    # sunt generate în fundal după salvarea produsului și sunt șterse odată cu produsul
+    """
+    IF OBJECT_ID('dbo.ProdusImagineVarianta', 'U') IS NULL
+    CREATE TABLE dbo.ProdusImagineVarianta (
+        ProdusId INT NOT NULL
+            REFERENCES dbo.Produs (ProdusId) ON DELETE CASCADE,
+        Varianta VARCHAR(32) NOT NULL,
+        ContentType VARCHAR(64) NOT NULL,
+        Imagine VARBINARY(MAX) NOT NULL,
+        ImagineHash BINARY(32) NOT NULL,
+        CONSTRAINT PK_ProdusImagineVarianta PRIMARY KEY (ProdusId, Varianta)
+    )
+    """,
+    # cantitatea totală vândută din fiecare produs, actualizată odată cu liniile de comandă
+    # la creare este completată din comenzile existente
+    """
+    IF OBJECT_ID('dbo.ProdusVanzari', 'U') IS NULL
+    BEGIN
+        CREATE TABLE dbo.ProdusVanzari (
+            ProdusId INT NOT NULL PRIMARY KEY
+                REFERENCES dbo.Produs (ProdusId) ON DELETE CASCADE,
+            Cantitate INT NOT NULL
+        );
+        INSERT INTO dbo.ProdusVanzari (ProdusId, Cantitate)
+        SELECT ProdusId, SUM(ProdusComandaCantitate)
+        FROM dbo.ProdusComanda
+        GROUP BY ProdusId;
+    END
+    """,
+    # prețul (și, la livrări, costul) unitar al produsului în momentul comenzii sau al livrării
+    # liniile existente sunt completate cu prețurile curente; UPDATE-ul este rulat prin EXEC,
+    # pentru că în același lot coloana nou adăugată nu este încă vizibilă
+    """
+    IF COL_LENGTH('dbo.ProdusComanda', 'ProdusComandaPret') IS NULL
+    BEGIN
+        ALTER TABLE dbo.ProdusComanda ADD ProdusComandaPret DECIMAL(18, 2) NULL;
+        EXEC('
+            UPDATE pc
+            SET ProdusComandaPret = p.Pret
+            FROM dbo.ProdusComanda pc
+            JOIN dbo.Produs p ON p.ProdusId = pc.ProdusId
+        ');
+    END
+    """,
+    """
+    IF COL_LENGTH('dbo.ProdusLivrare', 'ProdusLivrarePret') IS NULL
+    BEGIN
+        ALTER TABLE dbo.ProdusLivrare ADD ProdusLivrarePret DECIMAL(18, 2) NULL, ProdusLivrareCost DECIMAL(18, 2) NULL;
+        EXEC('
+            UPDATE pl
+            SET ProdusLivrarePret = p.Pret, ProdusLivrareCost = p.Cost
+            FROM dbo.ProdusLivrare pl
+            JOIN dbo.Produs p ON p.ProdusId = pl.ProdusId
+        ');
+    END
+    """,
+    # totalul fiecărei comenzi (fără reducerea de loialitate) și totalurile fiecărei livrări,
+    # scrise în aceeași tranzacție cu liniile, pentru ca istoricul și rapoartele să nu mai agrege liniile
+    """
+    IF COL_LENGTH('dbo.Comanda', 'ComandaTotal') IS NULL
+    BEGIN
+        ALTER TABLE dbo.Comanda ADD ComandaTotal DECIMAL(18, 2) NULL;
+        EXEC('
+            UPDATE c
+            SET ComandaTotal = ISNULL(t.Total, 0)
+            FROM dbo.Comanda c
+            OUTER APPLY (
+                SELECT SUM(pc.ProdusComandaCantitate * pc.ProdusComandaPret) AS Total
+                FROM dbo.ProdusComanda pc
+                WHERE pc.ComandaId = c.ComandaId
+            ) t
+        ');
+    END
+    """,
+    """
+    IF COL_LENGTH('dbo.Livrare', 'LivrareTotalPret') IS NULL
+    BEGIN
+        ALTER TABLE dbo.Livrare ADD LivrareTotalPret DECIMAL(18, 2) NULL, LivrareTotalCost DECIMAL(18, 2) NULL;
+        EXEC('
+            UPDATE l
+            SET LivrareTotalPret = ISNULL(t.TotalPret, 0), LivrareTotalCost = ISNULL(t.TotalCost, 0)
+            FROM dbo.Livrare l
+            OUTER APPLY (
+                SELECT
+                    SUM(pl.ProdusLivrareCantitate * pl.ProdusLivrarePret) AS TotalPret,
+                    SUM(pl.ProdusLivrareCantitate * pl.ProdusLivrareCost) AS TotalCost
+                FROM dbo.ProdusLivrare pl
+                WHERE pl.LivrareId = l.LivrareId
+            ) t
+        ');
+    END
+    """,
+    # totalurile zilnice folosite de rapoarte (utils.rollups); la creare sunt completate din istoric
+    f"""
+    IF OBJECT_ID('dbo.VanzariZilniceProdus', 'U') IS NULL
+    BEGIN
+        CREATE TABLE dbo.VanzariZilniceProdus (
+            Zi DATE NOT NULL,
+            ProdusId INT NOT NULL
+                REFERENCES dbo.Produs (ProdusId) ON DELETE CASCADE,
+            Cantitate INT NOT NULL,
+            Valoare DECIMAL(18, 2) NOT NULL,
+            CONSTRAINT PK_VanzariZilniceProdus PRIMARY KEY (Zi, ProdusId)
+        );
+        {REBUILD_STATEMENTS['dbo.VanzariZilniceProdus']};
+    END
+    """,
+    f"""
+    IF OBJECT_ID('dbo.VanzariZilniceClient', 'U') IS NULL
+    BEGIN
+        CREATE TABLE dbo.VanzariZilniceClient (
+            Zi DATE NOT NULL,
+            ClientId INT NOT NULL
+                REFERENCES dbo.Client (ClientId) ON DELETE CASCADE,
+            Comenzi INT NOT NULL,
+            Valoare DECIMAL(18, 2) NOT NULL,
+            CONSTRAINT PK_VanzariZilniceClient PRIMARY KEY (Zi, ClientId)
+        );
+        {REBUILD_STATEMENTS['dbo.VanzariZilniceClient']};
+    END
+    """,
+    f"""
+    IF OBJECT_ID('dbo.LivrariZilniceDistribuitor', 'U') IS NULL
+    BEGIN
+        CREATE TABLE dbo.LivrariZilniceDistribuitor (
+            Zi DATE NOT NULL,
+            DistribuitorId INT NOT NULL
+                REFERENCES dbo.Distribuitor (DistribuitorId) ON DELETE CASCADE,
+            Livrari INT NOT NULL,
+            Cantitate INT NOT NULL,
+            CONSTRAINT PK_LivrariZilniceDistribuitor PRIMARY KEY (Zi, DistribuitorId)
+        );
+        {REBUILD_STATEMENTS['dbo.LivrariZilniceDistribuitor']};
+    END
+    """,
+    # tabela din versiunea cu un singur rând pe zi este recreată (și recalculată) cu rânduri pe zi și slot
+    """
+    IF OBJECT_ID('dbo.TotaluriZilnice', 'U') IS NOT NULL AND COL_LENGTH('dbo.TotaluriZilnice', 'Slot') IS NULL
+    DROP TABLE dbo.TotaluriZilnice
+    """,
+    f"""
+    IF OBJECT_ID('dbo.TotaluriZilnice', 'U') IS NULL
+    BEGIN
+        CREATE TABLE dbo.TotaluriZilnice (
+            Zi DATE NOT NULL,
+            Slot TINYINT NOT NULL,
+            Venituri DECIMAL(18, 2) NOT NULL,
+            Cheltuieli DECIMAL(18, 2) NOT NULL,
+            CONSTRAINT PK_TotaluriZilnice PRIMARY KEY (Zi, Slot)
+        );
+        {REBUILD_STATEMENTS['dbo.TotaluriZilnice']};
+    END
+    """,
+]
+
+
+def ensure_schema(pool):
+    with pool.transaction() as conn:
+        cursor = conn.cursor()
+        for statement in SCHEMA_STATEMENTS:
+            cursor.execute(statement)
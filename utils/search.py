@@ -0,0 +1,325 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+
+# index inversat pentru căutarea produselor în magazin, păstrat în memorie
+# fiecare cuvânt (fără diacritice și fără majuscule) indică produsele în care apare, împreună cu o pondere
+# (descrierea produsului contează mai mult decât numele subcategoriei sau al categoriei)
+# ultimul cuvânt din căutare este tratat și ca prefix, pentru ca rezultatele să apară pe măsură ce utilizatorul scrie
+# produsele fiecărui cuvânt sunt păstrate și într-o listă sortată după pondere (apoi după descriere), așa că o pagină
+# de rezultate se obține parcurgând doar începutul listelor, chiar pentru cuvinte care apar în aproape tot catalogul
+# (de exemplu, numele unei categorii); numărul total de rezultate este calculat separat și păstrat până la
+# următoarea modificare a indexului
+
+TOKEN_RE = re.compile(r"\w+")
+
+# un cuvânt găsit doar ca prefix al altui cuvânt contează mai puțin decât o potrivire exactă
+PREFIX_FACTOR = 0.5
+# bonus pentru produsele a căror descriere conține textul căutat exact, în ordinea dată
+PHRASE_BONUS = 2.0
+# câte numere totale de rezultate sunt păstrate (pentru căutările repetate)
+MAX_CACHED_COUNTS = 1024
+
+# variantele cu sedilă (ş, ţ), folosite încă des în locul celor cu virgulă (ș, ț)
+_FOLD_TABLE = str.maketrans({"ş": "s", "Ş": "s", "ţ": "t", "Ţ": "t"})
+
+
+# elimin diacriticele (ă, â, î, ș, ț și celelalte) și majusculele, pentru ca „hrana” să găsească „Hrană”
+def fold(text):
+    text = unicodedata.normalize("NFKD", text.translate(_FOLD_TABLE))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text or ""))
+
+
+# produsele unei liste sortate, în ordinea descrescătoare a scorului, ca tupluri (-scor, descriere, id)
+def _scored(ranked, factor):
+    return ((weight * factor, text, doc_id) for weight, text, doc_id in ranked)
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # cuvânt -> {id produs: pondere}
+        self._postings = {}
+        # cuvânt -> [(-pondere, descrierea normalizată, id produs)], sortată (cele mai relevante produse primele)
+        self._ranked = {}
+        # vocabularul, sortat, pentru potrivirea prefixelor prin căutare binară
+        self._vocabulary = []
+        # id produs -> cuvintele produsului (pentru actualizare și ștergere)
+        self._doc_terms = {}
+        # id produs -> descrierea normalizată (pentru bonusul de frază și ordinea rezultatelor cu același scor)
+        self._doc_text = {}
+        # cuvintele căutate -> numărul total de rezultate; golit la fiecare modificare
+        self._counts = {}
+
+    # construiește un index complet; documents conține tupluri (id, descriere, [(text, pondere), ...])
+    @classmethod
+    def build(cls, documents):
+        index = cls()
+        for doc_id, text, fields in documents:
+            index._add(doc_id, text, fields, keep_sorted=False)
+        index._vocabulary.sort()
+        for ranked in index._ranked.values():
+            ranked.sort()
+        return index
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def _add(self, doc_id, text, fields, keep_sorted=True):
+        terms = {}
+        for field_text, weight in fields:
+            for token in tokenize(field_text):
+                terms[token] = terms.get(token, 0.0) + weight
+        folded = fold(text or "")
+        for token, weight in terms.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._ranked[token] = []
+                if keep_sorted:
+                    bisect.insort(self._vocabulary, token)
+                else:
+                    self._vocabulary.append(token)
+            postings[doc_id] = weight
+            if keep_sorted:
+                bisect.insort(self._ranked[token], (-weight, folded, doc_id))
+            else:
+                self._ranked[token].append((-weight, folded, doc_id))
+        self._doc_terms[doc_id] = tuple(terms)
+        self._doc_text[doc_id] = folded
+        self._counts = {}
+
+    def _remove(self, doc_id):
+        folded = self._doc_text.pop(doc_id, None)
+        for token in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings[token]
+            weight = postings.pop(doc_id, None)
+            ranked = self._ranked[token]
+            entry = (-weight, folded, doc_id)
+            pos = bisect.bisect_left(ranked, entry)
+            if pos < len(ranked) and ranked[pos] == entry:
+                del ranked[pos]
+            if not postings:
+                del self._postings[token]
+                del self._ranked[token]
+                pos = bisect.bisect_left(self._vocabulary, token)
+                if pos < len(self._vocabulary) and self._vocabulary[pos] == token:
+                    del self._vocabulary[pos]
+        self._counts = {}
+
+    # adaugă sau înlocuiește un produs
+    def update(self, doc_id, text, fields):
+        with self._lock:
+            self._remove(doc_id)
+            self._add(doc_id, text, fields)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    # cuvintele din vocabular potrivite de un cuvânt căutat (el însuși și, pentru prefix, toate cuvintele care
+    # încep cu el), fiecare cu factorul ei de scor
+    # cuvintele rare sunt mai relevante decât cele care apar în multe produse (ponderea idf)
+    def _sources(self, term, prefix):
+        total = len(self._doc_terms)
+        sources = []
+        if term in self._postings:
+            sources.append((term, math.log(1 + total / len(self._postings[term]))))
+        if prefix:
+            vocabulary = self._vocabulary
+            position = bisect.bisect_right(vocabulary, term)
+            while position < len(vocabulary) and vocabulary[position].startswith(term):
+                token = vocabulary[position]
+                sources.append((token, math.log(1 + total / len(self._postings[token])) * PREFIX_FACTOR))
+                position += 1
+        return sources
+
+    # numărul produselor care se potrivesc cu toate cuvintele căutate; pentru un singur cuvânt este chiar
+    # lungimea listei lui, altfel este calculat prin operații pe mulțimi și păstrat până la următoarea modificare
+    def _count(self, key, term_sources):
+        if len(term_sources) == 1 and len(term_sources[0]) == 1:
+            return len(self._postings[term_sources[0][0][0]])
+        count = self._counts.get(key)
+        if count is None:
+            matches = None
+            for sources in term_sources:
+                keys = [self._postings[token].keys() for token, _ in sources]
+                docs = set(keys[0]).union(*keys[1:]) if len(keys) > 1 else keys[0]
+                matches = docs if matches is None else matches & docs
+                if not matches:
+                    break
+            count = len(matches)
+            if len(self._counts) >= MAX_CACHED_COUNTS:
+                self._counts = {}
+            self._counts[key] = count
+        return count
+
+    # întoarce (id-urile produselor din pagina cerută, numărul total de rezultate)
+    # un produs apare în rezultate doar dacă se potrivește cu toate cuvintele căutate
+    # produsele sunt parcurse în ordinea scorului pentru cuvântul cu cele mai puține produse; celelalte cuvinte pot
+    # adăuga cel mult ponderea lor maximă (și bonusul de frază), așa că parcurgerea se oprește când niciun produs
+    # rămas nu mai poate intra în pagină
+    def search(self, query, offset=0, limit=24):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return [], 0
+
+        with self._lock:
+            term_sources = []
+            for position, term in enumerate(terms):
+                sources = self._sources(term, prefix=position == len(terms) - 1)
+                if not sources:
+                    return [], 0
+                term_sources.append(sources)
+            total = self._count(tuple(terms), term_sources)
+            if total <= offset:
+                return [], total
+
+            term_sources.sort(key=lambda sources: sum(len(self._postings[token]) for token, _ in sources))
+            driver, others = term_sources[0], [
+                [(self._postings[token], factor) for token, factor in sources] for sources in term_sources[1:]
+            ]
+            others_max = [
+                max(-self._ranked[token][0][0] * factor for token, factor in sources)
+                for sources in term_sources[1:]
+            ]
+            streams = [_scored(self._ranked[token], factor) for token, factor in driver]
+            stream = streams[0] if len(streams) == 1 else heapq.merge(*streams)
+
+            phrase = " ".join(terms)
+            needed = offset + limit
+            # cele mai bune needed rezultate găsite până acum, ca tupluri (-scor, descriere, id), sortate
+            page = []
+            seen = set()
+            for negative_score, text, doc_id in stream:
+                # un produs găsit prin mai multe cuvinte ale prefixului apare întâi cu scorul cel mai mare
+                if len(streams) > 1:
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                score = -negative_score
+                if len(page) == needed:
+                    # scorul maxim al produselor rămase, adunat în aceeași ordine ca scorul unui produs; un produs
+                    # rămas cu exact acest scor are descrierea (și id-ul) cel puțin egale cu ale produsului curent
+                    bound = score
+                    for best in others_max:
+                        bound += best
+                    if page[-1] < (-(bound + PHRASE_BONUS), text, doc_id):
+                        break
+                for sources in others:
+                    best = 0.0
+                    for postings, factor in sources:
+                        weight = postings.get(doc_id)
+                        if weight is not None and weight * factor > best:
+                            best = weight * factor
+                    if not best:
+                        break
+                    score += best
+                else:
+                    if phrase in text:
+                        score += PHRASE_BONUS
+                    entry = (-score, text, doc_id)
+                    if len(page) < needed or entry < page[-1]:
+                        bisect.insort(page, entry)
+                        del page[needed:]
+
+        return [doc_id for _, _, doc_id in page[offset:]], total
+
+
+# sugestii pentru câmpul de căutare din magazin (completarea automată a numelor de produse)
+# numele sunt păstrate într-o listă sortată după forma lor normalizată, în care prefixul căutat este găsit prin
+# căutare binară; pe lângă numele complet, fiecare nume este indexat și de la începutul fiecărui cuvânt,
+# pentru ca „pisici” să sugereze și „Hrana pisici sterilizate”
+class SuggestionIndex:
+    def __init__(self, names):
+        # nume -> numărul de produse cu acest nume (un nume este sugerat o singură dată)
+        self._counts = {}
+        for name in names:
+            self._counts[name] = self._counts.get(name, 0) + 1
+        full = []
+        inner = []
+        for name in self._counts:
+            for key, is_full in self._entries(name):
+                (full if is_full else inner).append((key, name))
+        full.sort()
+        inner.sort()
+        self._full_keys = [key for key, _ in full]
+        self._full_names = [name for _, name in full]
+        self._inner_keys = [key for key, _ in inner]
+        self._inner_names = [name for _, name in inner]
+
+    # cheile sub care este găsit un nume: numele complet și fiecare sufix care începe cu un cuvânt
+    @staticmethod
+    def _entries(name):
+        words = tokenize(name)
+        if not words:
+            return []
+        return [(" ".join(words), True)] + [(" ".join(words[start:]), False) for start in range(1, len(words))]
+
+    # un index nou, cu numele produselor modificate înlocuite; indexul curent nu se schimbă (poate fi citit în paralel)
+    # costul depinde de numărul numelor modificate, nu de construirea din nou a listelor sortate
+    def updated(self, removed, added):
+        index = SuggestionIndex.__new__(SuggestionIndex)
+        index._counts = dict(self._counts)
+        index._full_keys, index._full_names = list(self._full_keys), list(self._full_names)
+        index._inner_keys, index._inner_names = list(self._inner_keys), list(self._inner_names)
+        for name in removed:
+            count = index._counts.get(name, 0)
+            if count > 1:
+                index._counts[name] = count - 1
+            elif count == 1:
+                del index._counts[name]
+                for key, is_full in self._entries(name):
+                    keys, names = index._lists(is_full)
+                    pos = bisect.bisect_left(keys, key)
+                    while pos < len(keys) and keys[pos] == key:
+                        if names[pos] == name:
+                            del keys[pos], names[pos]
+                            break
+                        pos += 1
+        for name in added:
+            count = index._counts.get(name, 0)
+            index._counts[name] = count + 1
+            if count:
+                continue
+            for key, is_full in self._entries(name):
+                keys, names = index._lists(is_full)
+                pos = bisect.bisect_left(keys, key)
+                while pos < len(keys) and keys[pos] == key and names[pos] < name:
+                    pos += 1
+                keys.insert(pos, key)
+                names.insert(pos, name)
+        return index
+
+    def _lists(self, full):
+        if full:
+            return self._full_keys, self._full_names
+        return self._inner_keys, self._inner_names
+
+    def __len__(self):
+        return len(self._full_keys)
+
+    @staticmethod
+    def _scan(keys, names, prefix, limit, found):
+        pos = bisect.bisect_left(keys, prefix)
+        while pos < len(keys) and len(found) < limit and keys[pos].startswith(prefix):
+            found.setdefault(names[pos])
+            pos += 1
+
+    # primele limit nume care încep cu textul dat; mai întâi cele al căror nume complet începe cu el,
+    # apoi cele în care textul apare la începutul unui cuvânt
+    def complete(self, text, limit=10):
+        prefix = " ".join(tokenize(text))
+        if not prefix or limit <= 0:
+            return []
+        found = {}
+        self._scan(self._full_keys, self._full_names, prefix, limit, found)
+        self._scan(self._inner_keys, self._inner_names, prefix, limit, found)
+        return list(found)
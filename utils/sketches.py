@@ -0,0 +1,113 @@
+import hashlib
+import math
+import operator
+from array import array
+
+# structuri de date aproximative pentru fluxuri mari, cu memorie fixă și erori cunoscute
+#   CountMinSketch - estimarea sumei valorilor unei chei (cantități, sume cheltuite)
+#   SpaceSaving    - cheile cu cele mai mari sume (heavy hitters), păstrând cel mult capacity contoare
+#   HyperLogLog    - numărul de chei distincte (de exemplu, clienții care au cumpărat ceva)
+# toate pot fi combinate între ele (de exemplu, câte o structură pe zi, combinate pentru un interval)
+
+
+# două valori de dispersie pe 64 de biți pentru o cheie, stabile între rulări (spre deosebire de hash())
+def _hashes(key):
+    digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+class CountMinSketch:
+    # depth rânduri a câte width contoare; estimarea unei chei este minimul contoarelor ei
+    # pentru valori pozitive, estimarea nu este niciodată mai mică decât suma reală și o depășește
+    # cu cel mult (e / width) * total, cu probabilitatea 1 - e^-depth
+    # valorile negative (de exemplu, comenzi șterse) sunt acceptate, dar atunci eroarea poate fi în ambele sensuri
+    def __init__(self, width=512, depth=4):
+        self.width = width
+        self.depth = depth
+        self.total = 0.0
+        self._rows = [array('d', bytes(8 * width)) for _ in range(depth)]
+
+    def _positions(self, key):
+        first, second = _hashes(key)
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, key, amount=1):
+        for row, position in zip(self._rows, self._positions(key)):
+            row[position] += amount
+        self.total += abs(amount)
+
+    # adaugă valorile altei structuri cu aceleași dimensiuni (de exemplu, pentru a combina mai multe zile)
+    def update(self, other):
+        self._rows = [array('d', map(operator.add, mine, theirs)) for mine, theirs in zip(self._rows, other._rows)]
+        self.total += other.total
+
+    def estimate(self, key):
+        return min(row[position] for row, position in zip(self._rows, self._positions(key)))
+
+    # eroarea maximă (cu probabilitatea de mai sus) a oricărei estimări
+    def error_bound(self):
+        return math.e / self.width * self.total
+
+
+class SpaceSaving:
+    # cel mult capacity chei urmărite; o cheie nouă înlocuiește cheia cu suma cea mai mică și preia suma ei
+    # ca eroare, deci sumele sunt supraestimate cu cel mult total / capacity, iar orice cheie cu o sumă
+    # reală mai mare de total / capacity se află sigur printre cheile urmărite
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.total = 0.0
+        self._counts = {}
+
+    def add(self, key, amount=1):
+        if amount < 0:
+            # scăderile sunt aplicate doar cheilor urmărite (o cheie eliminată nu mai poate fi corectată)
+            if key in self._counts:
+                self._counts[key] += amount
+            return
+        self.total += amount
+        if key in self._counts:
+            self._counts[key] += amount
+        elif len(self._counts) < self.capacity:
+            self._counts[key] = amount
+        else:
+            smallest = min(self._counts, key=self._counts.get)
+            self._counts[key] = self._counts.pop(smallest) + amount
+
+    def keys(self):
+        return list(self._counts)
+
+    def error_bound(self):
+        return self.total / self.capacity
+
+
+class HyperLogLog:
+    # 2^precision registre de câte un octet; eroarea relativă tipică este 1.04 / sqrt(2^precision)
+    # (aproximativ 1.6% pentru precision=12, cu 4 KB de memorie)
+    def __init__(self, precision=12):
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, key):
+        value = _hashes(key)[0]
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    # reuniunea cu alt HyperLogLog de aceeași precizie
+    def update(self, other):
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def count(self):
+        size = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self._registers)
+        zeros = self._registers.count(0)
+        # pentru puține chei, numărarea registrelor goale este mai precisă
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self._registers))
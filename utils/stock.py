@@ -0,0 +1,62 @@
+from utils.bulk import values_batches
+
+# rezervarea stocului la plasarea unei comenzi
+# stocul este scăzut direct în baza de date, doar dacă este suficient (Stoc >= cantitate), în aceeași instrucțiune;
+# astfel două comenzi simultane pentru același produs nu pot vinde mai mult decât există, fără a bloca
+# întregul magazin: fiecare UPDATE blochează doar rândurile produselor din comandă, până la finalul tranzacției
+
+
+class InsufficientStock(Exception):
+    # shortages este {id produs: stocul disponibil}, cu None pentru produsele care nu mai există
+    def __init__(self, shortages):
+        super().__init__("Insufficient stock")
+        self.shortages = shortages
+
+
+# scade stocul produselor din comandă; quantities este {id produs: cantitate}
+# dacă cel puțin un produs nu are stoc suficient, ridică InsufficientStock cu toate produsele problematice,
+# iar apelantul trebuie să anuleze tranzacția (rollback), pentru a reface și scăderile reușite
+# produsele sunt actualizate în ordinea id-urilor, pentru ca două comenzi cu aceleași produse să le blocheze
+# în aceeași ordine (fără deadlock)
+# întoarce prețurile curente ale produselor rezervate, {id produs: preț}, citite din aceleași rânduri blocate
+def reserve_stock(cursor, quantities):
+    rows = sorted(quantities.items())
+    prices = {}
+    for values, params in values_batches(rows, 2):
+        cursor.execute(
+            f"""
+            UPDATE p
+            SET Stoc = p.Stoc - d.Cantitate
+            OUTPUT INSERTED.ProdusId, INSERTED.Pret
+            FROM dbo.Produs p
+            JOIN (VALUES {values}) AS d (ProdusId, Cantitate) ON d.ProdusId = p.ProdusId
+            WHERE p.Stoc >= d.Cantitate
+            """,
+            params
+        )
+        prices.update((row.ProdusId, row.Pret) for row in cursor.fetchall())
+
+    failed = [product_id for product_id in quantities if product_id not in prices]
+    if not failed:
+        return prices
+
+    # pentru raport, citesc stocul actual al produselor care nu au putut fi rezervate
+    placeholders = ",".join("?" for _ in failed)
+    cursor.execute(
+        f"SELECT ProdusId, Stoc FROM dbo.Produs WHERE ProdusId IN ({placeholders})",
+        tuple(failed)
+    )
+    available = {row.ProdusId: int(row.Stoc) if row.Stoc is not None else 0 for row in cursor.fetchall()}
+    raise InsufficientStock({product_id: available.get(product_id) for product_id in failed})
+
+
+# mesajul afișat utilizatorului; names este {id produs: nume}
+def shortage_message(shortages, names):
+    parts = []
+    for product_id, available in shortages.items():
+        name = names.get(product_id) or f"#{product_id}"
+        if available is None:
+            parts.append(f"'{name}' (no longer available)")
+        else:
+            parts.append(f"'{name}' (available: {available})")
+    return "Insufficient stock for " + ", ".join(parts) + "."
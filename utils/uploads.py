@@ -0,0 +1,56 @@
+import hashlib
+
+from pyodbc import Binary
+
+# utilitare pentru încărcarea imaginilor de produs
+# până la rularea rutei, Werkzeug a citit deja tot corpul cererii și a păstrat fișierul într-un fișier temporar
+# (în memorie doar pentru fișiere mici); cererile prea mari sunt respinse înainte de a fi citite, prin
+# MAX_CONTENT_LENGTH, așa că aici fișierul nu mai este copiat: este doar parcurs pe bucăți, pentru dimensiune și hash
+# imaginea nu este trimisă bazei de date pe bucăți: la scriere este citită întreagă în memorie, deci o încărcare
+# ocupă cel mult MAX_IMAGE_BYTES (implicit 5 MB) de memorie, o singură dată, pe lângă fișierul păstrat de Werkzeug
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class Upload:
+    __slots__ = ('file', 'size', 'sha256')
+
+    def __init__(self, file, size, sha256):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+
+    def read(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        self.file.close()
+
+
+# dimensiunea și hash-ul fișierului încărcat, citite direct din fișierul păstrat de Werkzeug
+# limita max_bytes se referă doar la imagine (MAX_CONTENT_LENGTH include și restul formularului)
+def receive_upload(file_storage, max_bytes):
+    stream = file_storage.stream
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge()
+        digest.update(chunk)
+    stream.seek(0)
+    return Upload(stream, size, digest.digest())
+
+
+# scriu imaginea în coloana Imagine printr-un singur UPDATE; hash-ul imaginii (coloana calculată ImagineHash)
+# este astfel calculat o singură dată, nu după fiecare bucată adăugată
+def write_product_image(cursor, product_id, upload):
+    cursor.execute("UPDATE dbo.Produs SET Imagine = ? WHERE ProdusId = ?", (Binary(upload.read()), product_id))